@@ -0,0 +1,379 @@
+"""Re-embed stored memories, for a model change or to repair stale embeddings.
+
+Usage:
+    # Embed everything with a new model into its own column
+    python backfill.py --model text-embedding-3-large --dimensions 1536 --column embedding_3_large
+
+    # Re-embed rows of the live column whose text changed since they were
+    # embedded, e.g. memories stored with the "Empty memory" fallback
+    python backfill.py --changed-only
+
+Memories are walked in keyset batches by id. Each page is streamed from a
+server-side cursor in its own short transaction, and each batch of memories
+and their transcript chunks is embedded with as few multi-input calls as the
+API limits allow. ``--concurrency`` batches are in flight at once, under
+``--tpm``/``--rpm`` budgets, with exponential backoff on rate limits and
+server errors. Progress is checkpointed in the embedding_backfills table, so
+an interrupted job resumes where it stopped; ``--restart`` starts over.
+
+A versioned column (anything but ``embedding``) is added to omi_memories and
+omi_memory_chunks if missing, so the old and new vectors coexist and search
+keeps using the old ones until the cut-over described in the README.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, List, Optional, Set
+from uuid import UUID
+
+import openai
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import bindparam, column, delete, func, insert, select, table, text, update
+
+from chunking import chunk_transcript, estimate_tokens
+from database import AsyncSessionLocal
+from embedding_queue import EMBEDDING_READY
+from embeddings import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL, build_embedding_text, content_hash, embed_texts
+from models import MemoryDB, MemoryChunkDB, MemoryPayloadDB
+from queries import join_payloads
+
+logger = logging.getLogger(__name__)
+
+LIVE_COLUMN = "embedding"
+COLUMN_NAME = re.compile(r"^embedding(_[a-z0-9_]+)?$")
+
+# Errors worth retrying; anything else stops the job at its last checkpoint
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+class RateLimiter:
+    """Token bucket refilled at ``per_minute``; ``acquire`` waits until the amount fits."""
+
+    def __init__(
+        self,
+        per_minute: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], asyncio.Future] = asyncio.sleep,
+    ):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.available = per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+
+    async def acquire(self, amount: float = 1.0):
+        # A single request larger than the whole budget still goes through
+        amount = min(amount, self.capacity)
+        while True:
+            now = self.clock()
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.available >= amount:
+                self.available -= amount
+                return
+            await self.sleep((amount - self.available) / self.rate)
+
+class Checkpoint:
+    """Last id below which every batch is written, although batches finish out of order."""
+
+    def __init__(self, last_id: Optional[UUID] = None):
+        self.last_id = last_id
+        self._started: Deque[UUID] = deque()
+        self._finished: Set[UUID] = set()
+
+    def start(self, batch_last_id: UUID):
+        self._started.append(batch_last_id)
+
+    def finish(self, batch_last_id: UUID) -> bool:
+        """Mark a batch written; True when the checkpoint moved forward."""
+        self._finished.add(batch_last_id)
+        moved = False
+        while self._started and self._started[0] in self._finished:
+            self.last_id = self._started.popleft()
+            self._finished.discard(self.last_id)
+            moved = True
+        return moved
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "unknown"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+class Backfill:
+    def __init__(self, args):
+        self.args = args
+        self.job = args.job or f"{args.column}:{args.model}:{args.dimensions or 'native'}"
+        self.in_place = args.column == LIVE_COLUMN
+        vector_type = Vector(args.dimensions or 1536)
+        self.memories = table("omi_memories", column("id"), column(args.column, vector_type))
+        self.chunks = table("omi_memory_chunks", column("id"), column(args.column, vector_type))
+        self.tokens = RateLimiter(args.tpm) if args.tpm else None
+        self.requests = RateLimiter(args.rpm) if args.rpm else None
+        self.checkpoint = Checkpoint()
+        self.processed = 0
+        self.resumed_from = 0
+        self.skipped = 0
+        self.remaining: Optional[int] = None
+        self.started = time.monotonic()
+        self.error: Optional[BaseException] = None
+
+    async def prepare(self):
+        async with AsyncSessionLocal() as db:
+            await db.execute(text(
+                "CREATE TABLE IF NOT EXISTS embedding_backfills ("
+                "job VARCHAR PRIMARY KEY, last_id UUID, processed BIGINT NOT NULL DEFAULT 0, "
+                "updated_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            ))
+            if not self.in_place:
+                for name in ("omi_memories", "omi_memory_chunks"):
+                    await db.execute(text(
+                        f"ALTER TABLE {name} ADD COLUMN IF NOT EXISTS {self.args.column} "
+                        f"vector({self.args.dimensions or 1536})"
+                    ))
+            if self.args.restart:
+                await db.execute(text("DELETE FROM embedding_backfills WHERE job = :job"), {"job": self.job})
+            row = (await db.execute(
+                text("SELECT last_id, processed FROM embedding_backfills WHERE job = :job"), {"job": self.job}
+            )).first()
+            if row:
+                self.checkpoint = Checkpoint(row.last_id)
+                self.processed = row.processed
+                logger.info(f"Resuming {self.job} after {row.last_id} ({row.processed} memories done)")
+            self.remaining = (await db.execute(
+                self.candidates(select(func.count()).select_from(MemoryDB), self.checkpoint.last_id)
+            )).scalar_one()
+            await db.commit()
+        logger.info(f"{self.job}: {self.remaining} memories to go")
+
+    def candidates(self, query, after: Optional[UUID]):
+        if after is not None:
+            query = query.where(MemoryDB.id > after)
+        if self.args.user_id:
+            query = query.where(MemoryDB.user_id == self.args.user_id)
+        if not self.in_place and not self.args.all:
+            # Rows a previous run already filled are left alone
+            query = query.where(column(self.args.column).is_(None))
+        return query
+
+    async def pages(self) -> AsyncIterator[list]:
+        """Batches in id order; each page comes from a server-side cursor in a short transaction."""
+        after = self.checkpoint.last_id
+        while True:
+            query = self.candidates(join_payloads(select(
+                MemoryDB.id, MemoryDB.user_id, MemoryDB.structured,
+                MemoryPayloadDB.transcript_segments, MemoryDB.content_hash
+            )), after).order_by(MemoryDB.id).limit(self.args.page_size)
+            rows = 0
+            async with AsyncSessionLocal() as db:
+                result = await db.stream(query.execution_options(yield_per=self.args.batch_size))
+                async for batch in result.partitions():
+                    rows += len(batch)
+                    after = batch[-1].id
+                    yield batch
+            if rows < self.args.page_size:
+                return
+
+    async def embed(self, texts: List[str]) -> List[list]:
+        tokens = sum(estimate_tokens(text) for text in texts)
+        for attempt in range(self.args.max_retries + 1):
+            if self.tokens:
+                await self.tokens.acquire(tokens)
+            if self.requests:
+                await self.requests.acquire()
+            try:
+                return await embed_texts(texts, self.args.model, self.args.dimensions)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.args.max_retries:
+                    raise
+                delay = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning(f"Embedding call failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def stored_chunks(self, memory_ids: List[UUID]) -> dict:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(MemoryChunkDB.id, MemoryChunkDB.memory_id, MemoryChunkDB.text)
+                .where(MemoryChunkDB.memory_id.in_(memory_ids))
+                .order_by(MemoryChunkDB.memory_id, MemoryChunkDB.chunk_index)
+            )
+            chunks = {}
+            for row in result.all():
+                chunks.setdefault(row.memory_id, []).append(row)
+            return chunks
+
+    async def process(self, batch: list):
+        if self.in_place:
+            await self.process_in_place(batch)
+        else:
+            await self.process_versioned(batch)
+
+    async def process_in_place(self, batch: list):
+        """Re-embed the live columns and rebuild the chunks, as the ingest path would."""
+        plans = []
+        for row in batch:
+            memory_text = build_embedding_text(row.structured, row.transcript_segments)
+            chunks = [
+                dict(chunk, memory_id=row.id, user_id=row.user_id)
+                for chunk in chunk_transcript(row.transcript_segments or [])
+            ]
+            texts = [memory_text] + [chunk["text"] for chunk in chunks]
+            digest = content_hash(texts, self.args.model, self.args.dimensions)
+            if self.args.changed_only and digest == row.content_hash:
+                self.skipped += 1
+                continue
+            plans.append((row, texts, chunks, digest))
+        if not plans:
+            return
+
+        vectors = await self.embed([text for _, texts, _, _ in plans for text in texts])
+        memories = MemoryDB.__table__
+        async with AsyncSessionLocal() as db:
+            offset = 0
+            for row, texts, chunks, digest in plans:
+                vectors_of_row = vectors[offset:offset + len(texts)]
+                offset += len(texts)
+                # Only while the row still holds the text that was embedded; a
+                # redelivery meanwhile is left to its own queued job
+                matched = (await db.execute(
+                    update(memories).where(
+                        memories.c.id == row.id, memories.c.content_hash.is_not_distinct_from(row.content_hash)
+                    ).values(
+                        embedding=vectors_of_row[0], embedding_status=EMBEDDING_READY, content_hash=digest,
+                        embedding_attempts=0, embedding_retry_at=None
+                    ).returning(memories.c.id)
+                )).first()
+                if matched is None:
+                    self.skipped += 1
+                    continue
+                await db.execute(delete(MemoryChunkDB).where(MemoryChunkDB.memory_id == row.id))
+                if chunks:
+                    await db.execute(
+                        insert(MemoryChunkDB),
+                        [dict(chunk, embedding=vector) for chunk, vector in zip(chunks, vectors_of_row[1:])]
+                    )
+            await db.commit()
+
+    async def process_versioned(self, batch: list):
+        """Fill the versioned column of the memories and of their stored chunks."""
+        chunks = await self.stored_chunks([row.id for row in batch])
+        texts, targets = [], []
+        for row in batch:
+            texts.append(build_embedding_text(row.structured, row.transcript_segments))
+            targets.append((self.memories, row.id))
+            for chunk in chunks.get(row.id, []):
+                texts.append(chunk.text)
+                targets.append((self.chunks, chunk.id))
+
+        vectors = await self.embed(texts)
+        updates = {self.memories.name: [], self.chunks.name: []}
+        for (target, target_id), vector in zip(targets, vectors):
+            updates[target.name].append({"target_id": target_id, "vector": vector})
+
+        async with AsyncSessionLocal() as db:
+            for target in (self.memories, self.chunks):
+                if updates[target.name]:
+                    await db.execute(
+                        update(target).where(target.c.id == bindparam("target_id"))
+                        .values({self.args.column: bindparam("vector")}),
+                        updates[target.name]
+                    )
+            await db.commit()
+
+    async def save_checkpoint(self):
+        async with AsyncSessionLocal() as db:
+            await db.execute(text(
+                "INSERT INTO embedding_backfills (job, last_id, processed, updated_at) "
+                "VALUES (:job, :last_id, :processed, now()) "
+                "ON CONFLICT (job) DO UPDATE SET last_id = excluded.last_id, "
+                "processed = excluded.processed, updated_at = excluded.updated_at"
+            ), {"job": self.job, "last_id": self.checkpoint.last_id, "processed": self.processed})
+            await db.commit()
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        done = self.processed - self.resumed_from
+        rate = done / elapsed if elapsed else 0.0
+        left = max((self.remaining or 0) - done, 0)
+        logger.info(
+            f"{self.job}: {done}/{self.remaining} memories ({self.skipped} unchanged), "
+            f"{rate:.1f}/s, ETA {format_eta(left / rate if rate else None)}"
+        )
+
+    async def reporter(self):
+        while True:
+            await asyncio.sleep(self.args.report_every)
+            self.report()
+
+    async def worker(self, queue: asyncio.Queue):
+        while True:
+            batch = await queue.get()
+            try:
+                if batch is None:
+                    return
+                # After a failure the queue is only drained; nothing past the
+                # failed batch gets checkpointed
+                if self.error is None:
+                    await self.process(batch)
+                    self.processed += len(batch)
+                    if self.checkpoint.finish(batch[-1].id):
+                        await self.save_checkpoint()
+            except Exception as e:
+                logger.error(f"Batch ending at {batch[-1].id} failed: {e}", exc_info=True)
+                self.error = e
+            finally:
+                queue.task_done()
+
+    async def run(self):
+        await self.prepare()
+        self.resumed_from = self.processed
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.args.concurrency * 2)
+        workers = [asyncio.create_task(self.worker(queue)) for _ in range(self.args.concurrency)]
+        reporter = asyncio.create_task(self.reporter())
+        try:
+            async for batch in self.pages():
+                if self.error is not None:
+                    break
+                self.checkpoint.start(batch[-1].id)
+                await queue.put(batch)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            reporter.cancel()
+            for task in workers:
+                task.cancel()
+        self.report()
+        if self.error is not None:
+            raise SystemExit(f"{self.job} stopped; rerun to resume from the last checkpoint")
+        logger.info(f"{self.job}: done")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Re-embed stored memories and their transcript chunks")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS, help="Requested output size (text-embedding-3-*)")
+    parser.add_argument("--column", default=LIVE_COLUMN, help="Target column; anything but 'embedding' is created as a versioned column")
+    parser.add_argument("--changed-only", action="store_true", help="In place: skip memories whose content hash is current")
+    parser.add_argument("--all", action="store_true", help="Versioned: also re-embed rows that already have a vector")
+    parser.add_argument("--user-id", help="Only this user's memories")
+    parser.add_argument("--batch-size", type=int, default=100, help="Memories per embedding batch")
+    parser.add_argument("--page-size", type=int, default=5000, help="Memories per server-side cursor transaction")
+    parser.add_argument("--concurrency", type=int, default=4, help="Batches embedded at once")
+    parser.add_argument("--tpm", type=int, default=0, help="Token budget per minute (0 for no limit)")
+    parser.add_argument("--rpm", type=int, default=0, help="Request budget per minute (0 for no limit)")
+    parser.add_argument("--max-retries", type=int, default=8)
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between progress lines")
+    parser.add_argument("--job", help="Checkpoint name (defaults to column, model and dimensions)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the beginning")
+    args = parser.parse_args()
+    if not COLUMN_NAME.match(args.column):
+        parser.error("--column must be 'embedding' or start with 'embedding_' (lowercase letters, digits, _)")
+    if args.changed_only and args.column != LIVE_COLUMN:
+        parser.error("--changed-only applies to the live 'embedding' column")
+    asyncio.run(Backfill(args).run())
@@ -0,0 +1,265 @@
+"""Offline benchmark of the ingest and search hot paths.
+
+Usage:
+    PGVECTOR_URL=postgresql://localhost/omi_bench python bench.py --migrate \\
+        --users 10 --memories 200 --segments 40 --concurrency 16 --requests 500 \\
+        --output bench.json
+
+Runs the app in-process against a local Postgres with pgvector. OpenAI is
+replaced by a deterministic hashed bag-of-words embedding, so runs are
+reproducible and free. The seeded data is the same for the same ``--seed``.
+The benchmark seeds users × memories × transcript segments, then drives each
+endpoint with ``--concurrency`` concurrent clients. It reports throughput and
+p50/p95/p99 latency per endpoint as JSON, so runs can be diffed.
+Pass ``--base-url`` to drive a running server instead. That server then
+uses whatever embedding backend it is configured with.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import platform
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+
+import httpx
+import numpy as np
+from sqlalchemy import delete, insert
+
+import embeddings
+import main
+import queries
+from database import AsyncSessionLocal
+from embedding_queue import EMBEDDING_READY
+from models import MemoryDB, MemoryChunkDB, MemoryPayloadDB
+
+BENCH_USER_PREFIX = "bench-user-"
+
+WORDS = (
+    "meeting project deadline budget coffee lunch doctor appointment flight hotel "
+    "birthday gift family weekend hiking movie book podcast interview design review "
+    "launch customer feedback invoice contract travel train concert recipe dinner "
+    "garden workout running sleep music guitar lesson school homework exam grocery "
+    "election policy debate news weather storm holiday museum painting camera phone"
+).split()
+
+def fake_embedding(text: str, dimensions: int = 1536) -> List[float]:
+    """Deterministic stand-in: signed feature hashing of the words, L2 normalized.
+
+    Texts sharing words land close together, so search results are meaningful.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in text.lower().split():
+        digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+def install_fake_embeddings(latency: float = 0.0):
+    """Route every embedding call in the app to fake_embedding."""
+    async def generate_embedding(text):
+        if latency:
+            await asyncio.sleep(latency)
+        return fake_embedding(text)
+
+    async def generate_embeddings(texts, model=None, dimensions=None):
+        if latency:
+            await asyncio.sleep(latency)
+        return [fake_embedding(text) for text in texts]
+
+    embeddings.generate_embedding = generate_embedding
+    embeddings.generate_embeddings = generate_embeddings
+    main.generate_embedding = generate_embedding
+    main.generate_embeddings = generate_embeddings
+    main.query_cache.embed = generate_embedding
+    main.query_cache.embed_many = generate_embeddings
+
+def random_memory(rng: random.Random, segments: int, created_at: datetime) -> dict:
+    def words(count):
+        return " ".join(rng.choice(WORDS) for _ in range(count))
+
+    transcript = []
+    for i in range(segments):
+        transcript.append({
+            "text": words(rng.randint(8, 30)),
+            "speaker": f"SPEAKER_0{i % 2}",
+            "speaker_id": i % 2,
+            "is_user": i % 2 == 0,
+            "start": i * 5.0,
+            "end": i * 5.0 + 4.5,
+        })
+    return {
+        "created_at": created_at.isoformat(),
+        "structured": {"title": words(4).title(), "overview": words(25), "category": "other"},
+        "transcript_segments": transcript,
+        "status": "completed",
+    }
+
+async def seed(args, rng: random.Random) -> Dict[str, List[str]]:
+    """Replace earlier bench data with users × memories, embedded inline."""
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(MemoryDB).where(MemoryDB.user_id.startswith(BENCH_USER_PREFIX)))
+        await db.commit()
+
+    memory_ids: Dict[str, List[str]] = {}
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for u in range(args.users):
+        user_id = f"{BENCH_USER_PREFIX}{u}"
+        rows, payload_rows, chunk_rows = [], [], []
+        for m in range(args.memories):
+            memory = main.Memory(**random_memory(rng, args.segments, start + timedelta(minutes=m)))
+            memory_data = main.prepare_memory(memory)
+            memory_id = uuid.uuid4()
+            job = main.embedding_job(memory_id, user_id, memory_data["structured"], memory_data["transcript_segments"])
+            search = queries.search_params(memory_data)
+            memory_data, payload = queries.split_payload(memory_data)
+            payload_rows.append(dict(payload, memory_id=memory_id))
+            rows.append({
+                "id": memory_id,
+                "user_id": user_id,
+                "embedding": fake_embedding(job["text"]),
+                "embedding_status": EMBEDDING_READY,
+                "content_hash": job["content_hash"],
+                **memory_data,
+                **search
+            })
+            chunk_rows.extend(dict(chunk, embedding=fake_embedding(chunk["text"])) for chunk in job["chunks"])
+        async with AsyncSessionLocal() as db:
+            await db.execute(queries.insert_memories(), rows)
+            await db.execute(insert(MemoryPayloadDB), payload_rows)
+            if chunk_rows:
+                await db.execute(insert(MemoryChunkDB), chunk_rows)
+            await db.commit()
+        memory_ids[user_id] = [str(row["id"]) for row in rows]
+    return memory_ids
+
+async def drive(client: httpx.AsyncClient, make_request: Callable, total: int, concurrency: int) -> dict:
+    """Issue ``total`` requests from ``concurrency`` workers and summarize latencies."""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, kwargs = make_request(i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+    }
+
+def scenarios(args, memory_ids: Dict[str, List[str]], rng: random.Random) -> Dict[str, Callable]:
+    users = list(memory_ids)
+    # Pre-draw the request parameters so every run sends the same sequence
+    picks = [(rng.choice(users), " ".join(rng.sample(WORDS, 2))) for _ in range(args.requests)]
+    memories = [random_memory(rng, args.segments, datetime.now(timezone.utc)) for _ in range(min(args.requests, 200))]
+    batches = [[" ".join(rng.sample(WORDS, 2)) for _ in range(args.batch_queries)] for _ in range(args.requests)]
+
+    def memory_created(i):
+        return "POST", "/memory-created", {"params": {"uid": picks[i][0]}, "json": memories[i % len(memories)]}
+
+    def list_memories(i):
+        return "GET", "/memories/", {"params": {"user_id": picks[i][0], "limit": args.limit}}
+
+    def search(i):
+        user_id, query = picks[i]
+        return "GET", "/memories/search", {"params": {"user_id": user_id, "query": query, "limit": args.limit, "mode": args.mode}}
+
+    def batch_search(i):
+        return "POST", "/memories/search/batch", {
+            "params": {"user_id": picks[i][0]}, "json": {"queries": batches[i], "limit": args.limit}
+        }
+
+    def detail(i):
+        user_id = picks[i][0]
+        memory_id = memory_ids[user_id][i % len(memory_ids[user_id])]
+        return "GET", f"/memories/{memory_id}", {"params": {"user_id": user_id}}
+
+    return {
+        "POST /memory-created": memory_created,
+        "GET /memories/": list_memories,
+        "GET /memories/search": search,
+        "POST /memories/search/batch": batch_search,
+        "GET /memories/{memory_id}": detail,
+    }
+
+async def run(args):
+    rng = random.Random(args.seed)
+    install_fake_embeddings(args.embed_latency_ms / 1000)
+    if args.migrate:
+        import migrations
+        migrations.upgrade()
+
+    memory_ids = await seed(args, rng)
+
+    if args.base_url:
+        transport, base_url = None, args.base_url
+    else:
+        transport, base_url = httpx.ASGITransport(app=main.app), "http://bench"
+
+    results = {}
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60) as client:
+            for name, make_request in scenarios(args, memory_ids, rng).items():
+                if args.endpoints and name not in args.endpoints:
+                    continue
+                # Warm up connections and caches before measuring
+                await drive(client, make_request, min(args.warmup, args.requests), args.concurrency)
+                results[name] = await drive(client, make_request, args.requests, args.concurrency)
+
+    report = {
+        "config": {
+            key: getattr(args, key)
+            for key in ("users", "memories", "segments", "requests", "concurrency", "limit", "batch_queries", "mode", "seed", "embed_latency_ms")
+        },
+        "environment": {"python": platform.python_version(), "vector_storage": queries.VECTOR_STORAGE},
+        "endpoints": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest and search against a local Postgres")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--memories", type=int, default=200, help="Memories seeded per user")
+    parser.add_argument("--segments", type=int, default=40, help="Transcript segments per memory")
+    parser.add_argument("--requests", type=int, default=300, help="Measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=10, help="Page size for list and search")
+    parser.add_argument("--batch-queries", type=int, default=10, help="Queries per batch search request")
+    parser.add_argument("--mode", choices=["vector", "hybrid", "lexical"], default="vector")
+    parser.add_argument("--endpoints", nargs="*", help="Only run these, e.g. 'GET /memories/search'")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Simulated embedding API latency")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--base-url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--migrate", action="store_true", help="Apply migrations before seeding")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    asyncio.run(run(parser.parse_args()))
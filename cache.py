@@ -0,0 +1,331 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import orjson
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """In-process LRU cache bounded by entry count and approximate bytes, with a TTL."""
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, size = entry
+        if expires_at <= self.clock():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, size: int):
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (self.clock() + self.ttl, value, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+class RedisBackend:
+    """Shared cache tier so several workers can reuse each other's entries."""
+
+    def __init__(self, url: str, prefix: str = "omiapi:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("The shared cache backend requires the 'redis' package") from e
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(self.prefix + key)
+
+def normalize_query(query: str) -> str:
+    """Case-fold and collapse whitespace so equivalent queries share a cache entry."""
+    return " ".join(query.casefold().split())
+
+class QueryEmbeddingCache:
+    """Cache of search query text to embedding vector in front of ``embed``.
+
+    Vectors are kept as read-only float32 arrays. Hits are credited with the
+    running average latency of a miss so the saved time can be reported.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[str], Awaitable[List[float]]],
+        model: str,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 3600.0,
+        backend: Optional[RedisBackend] = None,
+        embed_many: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]] = None,
+    ):
+        self.embed = embed
+        self.embed_many = embed_many
+        self.model = model
+        self.local = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+        self.backend = backend
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.avg_miss_latency = 0.0
+        self.saved_latency = 0.0
+
+    def key(self, query: str) -> str:
+        return f"query-embedding:{self.model}:{normalize_query(query)}"
+
+    async def _lookup(self, key: str) -> Optional[np.ndarray]:
+        vector = self.local.get(key)
+        if vector is not None:
+            self._record_hit()
+            return vector
+
+        if self.backend is not None:
+            try:
+                raw = await self.backend.get(key)
+            except Exception as e:
+                logger.warning(f"Shared query cache lookup failed: {e}")
+                raw = None
+            if raw is not None:
+                vector = np.frombuffer(raw, dtype=np.float32)
+                self.local.set(key, vector, vector.nbytes + len(key))
+                self.shared_hits += 1
+                self._record_hit()
+                return vector
+        return None
+
+    async def _store(self, key: str, embedding: List[float], latency: float) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector.setflags(write=False)
+        self._record_miss(latency)
+
+        self.local.set(key, vector, vector.nbytes + len(key))
+        if self.backend is not None:
+            try:
+                await self.backend.set(key, vector.tobytes(), self.local.ttl)
+            except Exception as e:
+                logger.warning(f"Shared query cache store failed: {e}")
+        return vector
+
+    async def get_embedding(self, query: str) -> np.ndarray:
+        key = self.key(query)
+        vector = await self._lookup(key)
+        if vector is not None:
+            return vector
+
+        started = time.perf_counter()
+        embedding = await self.embed(normalize_query(query))
+        return await self._store(key, embedding, time.perf_counter() - started)
+
+    async def get_embeddings(self, queries: List[str]) -> List[np.ndarray]:
+        """Embeddings for several queries; all misses share one ``embed_many`` call."""
+        vectors: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+        for text in dict.fromkeys(normalize_query(query) for query in queries):
+            vector = await self._lookup(self.key(text))
+            if vector is None:
+                missing.append(text)
+            else:
+                vectors[text] = vector
+
+        if missing:
+            started = time.perf_counter()
+            if self.embed_many is not None:
+                embeddings = await self.embed_many(missing)
+            else:
+                embeddings = await asyncio.gather(*(self.embed(text) for text in missing))
+            latency = time.perf_counter() - started
+            for text, embedding in zip(missing, embeddings):
+                vectors[text] = await self._store(self.key(text), embedding, latency)
+        return [vectors[normalize_query(query)] for query in queries]
+
+    def _record_hit(self):
+        self.hits += 1
+        self.saved_latency += self.avg_miss_latency
+
+    def _record_miss(self, latency: float):
+        self.misses += 1
+        # Running mean of the embedding round trip a hit avoids
+        self.avg_miss_latency += (latency - self.avg_miss_latency) / self.misses
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model,
+            "entries": len(self.local),
+            "bytes": self.local.bytes,
+            "evictions": self.local.evictions,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_miss_latency_ms": self.avg_miss_latency * 1000,
+            "saved_latency_s": self.saved_latency,
+            "shared_backend": self.backend is not None,
+        }
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+class ResponseCache:
+    """Read-through cache of encoded responses, invalidated per user.
+
+    Keys embed a per-user generation that writes bump, so every cached
+    response of that user becomes unreachable at once and ages out of the
+    LRU. With a shared backend the generation lives there too, so a write
+    on one worker invalidates all of them; without one, other workers can
+    serve a stale response for up to ``ttl`` seconds.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 60.0,
+        backend: Optional[RedisBackend] = None,
+    ):
+        self.local = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+        self.backend = backend
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.local.max_entries > 0
+
+    async def generation(self, user_id: str) -> Optional[str]:
+        if self.backend is not None:
+            try:
+                value = await self.backend.get(f"generation:{user_id}")
+                return value.decode() if value else "0"
+            except Exception as e:
+                # Without the shared generation a local entry could be stale
+                logger.warning(f"Shared response cache generation lookup failed: {e}")
+                return None
+        return str(self._generations.get(user_id, 0))
+
+    async def key(self, user_id: str, endpoint: str, params: Iterable[Tuple[str, str]]) -> Optional[str]:
+        """Cache key for a request, or None when the response must not be cached."""
+        if not self.enabled:
+            return None
+        generation = await self.generation(user_id)
+        if generation is None:
+            return None
+        query = "&".join(f"{name}={value}" for name, value in sorted(params))
+        return f"response:{user_id}:{generation}:{endpoint}?{query}"
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        cached = self.local.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        if self.backend is not None:
+            try:
+                raw = await self.backend.get(key)
+            except Exception as e:
+                logger.warning(f"Shared response cache lookup failed: {e}")
+                raw = None
+            if raw is not None:
+                value = orjson.loads(raw)
+                cached = CachedResponse(value["body"].encode(), value["etag"], value["headers"])
+                self.local.set(key, cached, len(cached.body) + len(key))
+                self.shared_hits += 1
+                self.hits += 1
+                return cached
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, body: bytes, headers: Dict[str, str]) -> CachedResponse:
+        cached = CachedResponse(body, make_etag(body), dict(headers))
+        self.local.set(key, cached, len(body) + len(key))
+        if self.backend is not None:
+            try:
+                raw = orjson.dumps({"body": body.decode(), "etag": cached.etag, "headers": cached.headers})
+                await self.backend.set(key, raw, self.local.ttl)
+            except Exception as e:
+                logger.warning(f"Shared response cache store failed: {e}")
+        return cached
+
+    async def invalidate(self, user_id: str):
+        """Drop every cached response of a user; call after their writes commit."""
+        self.invalidations += 1
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        if self.backend is not None:
+            try:
+                await self.backend.incr(f"generation:{user_id}")
+            except Exception as e:
+                logger.warning(f"Shared response cache invalidation failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.local),
+            "bytes": self.local.bytes,
+            "evictions": self.local.evictions,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "shared_backend": self.backend is not None,
+        }
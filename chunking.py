@@ -0,0 +1,78 @@
+import os
+from typing import Any, Dict, List, Tuple
+
+# Model input limit for text-embedding-3-small
+MAX_INPUT_TOKENS = 8191
+
+# Transcript windows embedded for chunk-level search
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-bound token estimate (about 3 UTF-8 bytes per token)."""
+    return len(text.encode("utf-8")) // 3 + 1
+
+def truncate_for_embedding(text: str, max_tokens: int = MAX_INPUT_TOKENS) -> str:
+    """Cut text so it stays inside the model's input limit."""
+    encoded = text.encode("utf-8")
+    max_bytes = (max_tokens - 1) * 3
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode("utf-8", errors="ignore")
+
+def transcript_windows(
+    segments: List[Dict[str, Any]],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS
+) -> List[Tuple[int, int]]:
+    """``(start, end)`` slices of ``segments`` covered by each transcript window.
+
+    Windows are built greedily from the first segment, so every window but
+    the last is final, and chunking ``segments[start:]`` of the last window
+    yields the same windows as chunking the whole list.
+    """
+    windows = []
+    window_start, window_tokens = 0, 0
+
+    for index, seg in enumerate(segments):
+        tokens = estimate_tokens(seg["text"])
+        if index > window_start and window_tokens + tokens > max_tokens:
+            windows.append((window_start, index))
+            # Carry the tail of the previous window over as overlap
+            overlap_start, overlap_size = index, 0
+            while overlap_start > window_start:
+                size = estimate_tokens(segments[overlap_start - 1]["text"])
+                if overlap_size + size > overlap_tokens:
+                    break
+                overlap_start -= 1
+                overlap_size += size
+            window_start, window_tokens = overlap_start, overlap_size
+        window_tokens += tokens
+
+    if len(segments) > window_start:
+        windows.append((window_start, len(segments)))
+    return windows
+
+def chunk_transcript(
+    transcript_segments: List[Dict[str, Any]],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    first_index: int = 0
+) -> List[Dict[str, Any]]:
+    """Split transcript segments into overlapping windows.
+
+    Each window holds whole segments up to ``max_tokens``; the trailing
+    segments of a window, up to ``overlap_tokens``, are repeated at the start
+    of the next one so matches spanning a boundary are not lost. Windows are
+    numbered from ``first_index``.
+    """
+    segments = [seg for seg in transcript_segments or [] if seg.get("text")]
+    return [
+        {
+            "chunk_index": first_index + number,
+            "start": segments[start].get("start"),
+            "end": segments[end - 1].get("end"),
+            "text": truncate_for_embedding(" ".join(seg["text"] for seg in segments[start:end])),
+        }
+        for number, (start, end) in enumerate(transcript_windows(segments, max_tokens, overlap_tokens))
+    ]
@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
@@ -6,10 +8,108 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-# Regular database engine (for omi_data)
-engine = create_engine(os.getenv("DATABASE_URL"))
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+PGVECTOR_URL = os.getenv("PGVECTOR_URL")
 
-# Vector database engine (for omi_memories)
-vector_engine = create_engine(os.getenv("PGVECTOR_URL"))
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=vector_engine)
\ No newline at end of file
+# Connection pool settings for the API's async engine
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Connections opened at startup; 0 leaves the pool to fill on demand
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", "0"))
+
+def async_database_url(url: str):
+    """Point a libpq-style URL at the asyncpg driver."""
+    url = make_url(url)
+    query = dict(url.query)
+    # asyncpg spells libpq's sslmode as ssl
+    if "sslmode" in query:
+        query["ssl"] = query.pop("sslmode")
+    return url.set(drivername="postgresql+asyncpg", query=query)
+
+# Engines are created on first use, so importing this module (and the app)
+# needs neither credentials nor a database round trip
+_vector_engine = None
+_async_engine = None
+
+def _require_url() -> str:
+    if not PGVECTOR_URL:
+        raise RuntimeError("PGVECTOR_URL is not set")
+    return PGVECTOR_URL
+
+def get_vector_engine():
+    """Sync engine for omi_memories, used by migrations, scripts and tests."""
+    global _vector_engine
+    if _vector_engine is None:
+        _vector_engine = create_engine(_require_url(), pool_pre_ping=True)
+    return _vector_engine
+
+def get_async_engine():
+    """Async engine used by the API so queries never block the event loop."""
+    global _async_engine
+    if _async_engine is None:
+        server_settings = {}
+        if DB_STATEMENT_TIMEOUT_MS:
+            server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+        _async_engine = create_async_engine(
+            async_database_url(_require_url()),
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+            connect_args={"server_settings": server_settings},
+        )
+    return _async_engine
+
+class _LazySessionmaker:
+    """Session factory that builds its sessionmaker, and engine, on first call."""
+
+    def __init__(self, make):
+        self._make = make
+        self._factory = None
+
+    def __call__(self, **kwargs):
+        if self._factory is None:
+            self._factory = self._make()
+        return self._factory(**kwargs)
+
+SessionLocal = _LazySessionmaker(
+    lambda: sessionmaker(autocommit=False, autoflush=False, bind=get_vector_engine())
+)
+AsyncSessionLocal = _LazySessionmaker(
+    lambda: async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+)
+
+async def warm_up_pool(connections: int = DB_POOL_WARMUP):
+    """Open pool connections ahead of the first requests."""
+    if connections <= 0:
+        return
+    engine = get_async_engine()
+    opened = [await engine.connect() for _ in range(min(connections, DB_POOL_SIZE))]
+    for connection in opened:
+        await connection.close()
+
+async def dispose_engines():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        AsyncSessionLocal._factory = None
+
+async def get_async_db():
+    """FastAPI dependency yielding an AsyncSession."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def pool_status() -> dict:
+    pool = get_async_engine().pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "timeout": DB_POOL_TIMEOUT,
+    }
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import openai
+
+from chunking import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Worth retrying; rate limits also slow down every other request
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+# Rejections of the input itself; in a coalesced request they are usually
+# caused by one text, so the request is split to isolate it
+INVALID_INPUT_ERRORS = (openai.BadRequestError, openai.UnprocessableEntityError)
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the API asked us to wait, if it said so."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        if "retry-after-ms" in response.headers:
+            return float(response.headers["retry-after-ms"]) / 1000
+        if "retry-after" in response.headers:
+            return float(response.headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+class EmbeddingClient:
+    """Coalesce concurrent embedding calls into multi-input requests.
+
+    Texts requested within ``window`` seconds of each other are sent together,
+    split so no request exceeds ``max_inputs`` texts or ``max_tokens``
+    estimated tokens. Identical texts already in flight share one result.
+    A rate limit pushes back every request, not only the one that hit it, and
+    the shared delay doubles per 429 and halves again per success. A request
+    rejected for its input is bisected until only the offending texts fail.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[List[str]], Awaitable[List[List[float]]]],
+        window: float = 0.005,
+        max_inputs: int = 2048,
+        max_tokens: int = 300000,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.send = send
+        self.window = window
+        self.max_inputs = max_inputs
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pending: List[str] = []
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._backoff = 0.0
+        self._resume_at = 0.0
+        self.calls = 0
+        self.shared = 0
+        self.requests = 0
+        self.inputs = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.failures = 0
+        self.splits = 0
+
+    async def embed(self, text: str) -> List[float]:
+        self.calls += 1
+        future = self._inflight.get(text)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[text] = future
+            self._add(text)
+        else:
+            self.shared += 1
+        # A cancelled caller must not cancel the request others are waiting on
+        return await asyncio.shield(future)
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*(self.embed(text) for text in texts)))
+
+    def _add(self, text: str):
+        tokens = estimate_tokens(text)
+        if self._pending and self._pending_tokens + tokens > self.max_tokens:
+            self._flush()
+        self._pending.append(text)
+        self._pending_tokens += tokens
+        if len(self._pending) >= self.max_inputs:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        texts, self._pending, self._pending_tokens = self._pending, [], 0
+        task = asyncio.create_task(self._send_batch(texts))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send_batch(self, texts: List[str]):
+        try:
+            embeddings = await self._request(texts)
+        except INVALID_INPUT_ERRORS as e:
+            if len(texts) == 1:
+                self._fail(texts, e)
+                return
+            self.splits += 1
+            middle = len(texts) // 2
+            logger.warning(f"Embedding request of {len(texts)} inputs rejected ({e.__class__.__name__}), splitting it")
+            await asyncio.gather(self._send_batch(texts[:middle]), self._send_batch(texts[middle:]))
+            return
+        except BaseException as e:
+            self._fail(texts, e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+        for text, embedding in zip(texts, embeddings):
+            future = self._inflight.pop(text)
+            if not future.done():
+                future.set_result(embedding)
+
+    def _fail(self, texts: List[str], error: BaseException):
+        self.failures += 1
+        for text in texts:
+            future = self._inflight.pop(text)
+            if not future.done():
+                future.set_exception(error)
+
+    async def _request(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            wait = self._resume_at - self.clock()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.requests += 1
+            self.inputs += len(texts)
+            try:
+                embeddings = await self.send(texts)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                if isinstance(e, openai.RateLimitError):
+                    self.rate_limited += 1
+                self._backoff = min(self.max_delay, max(self.base_delay, self._backoff * 2))
+                delay = max(retry_after(e) or 0.0, self._backoff * random.uniform(0.5, 1.0))
+                self._resume_at = max(self._resume_at, self.clock() + delay)
+                logger.warning(f"Embedding request of {len(texts)} inputs failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                continue
+            self._backoff = self._backoff / 2 if self._backoff > self.base_delay else 0.0
+            return embeddings
+
+    async def drain(self):
+        """Send whatever is waiting for the window and wait for all requests in flight."""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "requests": self.requests,
+            "inputs": self.inputs,
+            "avg_inputs_per_request": self.inputs / self.requests if self.requests else 0.0,
+            "pending": len(self._pending),
+            "in_flight": len(self._inflight),
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "failures": self.failures,
+            "splits": self.splits,
+            "backoff_s": self._backoff,
+        }
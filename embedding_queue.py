@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import random
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_PENDING = "pending"
+EMBEDDING_READY = "ready"
+EMBEDDING_FAILED = "failed"
+
+class EmbeddingQueue:
+    """In-process worker pool that fills memory embeddings off the request path.
+
+    ``embed`` turns a job payload into a result; ``store`` persists the
+    outcome as ``store(memory_id, payload, result, status)`` where
+    ``result`` is ``None`` once retries are exhausted. The payload lets
+    ``store`` tell whether the job is still current for the memory.
+    ``claim(memory_id, payload)``, if given, runs when a worker takes a job
+    and returns False for jobs that are no longer needed, e.g. a copy of a
+    job whose memory another worker has embedded meanwhile.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[Any], Awaitable[Any]],
+        store: Callable[[Any, Any, Optional[Any], str], Awaitable[None]],
+        workers: int = 4,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        maxsize: int = 10000,
+        claim: Optional[Callable[[Any, Any], Awaitable[bool]]] = None,
+    ):
+        self.embed = embed
+        self.store = store
+        self.claim = claim
+        self.workers = workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks: List[asyncio.Task] = []
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self.skipped = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._queue.maxsize
+
+    @property
+    def room(self) -> int:
+        """Jobs that can be enqueued before the queue is full."""
+        return self._queue.maxsize - self._queue.qsize()
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"embedding-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Started {self.workers} embedding workers")
+
+    async def stop(self):
+        # Unfinished jobs stay "pending" in the database and the embedding sweep requeues them
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, memory_id: Any, payload: Any) -> bool:
+        """Schedule a memory for embedding. Returns False if the queue is full."""
+        try:
+            self._queue.put_nowait((memory_id, payload))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Embedding queue full, memory {memory_id} left pending")
+            return False
+
+    async def join(self):
+        """Wait until every queued job has been processed."""
+        await self._queue.join()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "in_flight": self.in_flight,
+            "workers": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+        }
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _worker(self):
+        while True:
+            memory_id, payload = await self._queue.get()
+            self.in_flight += 1
+            try:
+                await self._process(memory_id, payload)
+            except Exception as e:
+                logger.error(f"Error storing embedding for memory {memory_id}: {e}", exc_info=True)
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    async def _process(self, memory_id: Any, payload: Any):
+        if self.claim is not None and not await self.claim(memory_id, payload):
+            self.skipped += 1
+            return
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await self.embed(payload)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Giving up embedding memory {memory_id}: {e}")
+                    self.failed += 1
+                    await self.store(memory_id, payload, None, EMBEDDING_FAILED)
+                    return
+                self.retries += 1
+                delay = self._backoff(attempt)
+                logger.warning(f"Embedding memory {memory_id} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            await self.store(memory_id, payload, result, EMBEDDING_READY)
+            self.completed += 1
+            return
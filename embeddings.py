@@ -0,0 +1,146 @@
+from openai import AsyncOpenAI, NOT_GIVEN
+from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import os
+from chunking import estimate_tokens, truncate_for_embedding
+from embedding_client import EmbeddingClient
+from metrics import record_embedding_usage
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Output size requested from models that support shortening (text-embedding-3-*);
+# unset keeps the model's native size. The embedding columns are vector(1536).
+EMBEDDING_DIMENSIONS = int(os.environ["EMBEDDING_DIMENSIONS"]) if os.getenv("EMBEDDING_DIMENSIONS") else None
+
+# Embeddings API request limits
+MAX_BATCH_INPUTS = 2048
+MAX_BATCH_TOKENS = 300000
+
+# Concurrent embedding calls within this many milliseconds share one request
+EMBEDDING_COALESCE_MS = float(os.getenv("EMBEDDING_COALESCE_MS", "5"))
+EMBEDDING_API_MAX_RETRIES = int(os.getenv("EMBEDDING_API_MAX_RETRIES", "5"))
+
+# Async client so embedding calls never block the event loop; created on
+# first use so importing the app needs no API key
+_client: Optional[AsyncOpenAI] = None
+
+def get_client() -> AsyncOpenAI:
+    global _client
+    if _client is None:
+        # Retries are left to the EmbeddingClient so rate limits back off globally
+        _client = AsyncOpenAI(max_retries=0)
+    return _client
+
+async def close_client():
+    global _client
+    await embedding_client.drain()
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+async def request_embeddings(
+    texts: List[str],
+    model: str = EMBEDDING_MODEL,
+    dimensions: Optional[int] = EMBEDDING_DIMENSIONS
+) -> List[list[float]]:
+    """One multi-input embeddings API request."""
+    response = await get_client().embeddings.create(
+        model=model,
+        input=texts,
+        dimensions=dimensions or NOT_GIVEN
+    )
+    record_embedding_usage(model, response.usage)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+embedding_client = EmbeddingClient(
+    send=lambda texts: request_embeddings(texts),
+    window=EMBEDDING_COALESCE_MS / 1000,
+    max_inputs=MAX_BATCH_INPUTS,
+    max_tokens=MAX_BATCH_TOKENS,
+    max_retries=EMBEDDING_API_MAX_RETRIES,
+)
+
+async def generate_embedding(text: str) -> list[float]:
+    """Generate embedding for the given text using OpenAI's API."""
+    return await embedding_client.embed(text)
+
+async def generate_embeddings(
+    texts: List[str],
+    model: str = EMBEDDING_MODEL,
+    dimensions: Optional[int] = EMBEDDING_DIMENSIONS
+) -> List[list[float]]:
+    """Embed several texts; with the configured model they join coalesced requests."""
+    if model == EMBEDDING_MODEL and dimensions == EMBEDDING_DIMENSIONS:
+        return await embedding_client.embed_many(texts)
+    return await request_embeddings(texts, model, dimensions)
+
+def batch_texts(
+    texts: List[str],
+    max_inputs: int = MAX_BATCH_INPUTS,
+    max_tokens: int = MAX_BATCH_TOKENS
+) -> List[List[int]]:
+    """Group text indexes into as few requests as the per-request limits allow."""
+    batches = []
+    current, current_tokens = [], 0
+    for index, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_inputs or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+async def embed_texts(
+    texts: List[str],
+    model: str = EMBEDDING_MODEL,
+    dimensions: Optional[int] = EMBEDDING_DIMENSIONS
+) -> List[list[float]]:
+    """Embed any number of texts using as few requests as the API limits allow."""
+    batches = batch_texts(texts)
+    results = await asyncio.gather(
+        *(generate_embeddings([texts[i] for i in batch], model, dimensions) for batch in batches)
+    )
+    embeddings: List[Optional[list[float]]] = [None] * len(texts)
+    for batch, result in zip(batches, results):
+        for index, embedding in zip(batch, result):
+            embeddings[index] = embedding
+    return embeddings
+
+def build_embedding_text(
+    structured: Optional[Dict[str, Any]],
+    transcript_segments: Optional[List[Dict[str, Any]]]
+) -> str:
+    """Join title, overview and transcript text into the string that gets embedded."""
+    text_parts = []
+
+    if structured:
+        if structured.get("title"):
+            text_parts.append(structured["title"])
+        if structured.get("overview"):
+            text_parts.append(structured["overview"])
+
+    if transcript_segments:
+        text_parts.extend(seg["text"] for seg in transcript_segments if seg.get("text"))
+
+    text_to_embed = " ".join(text_parts)
+    if not text_to_embed.strip():
+        text_to_embed = "Empty memory"  # Fallback for empty content
+    # Long conversations are covered by transcript chunks; keep the
+    # memory-level text inside the model's input limit
+    return truncate_for_embedding(text_to_embed)
+
+def content_hash(texts: List[str], model: str = EMBEDDING_MODEL, dimensions: Optional[int] = EMBEDDING_DIMENSIONS) -> str:
+    """Fingerprint of everything embedded for a memory, tied to the embedding model.
+
+    An update whose hash matches the stored one can keep its embeddings.
+    """
+    digest = hashlib.sha256(model.encode())
+    if dimensions:
+        digest.update(f":{dimensions}".encode())
+    for text in texts:
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
@@ -1,22 +1,345 @@
-from fastapi import FastAPI, HTTPException, Request, Depends, Query
-from sqlalchemy.orm import Session
-from database import SessionLocal, engine, vector_engine
-from models import MemoryDB, Base
-from pydantic_models import Memory
+from fastapi import FastAPI, HTTPException, Header, Request, Depends, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, get_async_db, pool_status, warm_up_pool, dispose_engines
+from models import MemoryDB, MemoryChunkDB, MemoryPayloadDB
+from pydantic_models import (
+    Memory, TranscriptSegment, MemorySummary, MemoryDetail, SearchResult, BatchSearchRequest, BatchSearchResult,
+    RelatedMemory, NearDuplicates
+)
+from embeddings import (
+    generate_embedding, generate_embeddings, embed_texts, batch_texts, build_embedding_text, content_hash,
+    close_client, embedding_client, EMBEDDING_MODEL
+)
+from chunking import chunk_transcript, truncate_for_embedding
+from queries import (
+    SUMMARY_COLUMNS, DETAIL_COLUMNS, vector_search, rescore_memories, batch_vector_search, related_memories, lexical_search, hybrid_search,
+    claim_due_embeddings, insert_memories, upsert_memories, upsert_payloads, split_payload, search_params, join_payloads, existing_memories,
+    memory_filters, scan_settings
+)
+from cache import CachedResponse, QueryEmbeddingCache, RedisBackend, ResponseCache, make_etag, normalize_query
+from pagination import (
+    InvalidCursor, NEXT_CURSOR_HEADER, encode_memory_cursor, decode_memory_cursor,
+    search_fingerprint, encode_search_cursor, decode_search_cursor
+)
+from embedding_queue import EmbeddingQueue, EMBEDDING_FAILED, EMBEDDING_PENDING, EMBEDDING_READY
+from realtime import TranscriptSessionStore, parse_segments
+from vector_cache import VectorCache
+from metrics import METRICS_CONTENT_TYPE, TimingMiddleware, render as render_metrics, stage
+from responses import (
+    NDJSON_MEDIA_TYPE, STREAM_BATCH_SIZE, wants_ndjson, json_response, ndjson_response, conditional_response
+)
+import asyncio
 import logging
-from typing import Optional
-from datetime import datetime
-from sqlalchemy import and_, desc
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, delete, desc, func, insert, select, text, tuple_, update
 from fastapi.staticfiles import StaticFiles
-from openai import OpenAI
-import numpy as np
 from uuid import UUID
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Create all tables with vector engine
-Base.metadata.create_all(bind=vector_engine)
+def embedding_job(memory_id, user_id, structured, transcript_segments) -> dict:
+    """Everything needed to embed a memory and its transcript chunks."""
+    text = build_embedding_text(structured, transcript_segments)
+    chunks = [
+        dict(chunk, memory_id=memory_id, user_id=user_id)
+        for chunk in chunk_transcript(transcript_segments)
+    ]
+    return {
+        "user_id": user_id,
+        "text": text,
+        "chunks": chunks,
+        "content_hash": content_hash([text] + [chunk["text"] for chunk in chunks]),
+    }
+
+def needs_embedding(previous, job: dict) -> bool:
+    """Whether an ingested memory must be queued, given its stored row (None if new).
+
+    A redelivery with unchanged text is only skipped when its stored
+    embedding is ready; one still pending or failed is embedded again.
+    """
+    if previous is None or previous.content_hash != job["content_hash"]:
+        return True
+    return previous.embedding_status not in (EMBEDDING_READY, None)
+
+def assign_memory_id(job: dict, memory_id) -> dict:
+    """Point a job's chunks at the memory row an upsert resolved to."""
+    return dict(job, chunks=[dict(chunk, memory_id=memory_id) for chunk in job["chunks"]])
+
+async def embed_memory(job: dict) -> dict:
+    embeddings = await embed_texts([job["text"]] + [chunk["text"] for chunk in job["chunks"]])
+    return {
+        "user_id": job["user_id"],
+        "embedding": embeddings[0],
+        "chunks": [dict(chunk, embedding=embedding) for chunk, embedding in zip(job["chunks"], embeddings[1:])],
+    }
+
+def embedding_outcome(result, status) -> dict:
+    """Column values recording the outcome of a queued embedding job."""
+    if result is not None:
+        return {
+            "embedding": result["embedding"], "embedding_status": status,
+            "embedding_attempts": 0, "embedding_retry_at": None,
+        }
+    # The sweep retries failed memories, waiting longer after every failure
+    backoff = func.least(EMBEDDING_RETRY_MAX_DELAY, EMBEDDING_RETRY_BASE_DELAY * func.power(2, MemoryDB.embedding_attempts))
+    return {
+        "embedding": None,
+        "embedding_status": status,
+        "embedding_attempts": MemoryDB.embedding_attempts + 1,
+        "embedding_retry_at": func.now() + func.make_interval(0, 0, 0, 0, 0, 0, backoff),
+    }
+
+async def claim_embedding(memory_id, job) -> bool:
+    """Hold a memory for the worker starting its job; False when the job is no longer needed.
+
+    Pushing ``embedding_retry_at`` forward keeps the sweep from queueing the
+    memory again while it is embedded. A memory that is ready (another copy
+    of the job ran first) or holds newer content is skipped.
+    """
+    async with AsyncSessionLocal() as db:
+        claimed = (await db.execute(
+            update(MemoryDB).where(
+                MemoryDB.id == memory_id,
+                MemoryDB.content_hash.is_not_distinct_from(job["content_hash"]),
+                MemoryDB.embedding_status.in_((EMBEDDING_PENDING, EMBEDDING_FAILED)),
+            ).values(embedding_retry_at=sweep_after()).returning(MemoryDB.id)
+        )).first()
+        await db.commit()
+    return claimed is not None
+
+async def store_embedding(memory_id, job, result, status):
+    async with AsyncSessionLocal() as db:
+        # Only a job for the memory's current content may write: one queued
+        # before a redelivery changed the text must not overwrite the newer vectors
+        stored = await db.execute(
+            update(MemoryDB)
+            .where(MemoryDB.id == memory_id, MemoryDB.content_hash.is_not_distinct_from(job["content_hash"]))
+            .values(**embedding_outcome(result, status))
+        )
+        if stored.rowcount == 0:
+            logger.info(f"Memory {memory_id} changed since it was queued, dropping its stale embedding")
+            return
+        if result is not None:
+            await db.execute(delete(MemoryChunkDB).where(MemoryChunkDB.memory_id == memory_id))
+            if result["chunks"]:
+                await db.execute(insert(MemoryChunkDB), result["chunks"])
+        await db.commit()
+    if result is not None:
+        cache_vectors(result["user_id"], memory_id, result["embedding"], result["chunks"])
+
+async def load_user_vectors(user_id: str, limit: int):
+    """Every memory and chunk embedding of a user, for the vector cache."""
+    async with AsyncSessionLocal() as db:
+        memories = (await db.execute(
+            select(MemoryDB.id, MemoryDB.embedding)
+            .where(MemoryDB.user_id == user_id, MemoryDB.embedding.isnot(None))
+            .limit(limit)
+        )).all()
+        chunks = (await db.execute(
+            select(MemoryChunkDB.memory_id, MemoryChunkDB.start, MemoryChunkDB.end, MemoryChunkDB.embedding)
+            .where(MemoryChunkDB.user_id == user_id, MemoryChunkDB.embedding.isnot(None))
+            .limit(limit)
+        )).all()
+    return [tuple(row) for row in memories], [tuple(row) for row in chunks]
+
+vector_cache = VectorCache(
+    load=load_user_vectors,
+    max_bytes=int(os.getenv("VECTOR_CACHE_MAX_BYTES", "0")),
+    max_rows=int(os.getenv("VECTOR_CACHE_MAX_ROWS", "20000")),
+    hot_after=int(os.getenv("VECTOR_CACHE_HOT_SEARCHES", "3")),
+    ttl=float(os.getenv("VECTOR_CACHE_TTL", "300")),
+)
+
+def cache_vectors(user_id, memory_id, embedding, chunk_rows):
+    """Keep a cached user's vectors in step with what was just stored."""
+    vector_cache.upsert(
+        user_id, memory_id, embedding,
+        [(chunk["start"], chunk["end"], chunk["embedding"]) for chunk in chunk_rows]
+    )
+
+# Periodic sweep that queues memories whose embedding is overdue or failed
+EMBEDDING_SWEEP_INTERVAL = float(os.getenv("EMBEDDING_SWEEP_INTERVAL", "60"))
+# Seconds a queued memory is left to the queue before the sweep may queue it again
+EMBEDDING_SWEEP_GRACE = float(os.getenv("EMBEDDING_SWEEP_GRACE", "300"))
+EMBEDDING_RETRY_MAX_ATTEMPTS = int(os.getenv("EMBEDDING_RETRY_MAX_ATTEMPTS", "8"))
+EMBEDDING_RETRY_BASE_DELAY = float(os.getenv("EMBEDDING_RETRY_BASE_DELAY", "60"))
+EMBEDDING_RETRY_MAX_DELAY = float(os.getenv("EMBEDDING_RETRY_MAX_DELAY", "86400"))
+# Advisory lock key that makes one worker process the sweep leader
+EMBEDDING_SWEEP_LOCK = 0x6F6D6901
+
+embedding_queue = EmbeddingQueue(
+    embed=embed_memory,
+    store=store_embedding,
+    workers=int(os.getenv("EMBEDDING_WORKERS", "4")),
+    max_retries=int(os.getenv("EMBEDDING_MAX_RETRIES", "5")),
+    maxsize=int(os.getenv("EMBEDDING_QUEUE_SIZE", "10000")),
+    claim=claim_embedding,
+)
+
+query_cache = QueryEmbeddingCache(
+    embed=generate_embedding,
+    embed_many=generate_embeddings,
+    model=EMBEDDING_MODEL,
+    max_entries=int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "10000")),
+    max_bytes=int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+    backend=RedisBackend(os.environ["QUERY_CACHE_REDIS_URL"]) if os.getenv("QUERY_CACHE_REDIS_URL") else None,
+)
+
+def response_cache_entries(max_entries: int, shared: bool, local_ok: bool) -> int:
+    """Entries the response cache may hold; 0 when it could serve other workers' stale responses."""
+    if max_entries > 0 and not shared and not local_ok:
+        # A write only invalidates the cache of the process that handled it,
+        # so without a shared backend only a single-process deployment may opt in
+        logger.info("Response cache disabled: set RESPONSE_CACHE_REDIS_URL, or RESPONSE_CACHE_LOCAL_OK=1 for one process")
+        return 0
+    return max_entries
+
+response_cache = ResponseCache(
+    max_entries=response_cache_entries(
+        int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000")),
+        shared=bool(os.getenv("RESPONSE_CACHE_REDIS_URL")),
+        local_ok=os.getenv("RESPONSE_CACHE_LOCAL_OK", "0") == "1",
+    ),
+    max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "60")),
+    backend=RedisBackend(os.environ["RESPONSE_CACHE_REDIS_URL"]) if os.getenv("RESPONSE_CACHE_REDIS_URL") else None,
+)
+
+async def cached_response(cache_key: Optional[str], content, headers: Optional[dict] = None) -> CachedResponse:
+    """Encode a response body once, storing it when the request is cacheable."""
+    body = json_response(content).body
+    if cache_key is None:
+        return CachedResponse(body, make_etag(body), dict(headers or {}))
+    return await response_cache.set(cache_key, body, headers or {})
+
+def sweep_after() -> datetime:
+    """embedding_retry_at of a memory just queued: the sweep leaves it to the queue until then."""
+    return datetime.now(timezone.utc) + timedelta(seconds=EMBEDDING_SWEEP_GRACE)
+
+async def requeue_due() -> int:
+    """Queue memories whose embedding is due, as far as the queue has room.
+
+    This covers memories left pending by a stopped worker or a full queue,
+    and failed ones whose retry backoff has passed. Only the worker process
+    holding the sweep's advisory lock claims rows, so they are queued once.
+    """
+    room = embedding_queue.room
+    if room <= 0:
+        return 0
+    async with AsyncSessionLocal() as db:
+        leader = (await db.execute(
+            select(func.pg_try_advisory_xact_lock(EMBEDDING_SWEEP_LOCK))
+        )).scalar()
+        if not leader:
+            return 0
+        due = (await db.execute(
+            claim_due_embeddings(room, EMBEDDING_RETRY_MAX_ATTEMPTS, EMBEDDING_SWEEP_GRACE)
+        )).all()
+        transcripts = {}
+        if due:
+            transcripts = dict((await db.execute(
+                select(MemoryPayloadDB.memory_id, MemoryPayloadDB.transcript_segments)
+                .where(MemoryPayloadDB.memory_id.in_([row.id for row in due]))
+            )).all())
+        await db.commit()
+    for row in due:
+        # Keyed to the stored hash, which is what the row holds now even if
+        # the chunking settings changed since it was written
+        job = embedding_job(row.id, row.user_id, row.structured, transcripts.get(row.id))
+        embedding_queue.enqueue(row.id, dict(job, content_hash=row.content_hash))
+    if due:
+        logger.info(f"Requeued {len(due)} memories for embedding")
+    return len(due)
+
+async def sweep_embeddings():
+    """Requeue due memories every EMBEDDING_SWEEP_INTERVAL seconds, backing off while sweeps fail."""
+    delay = EMBEDDING_SWEEP_INTERVAL
+    while True:
+        try:
+            await requeue_due()
+            delay = EMBEDDING_SWEEP_INTERVAL
+        except Exception as e:
+            delay = min(delay * 2, EMBEDDING_SWEEP_INTERVAL * 16)
+            logger.warning(f"Embedding sweep failed, next one in {delay:.0f}s: {e}")
+        await asyncio.sleep(delay)
+
+async def finalize_session(user_id, session_id, segments, windows):
+    """Store a finished realtime session as a memory, reusing window embeddings."""
+    memory_id = uuid.uuid4()
+    memory_text = build_embedding_text(None, segments)
+    chunks = [dict(chunk, memory_id=memory_id, user_id=user_id) for chunk, _ in windows]
+    missing = [index for index, (_, embedding) in enumerate(windows) if embedding is None]
+    memory_hash = content_hash([memory_text] + [chunk["text"] for chunk in chunks])
+
+    embedding, status = None, EMBEDDING_PENDING
+    chunk_rows = []
+    try:
+        vectors = await embed_texts([memory_text] + [chunks[index]["text"] for index in missing])
+        embedding, status = vectors[0], EMBEDDING_READY
+        chunk_embeddings = [window_embedding for _, window_embedding in windows]
+        for index, vector in zip(missing, vectors[1:]):
+            chunk_embeddings[index] = vector
+        chunk_rows = [dict(chunk, embedding=vector) for chunk, vector in zip(chunks, chunk_embeddings)]
+    except Exception as e:
+        logger.warning(f"Embedding realtime session {session_id} failed, queueing it: {e}")
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert_memories().values(
+            id=memory_id,
+            user_id=user_id,
+            created_at=datetime.now(timezone.utc),
+            status="completed",
+            embedding=embedding,
+            embedding_status=status,
+            embedding_retry_at=sweep_after() if status == EMBEDDING_PENDING else None,
+            content_hash=memory_hash
+        ), search_params({"transcript_segments": segments}))
+        await db.execute(insert(MemoryPayloadDB), {"memory_id": memory_id, "transcript_segments": segments})
+        if chunk_rows:
+            await db.execute(insert(MemoryChunkDB), chunk_rows)
+        await db.commit()
+    await response_cache.invalidate(user_id)
+    if status == EMBEDDING_READY:
+        cache_vectors(user_id, memory_id, embedding, chunk_rows)
+
+    if status == EMBEDDING_PENDING:
+        embedding_queue.enqueue(memory_id, embedding_job(memory_id, user_id, None, segments))
+    logger.info(f"Stored realtime session {session_id} as memory {memory_id} ({len(segments)} segments)")
+    return memory_id
+
+realtime_sessions = TranscriptSessionStore(
+    embed_texts=embed_texts,
+    finalize=finalize_session,
+    max_segments=int(os.getenv("REALTIME_MAX_SEGMENTS", "5000")),
+    max_bytes=int(os.getenv("REALTIME_MAX_BYTES", str(1024 * 1024))),
+    max_sessions=int(os.getenv("REALTIME_MAX_SESSIONS", "1000")),
+    idle_timeout=float(os.getenv("REALTIME_IDLE_TIMEOUT", "120")),
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The schema is managed by `python migrations.py upgrade`, not at startup
+    await warm_up_pool()
+    await embedding_queue.start()
+    # The first sweep picks up memories left pending by a previous process
+    sweep = asyncio.create_task(sweep_embeddings(), name="embedding-sweep")
+    await realtime_sessions.start()
+    yield
+    # Finalize open sessions while the embedding queue can still take retries
+    await realtime_sessions.stop()
+    sweep.cancel()
+    await asyncio.gather(sweep, return_exceptions=True)
+    await embedding_queue.stop()
+    await vector_cache.close()
+    await close_client()
+    await dispose_engines()
 
 app = FastAPI(
     title="Memory Management API",
@@ -24,188 +347,694 @@ app = FastAPI(
     version="1.0.0",
     servers=[
         {"url": "https://omi.ella-ai-care.com/", "description": "Production server"}
-    ]
+    ],
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+app.add_middleware(TimingMiddleware)
+
 # Mount the static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Largest number of memories accepted by one /memories/batch request
+INGEST_BATCH_MAX = int(os.getenv("INGEST_BATCH_MAX", "1000"))
+# Largest number of queries accepted by one /memories/search/batch request
+SEARCH_BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", "20"))
+# Search queries are cut to this many tokens before they are embedded
+QUERY_MAX_TOKENS = int(os.getenv("QUERY_MAX_TOKENS", "1024"))
+# Most recent memories checked by one /memories/near-duplicates request
+NEAR_DUPLICATES_MAX = int(os.getenv("NEAR_DUPLICATES_MAX", "200"))
 
-client = OpenAI()
+def search_text(query: str) -> str:
+    """A search query fit to embed: rejected when blank, cut to QUERY_MAX_TOKENS."""
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="query must not be empty")
+    return truncate_for_embedding(query, QUERY_MAX_TOKENS)
 
-async def generate_embedding(text: str) -> list[float]:
-    """Generate embedding for the given text using OpenAI's API."""
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return response.data[0].embedding
+def prepare_memory(memory: Memory) -> dict:
+    """Return the column values for a new memory row."""
+    memory_data = memory.model_dump()
+    if memory_data["created_at"] is None:
+        memory_data["created_at"] = datetime.now(timezone.utc)
+    return memory_data
 
 @app.post("/memory-created")
 async def handle_memory_created(
     request: Request,
     uid: str = Query(..., description="User ID associated with the memory"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         # Parse JSON body into Memory model
-        data = await request.json()
-        memory = Memory(**data)
+        with stage("validate"):
+            data = await request.json()
+            memory = Memory(**data)
         
         logger.info(f"Received memory with events structure: {memory.structured.events if memory.structured else 'No structured data'}")
         
-        # Generate embedding from the memory content
-        text_parts = []
-        
-        if memory.structured:
-            if memory.structured.title:
-                text_parts.append(memory.structured.title)
-            if memory.structured.overview:
-                text_parts.append(memory.structured.overview)
-        
-        if memory.transcript_segments:
-            transcript_texts = [seg.text for seg in memory.transcript_segments if seg.text]
-            text_parts.extend(transcript_texts)
-        
-        text_to_embed = " ".join(text_parts)
-        if not text_to_embed.strip():
-            text_to_embed = "Empty memory"  # Fallback for empty content
-            
-        embedding = await generate_embedding(text_to_embed)
-        
-        # Insert into the database with embedding
-        memory_db = MemoryDB(
-            user_id=uid,
-            embedding=embedding,
-            **memory.model_dump()
-        )
-        db.add(memory_db)
-        db.commit()
-        db.refresh(memory_db)
+        memory_data = prepare_memory(memory)
+        job = embedding_job(None, uid, memory_data["structured"], memory_data["transcript_segments"])
+
+        # A retried delivery updates the row it created before; the stored
+        # embedding is kept when the embedded text has not changed and it is ready
+        existing = None
+        with stage("db"):
+            if memory.processing_memory_id is not None:
+                existing = (await db.execute(existing_memories(uid, [memory.processing_memory_id]))).first()
+                if existing:
+                    memory_data["created_at"] = existing.created_at
+
+            # Write right away; the embedding queue fills in the vector later
+            search = search_params(memory_data)
+            memory_data, payload = split_payload(memory_data)
+            result = await db.execute(
+                upsert_memories().values(
+                    id=uuid.uuid4(),
+                    user_id=uid,
+                    embedding=None,
+                    embedding_status=EMBEDDING_PENDING,
+                    embedding_retry_at=sweep_after(),
+                    content_hash=job["content_hash"],
+                    **memory_data
+                ).returning(MemoryDB.id),
+                search
+            )
+            memory_id = result.scalar_one()
+            await db.execute(upsert_payloads().values(dict(payload, memory_id=memory_id)))
+            stale = needs_embedding(existing, job)
+            if stale:
+                # The memory is pending again; chunks of its earlier text must not match searches
+                await db.execute(delete(MemoryChunkDB).where(MemoryChunkDB.memory_id == memory_id))
+            await db.commit()
+        await response_cache.invalidate(uid)
+
+        if stale:
+            # The stored vectors are stale until the queue re-embeds the memory
+            vector_cache.discard(uid, memory_id)
+            embedding_queue.enqueue(memory_id, assign_memory_id(job, memory_id))
+        else:
+            logger.info(f"Memory {memory_id} content unchanged, keeping its embedding")
 
-        return {"status": "success", "memory_id": str(memory_db.id)}
+        return {"status": "success", "memory_id": str(memory_id)}
     except Exception as e:
         logger.error(f"Error processing /memory-created: {e}", exc_info=True)
         raise HTTPException(status_code=400, detail=str(e))
 
+async def embed_batch(texts: List[str]) -> List[Optional[list[float]]]:
+    """Embed texts in as few requests as the API limits allow.
+
+    Entries of a request that fails come back as None so the caller can
+    hand them to the embedding queue instead of failing the whole batch.
+    """
+    embeddings: List[Optional[list[float]]] = [None] * len(texts)
+    batches = batch_texts(texts)
+    results = await asyncio.gather(
+        *(generate_embeddings([texts[i] for i in batch]) for batch in batches),
+        return_exceptions=True
+    )
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Batch embedding of {len(batch)} memories failed, queueing them: {result}")
+            continue
+        for index, embedding in zip(batch, result):
+            embeddings[index] = embedding
+    return embeddings
+
+@app.post("/memories/batch")
+async def handle_memories_batch(
+    request: Request,
+    uid: str = Query(..., description="User ID associated with the memories"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Ingest a backlog of memories with batched embedding and one bulk insert."""
+    try:
+        data = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid request payload")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of memories")
+    if len(data) > INGEST_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {INGEST_BATCH_MAX} memories per batch")
+
+    # Validate items individually so one bad memory doesn't reject the batch
+    results = []
+    entries = {}
+    for index, item in enumerate(data):
+        try:
+            memory = Memory(**item)
+        except Exception as e:
+            results.append({"index": index, "error": str(e)})
+            continue
+        memory_data = prepare_memory(memory)
+        job = embedding_job(None, uid, memory_data["structured"], memory_data["transcript_segments"])
+        # A processing_memory_id repeated within the batch resolves to its last delivery
+        key = memory.processing_memory_id or index
+        entries.pop(key, None)
+        entries[key] = {"data": memory_data, "job": job, "indexes": []}
+        results.append({"index": index, "key": key})
+    for result in results:
+        if "key" in result:
+            entries[result["key"]]["indexes"].append(result["index"])
+    entries = list(entries.values())
+
+    try:
+        # Redeliveries keep their row id, and their ready embedding if the text is unchanged
+        processing_ids = [e["data"]["processing_memory_id"] for e in entries if e["data"]["processing_memory_id"]]
+        existing = {}
+        if processing_ids:
+            existing = {
+                row.processing_memory_id: row
+                for row in (await db.execute(existing_memories(uid, processing_ids))).all()
+            }
+        rows, payloads, to_embed = [], [], []
+        for entry in entries:
+            previous = existing.get(entry["data"]["processing_memory_id"])
+            memory_id = previous.id if previous else uuid.uuid4()
+            if previous:
+                entry["data"]["created_at"] = previous.created_at
+            entry["job"] = assign_memory_id(entry["job"], memory_id)
+            memory_data, payload = split_payload(entry["data"])
+            payloads.append(dict(payload, memory_id=memory_id))
+            rows.append({
+                "id": memory_id,
+                "user_id": uid,
+                "content_hash": entry["job"]["content_hash"],
+                "embedding": None,
+                "embedding_status": EMBEDDING_PENDING,
+                "embedding_retry_at": sweep_after(),
+                **memory_data,
+                **search_params(entry["data"])
+            })
+            if needs_embedding(previous, entry["job"]):
+                to_embed.append((rows[-1], entry["job"]))
+
+        # Memory and chunk texts of every item share the same multi-input requests
+        texts, spans = [], []
+        for _, job in to_embed:
+            start = len(texts)
+            texts.append(job["text"])
+            texts.extend(chunk["text"] for chunk in job["chunks"])
+            spans.append((start, len(texts)))
+
+        with stage("embed"):
+            embeddings = await embed_batch(texts) if texts else []
+        chunk_rows, pending = [], []
+        for (row, job), (start, end) in zip(to_embed, spans):
+            vectors = embeddings[start:end]
+            if all(vector is not None for vector in vectors):
+                row["embedding"] = vectors[0]
+                row["embedding_status"] = EMBEDDING_READY
+                row["embedding_retry_at"] = None
+                chunk_rows.extend(
+                    dict(chunk, embedding=vector) for chunk, vector in zip(job["chunks"], vectors[1:])
+                )
+            else:
+                pending.append((row["id"], job))
+
+        if rows:
+            with stage("db"):
+                await db.execute(upsert_memories(), rows)
+                await db.execute(upsert_payloads(), payloads)
+                if to_embed:
+                    # Re-embedded redeliveries drop the chunks of their earlier
+                    # version, including those left pending or without windows
+                    await db.execute(delete(MemoryChunkDB).where(
+                        MemoryChunkDB.memory_id.in_({row["id"] for row, _ in to_embed})
+                    ))
+                if chunk_rows:
+                    await db.execute(insert(MemoryChunkDB), chunk_rows)
+                await db.commit()
+            await response_cache.invalidate(uid)
+            chunks_by_memory = {}
+            for chunk in chunk_rows:
+                chunks_by_memory.setdefault(chunk["memory_id"], []).append(chunk)
+            for row, _ in to_embed:
+                if row["embedding"] is not None:
+                    cache_vectors(uid, row["id"], row["embedding"], chunks_by_memory.get(row["id"], []))
+                else:
+                    vector_cache.discard(uid, row["id"])
+    except Exception as e:
+        logger.error(f"Error processing /memories/batch: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    for memory_id, job in pending:
+        embedding_queue.enqueue(memory_id, job)
+
+    memory_ids = {index: str(row["id"]) for entry, row in zip(entries, rows) for index in entry["indexes"]}
+    results = [
+        {"index": r["index"], "memory_id": memory_ids[r["index"]]} if "key" in r else r
+        for r in results
+    ]
+    return {"status": "success", "results": results}
+
+@app.get("/embedding-queue")
+async def get_embedding_queue_stats():
+    """Report how deep the background embedding queue is."""
+    return embedding_queue.stats()
+
+@app.get("/embedding-client")
+async def get_embedding_client_stats():
+    """Report how many embedding calls were coalesced into shared API requests."""
+    return embedding_client.stats()
+
+@app.get("/query-cache")
+async def get_query_cache_stats():
+    """Report hit rate and saved latency of the search query embedding cache."""
+    return query_cache.stats()
+
+@app.get("/vector-cache")
+async def get_vector_cache_stats():
+    """Report which hot users' vectors are held in process and how often searches used them."""
+    return vector_cache.stats()
+
+@app.get("/response-cache")
+async def get_response_cache_stats():
+    """Report hit rate and invalidations of the memory list and detail response cache."""
+    return response_cache.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics: latency per route and stage, embedding usage, pool and queue gauges."""
+    return Response(render_metrics(pool_status(), embedding_queue.stats()), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/db-pool")
+async def get_db_pool_stats():
+    """Report connection pool usage of the async database engine."""
+    return pool_status()
+
+@app.get("/realtime-sessions")
+async def get_realtime_session_stats():
+    """Report how many realtime transcript sessions are buffered."""
+    return realtime_sessions.stats()
+
+def validate_segments(segments: list) -> List[dict]:
+    return [TranscriptSegment(**segment).model_dump() for segment in segments]
+
 #https://omi.ella-ai-care.com/realtime-transcript
 @app.post("/realtime-transcript")
-async def handle_realtime_transcript(request: Request):
+async def handle_realtime_transcript(
+    request: Request,
+    uid: str = Query(..., description="User ID associated with the transcript"),
+    session_id: Optional[str] = Query(None, description="Conversation the segments belong to; defaults to the payload's session_id")
+):
+    """Buffer live transcript segments; the session becomes a memory when it ends."""
     try:
-        # Parse the incoming JSON payload
-        data = await request.json()
-        # Log the received data
-        logger.info(f"Received /realtime-transcript data: {data}")
-        # Process the data as needed
-        return {"status": "success", "received_data": data}
+        payload_session_id, segments = parse_segments(await request.json())
+        segments = validate_segments(segments)
     except Exception as e:
         logger.error(f"Error processing /realtime-transcript: {e}")
         raise HTTPException(status_code=400, detail="Invalid request payload")
 
-@app.get("/memories/")
-def get_memories(
+    session_id = session_id or payload_session_id or uid
+    with stage("buffer"):
+        count = await realtime_sessions.add_segments(uid, session_id, segments)
+    logger.debug(f"Buffered {len(segments)} segments for session {session_id} ({count} total)")
+    return {"status": "success", "session_id": session_id, "segments": count}
+
+@app.post("/realtime-transcript/end")
+async def end_realtime_transcript(
+    uid: str = Query(..., description="User ID associated with the transcript"),
+    session_id: Optional[str] = Query(None, description="Conversation to finalize")
+):
+    """Finalize a buffered session into a searchable memory."""
+    try:
+        memory_id = await realtime_sessions.end(uid, session_id or uid)
+    except Exception as e:
+        logger.error(f"Error finalizing realtime session {session_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    if memory_id is None:
+        raise HTTPException(status_code=404, detail="No buffered transcript for this session")
+    return {"status": "success", "memory_id": str(memory_id)}
+
+@app.websocket("/realtime-transcript/ws")
+async def realtime_transcript_ws(
+    websocket: WebSocket,
+    uid: str = Query(..., description="User ID associated with the transcript"),
+    session_id: Optional[str] = Query(None, description="Conversation the segments belong to")
+):
+    """Stream transcript segments; the session is finalized when the socket closes."""
+    session_id = session_id or str(uuid.uuid4())
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                _, segments = parse_segments(await websocket.receive_text())
+                segments = validate_segments(segments)
+            except WebSocketDisconnect:
+                raise
+            except Exception:
+                await websocket.send_json({"status": "error", "detail": "Invalid transcript segments"})
+                continue
+            count = await realtime_sessions.add_segments(uid, session_id, segments)
+            await websocket.send_json({"status": "success", "session_id": session_id, "segments": count})
+    except WebSocketDisconnect:
+        pass
+    try:
+        await realtime_sessions.end(uid, session_id)
+    except Exception as e:
+        logger.error(f"Error finalizing realtime session {session_id}: {e}", exc_info=True)
+
+async def stream_rows(query):
+    """Yield rows from a server-side cursor in its own session.
+
+    The request's session is closed before a streaming body is sent, so the
+    stream cannot borrow it.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for row in result:
+            yield row._asdict()
+
+def filter_params(
+    start_date: Optional[datetime] = Query(None, description="Only memories created at or after this time"),
+    end_date: Optional[datetime] = Query(None, description="Only memories created before this time"),
+    started_after: Optional[datetime] = Query(None, description="Only conversations that started at or after this time"),
+    finished_before: Optional[datetime] = Query(None, description="Only conversations that finished at or before this time"),
+    category: Optional[str] = Query(None, description="Only memories in this structured category"),
+    has_action_items: Optional[bool] = Query(None, description="Only memories with (true) or without (false) action items"),
+    event: Optional[str] = Query(None, description="Only memories with an event of exactly this title"),
+    source: Optional[str] = Query(None, description="Only memories from this source"),
+    language: Optional[str] = Query(None, description="Only memories in this language"),
+) -> dict:
+    """Filter parameters shared by list and search, as keyword arguments of memory_filters."""
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "started_after": started_after,
+        "finished_before": finished_before,
+        "category": category,
+        "has_action_items": has_action_items,
+        "event": event,
+        "source": source,
+        "language": language,
+    }
+
+async def apply_scan_settings(db: AsyncSession, ef_search: Optional[int], probes: Optional[int], iterative: bool = True):
+    # Per-request ANN tuning, scoped to this transaction, in one round trip
+    settings = list(scan_settings(ef_search, probes, iterative).items())
+    if settings:
+        calls = ", ".join(f"set_config(:name_{i}, :value_{i}, true)" for i in range(len(settings)))
+        params = {}
+        for i, (name, value) in enumerate(settings):
+            params[f"name_{i}"], params[f"value_{i}"] = name, value
+        await db.execute(text(f"SELECT {calls}"), params)
+
+@app.get(
+    "/memories/",
+    response_model=List[MemorySummary],
+    responses={200: {"content": {NDJSON_MEDIA_TYPE: {}}}}
+)
+async def get_memories(
+    request: Request,
     user_id: str = Query(..., description="User ID to filter memories"),
-    limit: Optional[int] = Query(1, description="Limit the number of memories returned"),
+    limit: Optional[int] = Query(1, ge=1, le=10000, description="Limit the number of memories returned"),
     include_transcripts: bool = Query(False, description="Whether to include full transcripts"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Continuation token from the X-Next-Cursor header of the previous page"),
+    filters: dict = Depends(filter_params),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        query = db.query(MemoryDB).filter(MemoryDB.user_id == user_id)
+        # Repeated reads of the latest memories are served without the database
+        # until the user writes again
+        cache_key = None
+        if not wants_ndjson(accept):
+            cache_key = await response_cache.key(user_id, "memories", request.query_params.multi_items())
+            cached = await response_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                return conditional_response(cached, if_none_match)
+
+        query = select(*SUMMARY_COLUMNS)
+        if include_transcripts:
+            query = join_payloads(query.add_columns(MemoryPayloadDB.transcript_segments))
+        query = query.where(
+            MemoryDB.user_id == user_id,
+            *memory_filters(**filters)
+        )
+
+        # Keyset pagination: continue strictly after the last (created_at, id) seen
+        if cursor:
+            created_at, memory_id = decode_memory_cursor(cursor)
+            query = query.where(tuple_(MemoryDB.created_at, MemoryDB.id) < tuple_(created_at, memory_id))
 
         # Sort memories by creation date in descending order to get the latest first
-        query = query.order_by(desc(MemoryDB.created_at))
+        query = query.order_by(desc(MemoryDB.created_at), desc(MemoryDB.id))
 
-        # Limit the number of memories returned
-        query = query.limit(limit)
+        # NDJSON: write each memory as it arrives; no next-page header since
+        # it would have to be known before the body starts
+        if wants_ndjson(accept):
+            return ndjson_response(stream_rows(query if limit is None else query.limit(limit)))
 
-        memories = query.all()
+        # Fetch one extra row to learn whether another page exists
+        with stage("db"):
+            memories = (await db.execute(query if limit is None else query.limit(limit + 1))).all()
 
-        # Prepare the response based on the include_transcripts flag
-        response = []
-        for memory in memories:
-            memory_data = {
-                "id": memory.id,
-                "created_at": memory.created_at,
-                "structured": memory.structured,
-                "status": memory.status
-            }
-            if include_transcripts:
-                memory_data["transcript_segments"] = memory.transcript_segments
-            response.append(memory_data)
+        headers = {}
+        if memories and limit is not None and len(memories) > limit:
+            memories = memories[:limit]
+            last = memories[-1]
+            headers[NEXT_CURSOR_HEADER] = encode_memory_cursor(last.created_at, last.id)
 
-        return response
+        with stage("hydrate"):
+            content = [memory._asdict() for memory in memories]
+        return conditional_response(await cached_response(cache_key, content, headers), if_none_match)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Add a new endpoint for semantic search
-@app.get("/memories/search")
+@app.get("/memories/search", response_model=List[SearchResult])
 async def search_memories(
     user_id: str = Query(..., description="User ID to filter memories"),
     query: str = Query(..., description="Search query"),
-    limit: int = Query(5, description="Number of results to return"),
-    db: Session = Depends(get_db)
+    limit: int = Query(5, ge=1, le=100, description="Number of results to return"),
+    ef_search: Optional[int] = Query(None, ge=1, le=1000, description="HNSW candidate list size; higher improves recall at the cost of latency"),
+    probes: Optional[int] = Query(None, ge=1, le=10000, description="IVFFlat lists to scan; higher improves recall at the cost of latency"),
+    cursor: Optional[str] = Query(None, description="Continuation token from the X-Next-Cursor header of the previous page"),
+    mode: Literal["vector", "hybrid", "lexical"] = Query("vector", description="Rank by embeddings, full-text match, or both fused"),
+    filters: dict = Depends(filter_params),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    query = search_text(query)
     try:
-        # Generate embedding for the search query
-        query_embedding = await generate_embedding(query)
-        
-        # Perform vector similarity search
-        results = db.query(
-            MemoryDB
-        ).filter(
-            MemoryDB.user_id == user_id
-        ).order_by(
-            MemoryDB.embedding.cosine_distance(query_embedding)
-        ).limit(limit).all()
-        
-        return [
-            {
-                "id": memory.id,
-                "created_at": memory.created_at,
-                "structured": memory.structured,
-                "status": memory.status
-            }
-            for memory in results
-        ]
+        # A cursor is only valid for the search, filters included, that issued it
+        fingerprint = search_fingerprint(
+            user_id, mode, normalize_query(query), *(str(value) for value in filters.values())
+        )
+        conditions = memory_filters(**filters)
+        after = decode_search_cursor(cursor, fingerprint) if cursor else None
+
+        # Generate embedding for the search query, reusing cached vectors;
+        # lexical search needs no embedding at all
+        query_embedding = None
+        if mode != "lexical":
+            with stage("embed"):
+                query_embedding = await query_cache.get_embedding(query)
+
+        # First pages of unfiltered vector searches by hot users are ranked in
+        # process; only the winning rows are read from the database
+        hits = None
+        if mode == "vector" and after is None and not conditions:
+            with stage("vector_cache"):
+                hits = vector_cache.search(user_id, query_embedding, limit + 1)
+
+        position = "score" if mode != "vector" else "distance"
+        if hits is not None:
+            # The candidates are scored again in SQL, so the cursor carries the
+            # same distances the next page's database search compares against
+            with stage("db"):
+                statement = rescore_memories(user_id, query_embedding, [hit.memory_id for hit in hits])
+                results = [row._asdict() for row in (await db.execute(statement)).all()]
+        else:
+            # Vector scans continue through the index until the page is full
+            with stage("db"):
+                await apply_scan_settings(db, ef_search, probes, iterative=mode != "lexical")
+
+            # Vector mode ranks transcript chunks and memory embeddings, aggregated
+            # to memories; memories still waiting for their embedding are skipped
+            if mode == "vector":
+                statement = vector_search(user_id, query_embedding, limit + 1, after, filters=conditions)
+            elif mode == "lexical":
+                statement = lexical_search(user_id, query, limit + 1, after, conditions)
+            else:
+                statement = hybrid_search(user_id, query_embedding, query, limit + 1, after, conditions)
+            with stage("db"):
+                results = [row._asdict() for row in (await db.execute(statement)).all()]
+
+        headers = {}
+        if results and len(results) > limit:
+            results = results[:limit]
+            last = results[-1]
+            headers[NEXT_CURSOR_HEADER] = encode_search_cursor(fingerprint, last[position], last["id"])
+
+        with stage("hydrate"):
+            for memory in results:
+                del memory[position]
+        return json_response(results, headers=headers)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error in semantic search: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/memories/{memory_id}")
+@app.post("/memories/search/batch", response_model=List[BatchSearchResult])
+async def batch_search_memories(
+    body: BatchSearchRequest,
+    user_id: str = Query(..., description="User ID to filter memories"),
+    ef_search: Optional[int] = Query(None, ge=1, le=1000, description="HNSW candidate list size; higher improves recall at the cost of latency"),
+    probes: Optional[int] = Query(None, ge=1, le=10000, description="IVFFlat lists to scan; higher improves recall at the cost of latency"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if not body.queries:
+        raise HTTPException(status_code=400, detail="Expected at least one query")
+    if len(body.queries) > SEARCH_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {SEARCH_BATCH_MAX} queries per batch")
+    if not 1 <= body.limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    query_texts = [search_text(query) for query in body.queries]
+
+    try:
+        # Cached queries are reused; the rest share one multi-input embeddings call
+        with stage("embed"):
+            query_embeddings = await query_cache.get_embeddings(query_texts)
+
+        filters = memory_filters(**body.model_dump(exclude={"queries", "limit", "dedupe"}))
+        with stage("db"):
+            await apply_scan_settings(db, ef_search, probes)
+            # Every query's nearest-neighbour lookup runs in this one statement
+            rows = (await db.execute(
+                batch_vector_search(user_id, query_embeddings, body.limit, body.dedupe, filters=filters)
+            )).all()
+
+        with stage("hydrate"):
+            results = [{"query": query, "memories": []} for query in body.queries]
+            for row in rows:
+                memory = row._asdict()
+                index = memory.pop("query_index")
+                del memory["distance"]
+                results[index]["memories"].append(memory)
+        return json_response(results)
+    except Exception as e:
+        logger.error(f"Error in batch search: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def related_result(row) -> dict:
+    """A related memory as returned to clients: similarity instead of distance."""
+    memory = row._asdict()
+    del memory["source_id"]
+    memory["similarity"] = 1.0 - memory.pop("distance")
+    return memory
+
+@app.get("/memories/near-duplicates", response_model=List[NearDuplicates])
+async def get_near_duplicates(
+    user_id: str = Query(..., description="User ID to filter memories"),
+    recent: int = Query(50, ge=1, description="Number of the user's latest memories to check"),
+    min_similarity: float = Query(0.95, ge=0.0, le=1.0, description="Cosine similarity at or above which memories count as duplicates"),
+    limit: int = Query(5, ge=1, le=100, description="Duplicates returned per memory"),
+    ef_search: Optional[int] = Query(None, ge=1, le=1000, description="HNSW candidate list size; higher improves recall at the cost of latency"),
+    probes: Optional[int] = Query(None, ge=1, le=10000, description="IVFFlat lists to scan; higher improves recall at the cost of latency"),
+    filters: dict = Depends(filter_params),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Pair each of a user's latest memories with the memories nearly identical to it."""
+    if recent > NEAR_DUPLICATES_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {NEAR_DUPLICATES_MAX} memories per request")
+
+    try:
+        conditions = memory_filters(**filters)
+        sources = select(MemoryDB.id, MemoryDB.created_at, MemoryDB.embedding).where(
+            MemoryDB.user_id == user_id,
+            MemoryDB.embedding.isnot(None),
+            *conditions
+        ).order_by(desc(MemoryDB.created_at), desc(MemoryDB.id)).limit(recent)
+        with stage("db"):
+            await apply_scan_settings(db, ef_search, probes)
+            # Stored embeddings are the query vectors: every memory's lookup
+            # runs in this one statement without an embedding call
+            rows = (await db.execute(related_memories(
+                user_id, sources, limit, max_distance=1.0 - min_similarity, filters=conditions
+            ))).all()
+
+        with stage("hydrate"):
+            results = {}
+            for row in rows:
+                results.setdefault(row.source_id, {"id": row.source_id, "duplicates": []})
+                results[row.source_id]["duplicates"].append(related_result(row))
+        return json_response(list(results.values()))
+    except Exception as e:
+        logger.error(f"Error finding near-duplicate memories: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/memories/{memory_id}/related", response_model=List[RelatedMemory])
+async def get_related_memories(
+    memory_id: UUID,
+    user_id: str = Query(..., description="User ID to verify ownership"),
+    limit: int = Query(5, ge=1, le=100, description="Number of results to return"),
+    ef_search: Optional[int] = Query(None, ge=1, le=1000, description="HNSW candidate list size; higher improves recall at the cost of latency"),
+    probes: Optional[int] = Query(None, ge=1, le=10000, description="IVFFlat lists to scan; higher improves recall at the cost of latency"),
+    filters: dict = Depends(filter_params),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Memories most similar to a stored one, found with its stored embedding."""
+    try:
+        conditions = memory_filters(**filters)
+        sources = select(MemoryDB.id, MemoryDB.created_at, MemoryDB.embedding).where(
+            MemoryDB.id == memory_id,
+            MemoryDB.user_id == user_id
+        )
+        with stage("db"):
+            await apply_scan_settings(db, ef_search, probes)
+            # The source row comes back even without matches, telling a
+            # missing memory apart from one with nothing related
+            rows = (await db.execute(
+                related_memories(user_id, sources, limit, filters=conditions, keep_sources=True)
+            )).all()
+
+        if not rows:
+            raise HTTPException(status_code=404, detail="Memory not found")
+        with stage("hydrate"):
+            memories = [related_result(row) for row in rows if row.id is not None]
+        return json_response(memories)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error finding memories related to {memory_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/memories/{memory_id}", response_model=MemoryDetail)
 async def get_memory_detail(
+    request: Request,
     memory_id: UUID,
     user_id: str = Query(..., description="User ID to verify ownership"),
-    db: Session = Depends(get_db)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        memory = db.query(MemoryDB).filter(
-            and_(
-                MemoryDB.id == memory_id,
-                MemoryDB.user_id == user_id
-            )
-        ).first()
+        cache_key = await response_cache.key(user_id, f"memories/{memory_id}", request.query_params.multi_items())
+        cached = await response_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return conditional_response(cached, if_none_match)
+
+        with stage("db"):
+            result = await db.execute(join_payloads(select(*DETAIL_COLUMNS)).where(
+                and_(
+                    MemoryDB.id == memory_id,
+                    MemoryDB.user_id == user_id
+                )
+            ))
+            memory = result.first()
         
         if not memory:
             raise HTTPException(status_code=404, detail="Memory not found")
             
-        return {
-            "id": memory.id,
-            "created_at": memory.created_at,
-            "structured": memory.structured,
-            "transcript_segments": memory.transcript_segments,
-            "plugins_results": memory.plugins_results,
-            "external_data": memory.external_data,
-            "geolocation": memory.geolocation,
-            "photos": memory.photos,
-            "status": memory.status
-        }
+        with stage("hydrate"):
+            content = memory._asdict()
+        return conditional_response(await cached_response(cache_key, content), if_none_match)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing /memories/{memory_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,110 @@
+import contextvars
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged with their stage breakdown, sampled
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv("SLOW_REQUEST_SAMPLE_RATE", "1.0"))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+REQUEST_SECONDS = Histogram(
+    "omiapi_request_seconds", "Request latency", ["method", "route", "status"]
+)
+STAGE_SECONDS = Histogram(
+    "omiapi_stage_seconds", "Time spent per request stage", ["route", "stage"]
+)
+EMBEDDING_REQUESTS = Counter(
+    "omiapi_embedding_requests_total", "Calls to the embeddings API", ["model"]
+)
+EMBEDDING_TOKENS = Counter(
+    "omiapi_embedding_tokens_total", "Prompt tokens sent to the embeddings API", ["model"]
+)
+DB_POOL = Gauge("omiapi_db_pool", "Async engine connection pool", ["state"])
+EMBEDDING_QUEUE = Gauge("omiapi_embedding_queue", "Background embedding queue", ["state"])
+
+# Stage durations of the request being handled, in seconds
+_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("stage_timings", default=None)
+
+@contextmanager
+def stage(name: str):
+    """Time a block as one stage of the current request; a no-op outside requests."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+def record_embedding_usage(model: str, usage) -> None:
+    EMBEDDING_REQUESTS.labels(model).inc()
+    if usage is not None:
+        EMBEDDING_TOKENS.labels(model).inc(usage.prompt_tokens)
+
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+def render(pool: dict, queue: dict) -> bytes:
+    """Prometheus exposition, with pool and queue gauges read at scrape time."""
+    for state in ("size", "checked_in", "checked_out", "overflow"):
+        DB_POOL.labels(state).set(pool[state])
+    for state in ("queued", "in_flight", "workers"):
+        EMBEDDING_QUEUE.labels(state).set(queue[state])
+    return generate_latest()
+
+class TimingMiddleware:
+    """Record per-route latency and stage histograms and add a Server-Timing header.
+
+    Stages are whatever the handler wrapped in ``stage()``: embedding calls,
+    database queries, row hydration and JSON encoding.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    header = server_timing(timings, time.perf_counter() - started)
+                    message = dict(message, headers=[*message.get("headers", []), (b"server-timing", header.encode())])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            elapsed = time.perf_counter() - started
+            # Route templates keep label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+            for name, seconds in timings.items():
+                STAGE_SECONDS.labels(route, name).observe(seconds)
+            if elapsed * 1000 >= SLOW_REQUEST_MS and random.random() < SLOW_REQUEST_SAMPLE_RATE:
+                logger.warning(
+                    f"Slow request {scope['method']} {route} -> {status} took {elapsed * 1000:.0f} ms "
+                    f"({server_timing(timings, elapsed)})"
+                )
@@ -0,0 +1,648 @@
+"""Schema migrations for the memory database.
+
+Usage:
+    python migrations.py upgrade   # apply pending migrations
+    python migrations.py status    # list applied and pending migrations
+    python migrations.py compact-indexes  # build the VECTOR_STORAGE indexes later
+    python migrations.py drop-full-indexes  # then drop the full-precision ones it replaces
+    python migrations.py partition        # convert omi_memories to monthly partitions
+    python migrations.py partitions --retention-months 24  # add upcoming, drop expired
+    python migrations.py payload-compression  # apply PAYLOAD_COMPRESSION to new payloads
+
+Index builds run with CREATE INDEX CONCURRENTLY so they can be applied to a
+live database without blocking ingest.
+"""
+import argparse
+import logging
+import os
+import re
+import time
+from datetime import date, datetime, timezone
+from typing import Callable, List, NamedTuple, Optional, Tuple, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateTable
+
+from database import get_vector_engine
+from models import Base, MemoryChunkDB, MemoryPayloadDB, SEARCH_VECTOR_EXPRESSION
+from queries import PAYLOAD_COLUMNS, VECTOR_STORAGE
+
+logger = logging.getLogger(__name__)
+
+# Embedding index settings, read when the index migration runs
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")  # hnsw or ivfflat
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "1000"))
+MAINTENANCE_WORK_MEM = os.getenv("MIGRATION_MAINTENANCE_WORK_MEM")
+# TOAST codec of omi_memory_payloads: pglz or lz4 (Postgres 14+); unset keeps
+# the server's default_toast_compression
+PAYLOAD_COMPRESSION = os.getenv("PAYLOAD_COMPRESSION")
+PAYLOAD_CODECS = ("pglz", "lz4")
+
+class Migration(NamedTuple):
+    name: str
+    steps: List[Union[str, Callable[[Connection], None]]]
+    # Non-transactional migrations run in autocommit mode (needed for CONCURRENTLY)
+    transactional: bool = True
+
+def _create_base_schema(conn: Connection):
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    Base.metadata.create_all(bind=conn)
+
+def _drop_invalid_index(name: str) -> Callable[[Connection], None]:
+    """Drop a leftover INVALID index from an interrupted concurrent build."""
+    def step(conn: Connection):
+        invalid = conn.execute(text(
+            "SELECT c.relkind FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {"name": name}).first()
+        if invalid:
+            logger.warning(f"Dropping invalid index {name} before rebuilding it")
+            # Indexes of partitioned tables cannot be dropped concurrently
+            concurrently = "" if invalid.relkind == "I" else "CONCURRENTLY "
+            conn.execute(text(f"DROP INDEX {concurrently}IF EXISTS {name}"))
+    return step
+
+def _tune_index_build(conn: Connection):
+    if MAINTENANCE_WORK_MEM:
+        conn.execute(text("SELECT set_config('maintenance_work_mem', :value, false)"),
+                     {"value": MAINTENANCE_WORK_MEM})
+
+# Indexed expression and operator class per VECTOR_STORAGE; the expressions
+# must match queries.compact_distance for the planner to use the index
+STORAGE_INDEX_EXPRESSIONS = {
+    "vector": "embedding vector_cosine_ops",
+    "halfvec": "(embedding::halfvec(1536)) halfvec_cosine_ops",
+    "binary": "(binary_quantize(embedding)::bit(1536)) bit_hamming_ops",
+}
+
+def _embedding_index_sql(table: str, name: str, storage: str = "vector", concurrently: bool = True) -> str:
+    if VECTOR_INDEX_TYPE == "hnsw":
+        options = f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+    elif VECTOR_INDEX_TYPE == "ivfflat":
+        options = f"WITH (lists = {IVFFLAT_LISTS})"
+    else:
+        raise ValueError(f"Unsupported VECTOR_INDEX_TYPE: {VECTOR_INDEX_TYPE}")
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+        f"ON {table} USING {VECTOR_INDEX_TYPE} ({STORAGE_INDEX_EXPRESSIONS[storage]}) {options}"
+    )
+
+def _create_embedding_index(table: str, name: str, storage: str = "vector") -> Callable[[Connection], None]:
+    def step(conn: Connection):
+        # Partitioned tables can't build indexes concurrently
+        concurrently = not (table == "omi_memories" and is_partitioned(conn))
+        conn.execute(text(_embedding_index_sql(table, name, storage, concurrently)))
+    return step
+
+def _create_compact_indexes(conn: Connection):
+    """Build the compact ANN indexes searched when VECTOR_STORAGE is halfvec or binary."""
+    if VECTOR_STORAGE == "vector":
+        return
+    if VECTOR_STORAGE not in STORAGE_INDEX_EXPRESSIONS:
+        raise ValueError(f"Unsupported VECTOR_STORAGE: {VECTOR_STORAGE}")
+    _tune_index_build(conn)
+    for table in ("omi_memories", "omi_memory_chunks"):
+        name = f"ix_{table}_embedding_{VECTOR_STORAGE}"
+        _drop_invalid_index(name)(conn)
+        _create_embedding_index(table, name, VECTOR_STORAGE)(conn)
+
+def _index_is_valid(conn: Connection, name: str) -> bool:
+    return conn.execute(text(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+    ), {"name": name}).scalar() or False
+
+def drop_full_precision_indexes(conn: Connection):
+    """Drop the full-precision ANN indexes that a compact VECTOR_STORAGE no longer searches.
+
+    Each is only dropped once the compact index of its table is valid.
+    Switching back to VECTOR_STORAGE=vector needs them rebuilt first, as
+    migrations 0004 and 0008 build them.
+    """
+    if VECTOR_STORAGE == "vector":
+        raise RuntimeError("VECTOR_STORAGE is vector; the full-precision indexes are the ones searched")
+    for table in ("omi_memories", "omi_memory_chunks"):
+        if not _index_is_valid(conn, f"ix_{table}_embedding_{VECTOR_STORAGE}"):
+            raise RuntimeError(f"No valid {VECTOR_STORAGE} index on {table}; run 'python migrations.py compact-indexes' first")
+        # Partitioned tables can't drop indexes concurrently
+        concurrently = not (table == "omi_memories" and is_partitioned(conn))
+        conn.execute(text(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS ix_{table}_embedding"))
+        logger.info(f"Dropped full-precision index ix_{table}_embedding")
+
+def _create_chunk_table(conn: Connection):
+    MemoryChunkDB.__table__.create(bind=conn, checkfirst=True)
+
+def _backfill_created_at(conn: Connection):
+    """Give legacy rows a created_at in small batches so keyset pagination can rely on it."""
+    while True:
+        updated = conn.execute(text(
+            "UPDATE omi_memories SET created_at = now() WHERE id IN ("
+            "SELECT id FROM omi_memories WHERE created_at IS NULL LIMIT 10000)"
+        )).rowcount
+        if not updated:
+            break
+        logger.info(f"Backfilled created_at on {updated} memories")
+
+def _drop_duplicate_processing_memories(conn: Connection):
+    result = conn.execute(text(
+        "DELETE FROM omi_memories AS m USING omi_memories AS newer "
+        "WHERE m.processing_memory_id IS NOT NULL "
+        "AND newer.user_id = m.user_id "
+        "AND newer.processing_memory_id = m.processing_memory_id "
+        "AND (newer.created_at, newer.id) > (m.created_at, m.id)"
+    ))
+    if result.rowcount:
+        logger.info(f"Removed {result.rowcount} duplicate memories")
+
+# Indexes behind the structured filters of list and search; the expressions
+# must match queries.memory_filters for the planner to use them
+FILTER_INDEXES = {
+    "ix_omi_memories_user_id_category":
+        "(user_id, (structured ->> 'category'), created_at DESC, id DESC)",
+    "ix_omi_memories_user_id_action_items":
+        "(user_id, created_at DESC, id DESC) WHERE (structured -> 'actionItems') <> '[]'::jsonb",
+    "ix_omi_memories_structured": "USING gin (structured jsonb_path_ops)",
+    "ix_omi_memories_user_id_source_language": "(user_id, source, language)",
+}
+
+def _filter_index_sql(table: str, name: str, concurrently: bool = True) -> str:
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+        f"ON {table} {FILTER_INDEXES[name]}"
+    )
+
+def _create_filter_indexes(conn: Connection):
+    concurrently = not is_partitioned(conn)
+    for name in FILTER_INDEXES:
+        _drop_invalid_index(name)(conn)
+        conn.execute(text(_filter_index_sql("omi_memories", name, concurrently)))
+
+def _create_embedding_retry_index(conn: Connection):
+    # Only the memories the embedding sweep looks at; the predicate must match queries.claim_due_embeddings
+    _drop_invalid_index("ix_omi_memories_embedding_retry")(conn)
+    conn.execute(text(
+        f"CREATE INDEX {'' if is_partitioned(conn) else 'CONCURRENTLY '}IF NOT EXISTS ix_omi_memories_embedding_retry "
+        "ON omi_memories (embedding_retry_at) WHERE embedding_status IN ('pending', 'failed')"
+    ))
+
+def _has_column(conn: Connection, table: str, name: str) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = :table AND column_name = :name"
+    ), {"table": table, "name": name}).first() is not None
+
+def _set_payload_compression(conn: Connection):
+    """Compress payloads written from now on with PAYLOAD_COMPRESSION; stored values keep their codec."""
+    if not PAYLOAD_COMPRESSION:
+        return
+    if PAYLOAD_COMPRESSION not in PAYLOAD_CODECS:
+        raise ValueError(f"Unsupported PAYLOAD_COMPRESSION: {PAYLOAD_COMPRESSION}")
+    for name in PAYLOAD_COLUMNS:
+        conn.execute(text(f"ALTER TABLE omi_memory_payloads ALTER COLUMN {name} SET COMPRESSION {PAYLOAD_COMPRESSION}"))
+
+_PAYLOAD_LIST = ", ".join(PAYLOAD_COLUMNS)
+
+def _create_payload_table(conn: Connection):
+    """Create omi_memory_payloads and mirror writes of the inline payload columns into it."""
+    if not is_partitioned(conn):
+        MemoryPayloadDB.__table__.create(bind=conn, checkfirst=True)
+    elif conn.execute(text("SELECT to_regclass('omi_memory_payloads')")).scalar() is None:
+        # The partitioned table's key includes created_at, so memory_id cannot reference it
+        conn.execute(CreateTable(MemoryPayloadDB.__table__, include_foreign_key_constraints=[]))
+    _set_payload_compression(conn)
+    if not _has_column(conn, "omi_memories", "transcript_segments"):
+        return
+    # Until migration 0016 drops them, writes by the previous release keep both copies equal
+    updates = ", ".join(f"{name} = EXCLUDED.{name}" for name in PAYLOAD_COLUMNS)
+    conn.execute(text(
+        "CREATE OR REPLACE FUNCTION omi_memories_mirror_payload() RETURNS trigger AS $$ BEGIN "
+        f"INSERT INTO omi_memory_payloads (memory_id, {_PAYLOAD_LIST}) "
+        f"VALUES (NEW.id, {', '.join(f'NEW.{name}' for name in PAYLOAD_COLUMNS)}) "
+        f"ON CONFLICT (memory_id) DO UPDATE SET {updates}; "
+        "RETURN NULL; END $$ LANGUAGE plpgsql"
+    ))
+    conn.execute(text("DROP TRIGGER IF EXISTS omi_memories_mirror_payload ON omi_memories"))
+    conn.execute(text(
+        f"CREATE TRIGGER omi_memories_mirror_payload AFTER INSERT OR UPDATE OF {_PAYLOAD_LIST} "
+        "ON omi_memories FOR EACH ROW EXECUTE FUNCTION omi_memories_mirror_payload()"
+    ))
+
+def _copy_payloads(conn: Connection):
+    """Copy the payloads of existing memories in id order, a batch per statement.
+
+    Memories whose payload is already there are skipped without reading it,
+    so running it again only costs a pass over the ids.
+    """
+    if not _has_column(conn, "omi_memories", "transcript_segments"):
+        return
+    after, copied = "00000000-0000-0000-0000-000000000000", 0
+    while True:
+        batch = conn.execute(text(
+            "WITH batch AS (SELECT id FROM omi_memories WHERE id > :after ORDER BY id LIMIT 5000), "
+            f"copied AS (INSERT INTO omi_memory_payloads (memory_id, {_PAYLOAD_LIST}) "
+            f"SELECT m.id, {', '.join(f'm.{name}' for name in PAYLOAD_COLUMNS)} FROM batch JOIN omi_memories m USING (id) "
+            "WHERE NOT EXISTS (SELECT 1 FROM omi_memory_payloads p WHERE p.memory_id = m.id) "
+            "ON CONFLICT (memory_id) DO NOTHING) "
+            "SELECT (SELECT count(*) FROM batch) AS rows, (SELECT id FROM batch ORDER BY id DESC LIMIT 1) AS last"
+        ), {"after": after}).one()
+        if not batch.rows:
+            break
+        after, copied = batch.last, copied + batch.rows
+        logger.info(f"Copied payloads of {copied} memories")
+
+def _drop_inline_payloads(conn: Connection):
+    """Drop the payload columns of omi_memories; search_vector becomes a plain column written with each row.
+
+    Runs after ``_copy_payloads`` has copied everything online. Its own short
+    transaction then blocks writes only to copy the rows still missing (the
+    mirror trigger normally leaves none) and to drop the columns. The table
+    keeps the space of dropped values until its rows are rewritten (VACUUM
+    FULL, pg_repack or ``python migrations.py partition``).
+    """
+    if not _has_column(conn, "omi_memories", "transcript_segments"):
+        return
+    with get_vector_engine().begin() as tx:
+        # Block writes so no payload lands after the final copy
+        tx.execute(text("LOCK TABLE omi_memories IN SHARE ROW EXCLUSIVE MODE"))
+        copied = tx.execute(text(
+            f"INSERT INTO omi_memory_payloads (memory_id, {_PAYLOAD_LIST}) "
+            f"SELECT id, {_PAYLOAD_LIST} FROM omi_memories m "
+            "WHERE NOT EXISTS (SELECT 1 FROM omi_memory_payloads p WHERE p.memory_id = m.id)"
+        )).rowcount
+        logger.info(f"Copied payloads of {copied} remaining memories")
+        tx.execute(text("DROP TRIGGER IF EXISTS omi_memories_mirror_payload ON omi_memories"))
+        tx.execute(text("DROP FUNCTION IF EXISTS omi_memories_mirror_payload()"))
+        # Keeps the stored values; needs Postgres 13+
+        tx.execute(text("ALTER TABLE omi_memories ALTER COLUMN search_vector DROP EXPRESSION IF EXISTS"))
+        tx.execute(text(
+            "ALTER TABLE omi_memories " + ", ".join(f"DROP COLUMN {name}" for name in PAYLOAD_COLUMNS)
+        ))
+
+MIGRATIONS = [
+    Migration("0001_base_schema", [_create_base_schema]),
+    Migration("0002_embedding_status", [
+        "ALTER TABLE omi_memories ADD COLUMN IF NOT EXISTS embedding_status VARCHAR",
+    ]),
+    Migration("0003_user_created_at_index", [
+        _drop_invalid_index("ix_omi_memories_user_id_created_at"),
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_omi_memories_user_id_created_at "
+        "ON omi_memories (user_id, created_at DESC)",
+    ], transactional=False),
+    Migration("0004_embedding_index", [
+        _drop_invalid_index("ix_omi_memories_embedding"),
+        _tune_index_build,
+        _create_embedding_index("omi_memories", "ix_omi_memories_embedding"),
+    ], transactional=False),
+    Migration("0005_created_at_not_null", [
+        "ALTER TABLE omi_memories ALTER COLUMN created_at SET DEFAULT now()",
+        _backfill_created_at,
+        "ALTER TABLE omi_memories ALTER COLUMN created_at SET NOT NULL",
+    ], transactional=False),
+    Migration("0006_user_created_at_id_index", [
+        _drop_invalid_index("ix_omi_memories_user_id_created_at_id"),
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_omi_memories_user_id_created_at_id "
+        "ON omi_memories (user_id, created_at DESC, id DESC)",
+        "DROP INDEX CONCURRENTLY IF EXISTS ix_omi_memories_user_id_created_at",
+    ], transactional=False),
+    Migration("0007_memory_chunks", [_create_chunk_table]),
+    Migration("0008_memory_chunk_indexes", [
+        _drop_invalid_index("ix_omi_memory_chunks_memory_id"),
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_omi_memory_chunks_memory_id "
+        "ON omi_memory_chunks (memory_id)",
+        _drop_invalid_index("ix_omi_memory_chunks_user_id"),
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_omi_memory_chunks_user_id "
+        "ON omi_memory_chunks (user_id)",
+        _drop_invalid_index("ix_omi_memory_chunks_embedding"),
+        _tune_index_build,
+        _create_embedding_index("omi_memory_chunks", "ix_omi_memory_chunks_embedding"),
+    ], transactional=False),
+    # Adding a stored generated column rewrites omi_memories under an exclusive lock
+    Migration("0009_search_vector", [
+        "ALTER TABLE omi_memories ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({SEARCH_VECTOR_EXPRESSION}) STORED",
+    ]),
+    Migration("0010_search_vector_index", [
+        _drop_invalid_index("ix_omi_memories_search_vector"),
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_omi_memories_search_vector "
+        "ON omi_memories USING gin (search_vector)",
+    ], transactional=False),
+    Migration("0011_content_hash", [
+        "ALTER TABLE omi_memories ADD COLUMN IF NOT EXISTS content_hash VARCHAR",
+    ]),
+    # Webhook retries may already have stored duplicates; keep the newest one
+    Migration("0012_processing_memory_id_unique", [
+        _drop_duplicate_processing_memories,
+        _drop_invalid_index("uq_omi_memories_user_id_processing_memory_id"),
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_omi_memories_user_id_processing_memory_id "
+        "ON omi_memories (user_id, processing_memory_id) WHERE processing_memory_id IS NOT NULL",
+    ], transactional=False),
+    # Needs pgvector 0.7+; builds nothing while VECTOR_STORAGE is vector
+    Migration("0013_compact_embedding_indexes", [_create_compact_indexes], transactional=False),
+    Migration("0014_filter_indexes", [_create_filter_indexes], transactional=False),
+    # Large payloads move to omi_memory_payloads: copied online first, then
+    # the inline columns are dropped in a short write-blocking transaction
+    # that only copies what the online passes missed
+    Migration("0015_memory_payloads", [_create_payload_table, _copy_payloads], transactional=False),
+    Migration("0016_drop_inline_payloads", [_copy_payloads, _drop_inline_payloads], transactional=False),
+    # Earlier releases of 0016 kept search_vector current with a trigger that
+    # updated the memory row again on every payload write
+    Migration("0017_drop_search_vector_trigger", [
+        "DROP TRIGGER IF EXISTS omi_memory_payloads_search_vector ON omi_memory_payloads",
+        "DROP FUNCTION IF EXISTS omi_memory_payloads_search_vector()",
+    ]),
+    # Retry bookkeeping of the periodic embedding sweep; adding the columns
+    # rewrites nothing, and the partial index only covers unfinished memories
+    Migration("0018_embedding_retry", [
+        "ALTER TABLE omi_memories ADD COLUMN IF NOT EXISTS embedding_attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE omi_memories ADD COLUMN IF NOT EXISTS embedding_retry_at TIMESTAMPTZ",
+        _create_embedding_retry_index,
+    ], transactional=False),
+]
+
+# Monthly range partitioning of omi_memories on created_at. Optional and run
+# by hand; set MEMORY_PARTITIONING=monthly once it is done.
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_NAME = re.compile(r"^omi_memories_(\d{4})_(\d{2})$")
+# Catches rows outside every monthly partition, e.g. a created_at far in the future
+DEFAULT_PARTITION = "omi_memories_default"
+# Retention deletes the chunks and payloads of expired memories in batches
+# of this many memories, pausing this many seconds between them
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+RETENTION_BATCH_DELAY = float(os.getenv("RETENTION_BATCH_DELAY", "0.1"))
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_bounds(first: date, last: date) -> List[Tuple[str, date, date]]:
+    """(name, start, end) of every monthly partition from first's month to last's."""
+    month = date(first.year, first.month, 1)
+    bounds = []
+    while month <= last:
+        end = add_months(month, 1)
+        bounds.append((f"omi_memories_{month:%Y_%m}", month, end))
+        month = end
+    return bounds
+
+def is_partitioned(conn: Connection) -> bool:
+    return conn.execute(text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('omi_memories')"
+    )).scalar() or False
+
+def _copy_columns(conn: Connection, table: str) -> str:
+    """Quoted column list of a table without its generated columns, which the target recomputes."""
+    return ", ".join(
+        f'"{row.column_name}"' for row in conn.execute(text(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_name = :table AND is_generated = 'NEVER' ORDER BY ordinal_position"
+        ), {"table": table})
+    )
+
+def _has_default_partition(conn: Connection) -> bool:
+    return conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": DEFAULT_PARTITION}).scalar()
+
+def _create_partitions(conn: Connection, parent: str, first: date, last: date):
+    """Create the missing monthly partitions, moving in rows the default partition holds for them."""
+    for name, start, end in partition_bounds(first, last):
+        if conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar():
+            continue
+        bounds = {"start": f"{start.isoformat()} 00:00+00", "end": f"{end.isoformat()} 00:00+00"}
+        # A partition can't be created while the default one holds rows in its
+        # range, so those rows are taken out of the detached default first
+        strays = _has_default_partition(conn) and conn.execute(text(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end)"
+        ), bounds).scalar()
+        if strays:
+            conn.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {DEFAULT_PARTITION}"))
+        conn.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {parent} "
+            f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+        ))
+        if strays:
+            columns = _copy_columns(conn, DEFAULT_PARTITION)
+            moved = conn.execute(text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end "
+                f"RETURNING {columns}) INSERT INTO {parent} ({columns}) SELECT {columns} FROM moved"
+            ), bounds).rowcount
+            conn.execute(text(f"ALTER TABLE {parent} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+            logger.info(f"Moved {moved} memories from {DEFAULT_PARTITION} into {name}")
+
+def partition_memories():
+    """Rebuild omi_memories as a table range partitioned by month on created_at.
+
+    Runs in one transaction that blocks writes (reads continue) while rows
+    are copied, so schedule it for a quiet period. The old table is kept as
+    omi_memories_unpartitioned. Uniqueness must include the partition key, so
+    the primary key becomes (id, created_at) and the idempotency index gains
+    created_at. Rows outside every monthly partition land in
+    omi_memories_default until their month's partition is created, which
+    moves them over. The chunk and payload foreign keys are dropped because a
+    partitioned table can't back them; expired partitions delete their chunks
+    and payloads explicitly.
+    """
+    with get_vector_engine().begin() as conn:
+        if is_partitioned(conn):
+            logger.info("omi_memories is already partitioned")
+            return
+        conn.execute(text("LOCK TABLE omi_memories IN EXCLUSIVE MODE"))
+        _tune_index_build(conn)
+        conn.execute(text(
+            "CREATE TABLE omi_memories_partitioned (LIKE omi_memories "
+            "INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING STORAGE) PARTITION BY RANGE (created_at)"
+        ))
+        conn.execute(text("ALTER TABLE omi_memories_partitioned ADD PRIMARY KEY (id, created_at)"))
+
+        now = datetime.now(timezone.utc)
+        first, last = conn.execute(text("SELECT min(created_at), max(created_at) FROM omi_memories")).one()
+        _create_partitions(
+            conn,
+            "omi_memories_partitioned",
+            (first or now).astimezone(timezone.utc).date(),
+            max((last or now).astimezone(timezone.utc).date(), add_months(now.date(), PARTITION_MONTHS_AHEAD)),
+        )
+
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF omi_memories_partitioned DEFAULT"))
+
+        columns = _copy_columns(conn, "omi_memories")
+        copied = conn.execute(text(
+            f"INSERT INTO omi_memories_partitioned ({columns}) SELECT {columns} FROM omi_memories"
+        )).rowcount
+        logger.info(f"Copied {copied} memories into monthly partitions")
+
+        # Free the index names for the new table
+        for row in conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'omi_memories'"
+        )).all():
+            conn.execute(text(f"ALTER INDEX {row.indexname} RENAME TO {row.indexname[:48]}_unpartitioned"))
+
+        conn.execute(text(
+            "CREATE INDEX ix_omi_memories_user_id_created_at_id "
+            "ON omi_memories_partitioned (user_id, created_at DESC, id DESC)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX ix_omi_memories_search_vector ON omi_memories_partitioned USING gin (search_vector)"
+        ))
+        if _has_column(conn, "omi_memories", "embedding_retry_at"):
+            conn.execute(text(
+                "CREATE INDEX ix_omi_memories_embedding_retry ON omi_memories_partitioned (embedding_retry_at) "
+                "WHERE embedding_status IN ('pending', 'failed')"
+            ))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX uq_omi_memories_user_id_processing_memory_id "
+            "ON omi_memories_partitioned (user_id, processing_memory_id, created_at) "
+            "WHERE processing_memory_id IS NOT NULL"
+        ))
+        for name in FILTER_INDEXES:
+            conn.execute(text(_filter_index_sql("omi_memories_partitioned", name, concurrently=False)))
+        # Only the index the configured VECTOR_STORAGE searches
+        if VECTOR_STORAGE == "vector":
+            conn.execute(text(_embedding_index_sql(
+                "omi_memories_partitioned", "ix_omi_memories_embedding", concurrently=False
+            )))
+        else:
+            conn.execute(text(_embedding_index_sql(
+                "omi_memories_partitioned", f"ix_omi_memories_embedding_{VECTOR_STORAGE}",
+                VECTOR_STORAGE, concurrently=False
+            )))
+
+        conn.execute(text("ALTER TABLE omi_memory_chunks DROP CONSTRAINT IF EXISTS omi_memory_chunks_memory_id_fkey"))
+        conn.execute(text("ALTER TABLE omi_memory_payloads DROP CONSTRAINT IF EXISTS omi_memory_payloads_memory_id_fkey"))
+        conn.execute(text("ALTER TABLE omi_memories RENAME TO omi_memories_unpartitioned"))
+        conn.execute(text("ALTER TABLE omi_memories_partitioned RENAME TO omi_memories"))
+    logger.info("omi_memories is now partitioned; set MEMORY_PARTITIONING=monthly")
+
+def _delete_partition_dependents(name: str, batch_size: int, batch_delay: float):
+    """Delete the chunks and payloads of a detached partition's memories, a batch per transaction."""
+    after, deleted = "00000000-0000-0000-0000-000000000000", 0
+    while True:
+        with get_vector_engine().begin() as conn:
+            ids = conn.execute(text(
+                f"SELECT id FROM {name} WHERE id > :after ORDER BY id LIMIT :limit"
+            ), {"after": after, "limit": batch_size}).scalars().all()
+            if not ids:
+                break
+            batch = {"ids": [str(memory_id) for memory_id in ids]}
+            conn.execute(text("DELETE FROM omi_memory_chunks WHERE memory_id = ANY(CAST(:ids AS uuid[]))"), batch)
+            conn.execute(text("DELETE FROM omi_memory_payloads WHERE memory_id = ANY(CAST(:ids AS uuid[]))"), batch)
+        after, deleted = ids[-1], deleted + len(ids)
+        logger.info(f"Deleted chunks and payloads of {deleted} memories from {name}")
+        # Leave room for other writers and for replication to keep up
+        time.sleep(batch_delay)
+
+def maintain_partitions(
+    months_ahead: int = PARTITION_MONTHS_AHEAD,
+    retention_months: Optional[int] = None,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    batch_delay: float = RETENTION_BATCH_DELAY,
+):
+    """Create upcoming monthly partitions and drop those past the retention period.
+
+    An expired partition is detached first, so its memories disappear from
+    reads at once. Their chunks and payloads, which have no foreign key to
+    cascade, are then deleted in small rate-limited transactions before the
+    table is dropped. A run that is interrupted picks up the detached
+    partitions it left behind.
+    """
+    today = datetime.now(timezone.utc).date()
+    with get_vector_engine().begin() as conn:
+        if not is_partitioned(conn):
+            raise RuntimeError("omi_memories is not partitioned; run 'python migrations.py partition' first")
+        _create_partitions(conn, "omi_memories", today, add_months(today, months_ahead))
+        if retention_months is None:
+            return
+        tables = conn.execute(text(
+            "SELECT relname, relispartition FROM pg_class WHERE relkind = 'r' AND relname LIKE 'omi\\_memories\\_%'"
+        )).all()
+
+    cutoff = add_months(date(today.year, today.month, 1), -retention_months)
+    for name, attached in sorted(tables):
+        match = PARTITION_NAME.match(name)
+        if not match or add_months(date(int(match[1]), int(match[2]), 1), 1) > cutoff:
+            continue
+        if attached:
+            with get_vector_engine().begin() as conn:
+                conn.execute(text(f"ALTER TABLE omi_memories DETACH PARTITION {name}"))
+        _delete_partition_dependents(name, batch_size, batch_delay)
+        with get_vector_engine().begin() as conn:
+            conn.execute(text(f"DROP TABLE {name}"))
+        logger.info(f"Dropped expired partition {name}")
+
+def _ensure_migrations_table():
+    with get_vector_engine().begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        ))
+
+def applied_migrations() -> set:
+    _ensure_migrations_table()
+    with get_vector_engine().connect() as conn:
+        return {row.name for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+
+def _run_steps(conn: Connection, migration: Migration):
+    for step in migration.steps:
+        if callable(step):
+            step(conn)
+        else:
+            conn.execute(text(step))
+
+def upgrade():
+    applied = applied_migrations()
+    for migration in MIGRATIONS:
+        if migration.name in applied:
+            continue
+        logger.info(f"Applying migration {migration.name}")
+        if migration.transactional:
+            connection = get_vector_engine().begin()
+        else:
+            connection = get_vector_engine().connect().execution_options(isolation_level="AUTOCOMMIT")
+        with connection as conn:
+            _run_steps(conn, migration)
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"),
+                         {"name": migration.name})
+    logger.info("Database schema is up to date")
+
+def status():
+    applied = applied_migrations()
+    for migration in MIGRATIONS:
+        state = "applied" if migration.name in applied else "pending"
+        print(f"{migration.name}: {state}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Manage the memory database schema")
+    parser.add_argument(
+        "command",
+        choices=[
+            "upgrade", "status", "compact-indexes", "drop-full-indexes", "partition", "partitions", "payload-compression"
+        ]
+    )
+    parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD,
+                        help="Monthly partitions to create ahead of time (partitions)")
+    parser.add_argument("--retention-months", type=int, default=None,
+                        help="Drop partitions entirely older than this many months (partitions)")
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE,
+                        help="Memories whose chunks and payloads are deleted per transaction (partitions)")
+    parser.add_argument("--batch-delay", type=float, default=RETENTION_BATCH_DELAY,
+                        help="Seconds to pause between retention batches (partitions)")
+    args = parser.parse_args()
+    if args.command == "upgrade":
+        upgrade()
+    elif args.command == "partition":
+        partition_memories()
+    elif args.command == "partitions":
+        maintain_partitions(args.months_ahead, args.retention_months, args.batch_size, args.batch_delay)
+    elif args.command == "compact-indexes":
+        # For switching VECTOR_STORAGE after migration 0013 has been applied
+        with get_vector_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            _create_compact_indexes(conn)
+    elif args.command == "drop-full-indexes":
+        with get_vector_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            drop_full_precision_indexes(conn)
+    elif args.command == "payload-compression":
+        # For switching PAYLOAD_COMPRESSION after migration 0015 has been applied
+        with get_vector_engine().begin() as conn:
+            _set_payload_compression(conn)
+    else:
+        status()
@@ -1,35 +1,67 @@
-from sqlalchemy import Column, String, Boolean, JSON, TIMESTAMP
+from sqlalchemy import Column, String, Boolean, JSON, TIMESTAMP, Integer, Float, Text, ForeignKey
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
 from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
 import uuid
-from database import vector_engine
 
 Base = declarative_base()
 
+# Weighted full-text document: title (A), overview (B) and transcript text (C)
+SEARCH_VECTOR_TEMPLATE = (
+    "setweight(to_tsvector('english', coalesce({structured}->>'title', '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce({structured}->>'overview', '')), 'B') || "
+    "setweight(jsonb_to_tsvector('english', "
+    "coalesce(jsonb_path_query_array({transcript_segments}, '$[*].text'), '[]'::jsonb), "
+    "'[\"string\"]'), 'C')"
+)
+SEARCH_VECTOR_EXPRESSION = SEARCH_VECTOR_TEMPLATE.format(structured="structured", transcript_segments="transcript_segments")
+
 class MemoryDB(Base):
     __tablename__ = "omi_memories"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(String, nullable=False)
-    created_at = Column(TIMESTAMP(timezone=True))
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
     started_at = Column(TIMESTAMP(timezone=True))
     finished_at = Column(TIMESTAMP(timezone=True))
     source = Column(String)
     language = Column(String)
     structured = Column(JSONB)
-    transcript_segments = Column(JSONB)
     geolocation = Column(JSONB, nullable=True)
-    photos = Column(JSONB)
-    plugins_results = Column(JSONB)
-    external_data = Column(JSONB, nullable=True)
     discarded = Column(Boolean, default=False)
     deleted = Column(Boolean, default=False)
     visibility = Column(String, default="private")
     processing_memory_id = Column(String, nullable=True)
     status = Column(String)
     embedding = Column(Vector(1536))
+    embedding_status = Column(String)  # pending / ready / failed, NULL for rows embedded inline
+    # Failed embedding attempts, and when the sweep may queue the memory next
+    embedding_attempts = Column(Integer, nullable=False, server_default="0")
+    embedding_retry_at = Column(TIMESTAMP(timezone=True))
+    content_hash = Column(String)  # fingerprint of the embedded text, see embeddings.content_hash
+    # Written together with the row, see queries.SEARCH_VECTOR_VALUE
+    search_vector = Column(TSVECTOR)
+
+class MemoryPayloadDB(Base):
+    """Large JSONB payloads of a memory, kept out of the rows that list and search scan."""
+    __tablename__ = "omi_memory_payloads"
 
-# When creating tables
-Base.metadata.create_all(bind=vector_engine)  # Use vector_engine instead of engine
\ No newline at end of file
+    memory_id = Column(UUID(as_uuid=True), ForeignKey("omi_memories.id", ondelete="CASCADE"), primary_key=True)
+    transcript_segments = Column(JSONB)
+    photos = Column(JSONB)
+    plugins_results = Column(JSONB)
+    external_data = Column(JSONB, nullable=True)
+
+class MemoryChunkDB(Base):
+    """Overlapping transcript window of a memory, embedded for chunk-level search."""
+    __tablename__ = "omi_memory_chunks"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    memory_id = Column(UUID(as_uuid=True), ForeignKey("omi_memories.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(String, nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    start = Column(Float)  # segment start time of the window, in seconds
+    end = Column(Float)
+    text = Column(Text, nullable=False)
+    embedding = Column(Vector(1536))
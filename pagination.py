@@ -0,0 +1,53 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, Tuple
+from uuid import UUID
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    """Pack keyset values into an opaque, URL-safe token."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+    if not isinstance(values, dict):
+        raise InvalidCursor("Malformed cursor")
+    return values
+
+def encode_memory_cursor(created_at: datetime, memory_id: UUID) -> str:
+    return encode_cursor({"created_at": created_at.isoformat(), "id": str(memory_id)})
+
+def decode_memory_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    values = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(values["created_at"]), UUID(values["id"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+
+def search_fingerprint(*parts: str) -> str:
+    """Short hash tying a search continuation token to the search that issued it."""
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
+
+def encode_search_cursor(fingerprint: str, position: float, memory_id: UUID) -> str:
+    """Token for the next page of a search ordered by ``(position, id)``."""
+    return encode_cursor({"q": fingerprint, "position": position, "id": str(memory_id)})
+
+def decode_search_cursor(cursor: str, fingerprint: str) -> Tuple[float, UUID]:
+    values = decode_cursor(cursor)
+    if values.get("q") != fingerprint:
+        raise InvalidCursor("Cursor belongs to a different search")
+    try:
+        return float(values["position"]), UUID(values["id"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidCursor("Malformed cursor") from e
@@ -25,6 +25,11 @@ class TranscriptSegment(BaseModel):
     end: Optional[float] = None
 
 class Memory(BaseModel):
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    source: Optional[str] = None
+    language: Optional[str] = None
     structured: Optional[Structured] = None
     transcript_segments: Optional[List[TranscriptSegment]] = None
     geolocation: Optional[Dict[str, Any]] = None
@@ -35,4 +40,46 @@ class Memory(BaseModel):
     deleted: Optional[bool] = False
     visibility: Optional[str] = "private"
     processing_memory_id: Optional[str] = None
-    status: Optional[str] = "completed"
\ No newline at end of file
+    status: Optional[str] = "completed"
+
+class MemorySummary(BaseModel):
+    id: UUID
+    created_at: datetime
+    structured: Optional[Structured] = None
+    status: Optional[str] = None
+    transcript_segments: Optional[List[TranscriptSegment]] = None
+
+class SearchResult(MemorySummary):
+    match_start: Optional[float] = None
+    match_end: Optional[float] = None
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    limit: int = 5
+    dedupe: bool = False
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    started_after: Optional[datetime] = None
+    finished_before: Optional[datetime] = None
+    category: Optional[str] = None
+    has_action_items: Optional[bool] = None
+    event: Optional[str] = None
+    source: Optional[str] = None
+    language: Optional[str] = None
+
+class BatchSearchResult(BaseModel):
+    query: str
+    memories: List[SearchResult]
+
+class RelatedMemory(SearchResult):
+    similarity: float
+
+class NearDuplicates(BaseModel):
+    id: UUID
+    duplicates: List[RelatedMemory]
+
+class MemoryDetail(MemorySummary):
+    plugins_results: Optional[List[Dict[str, Any]]] = None
+    external_data: Optional[Dict[str, Any]] = None
+    geolocation: Optional[Dict[str, Any]] = None
+    photos: Optional[List[str]] = None
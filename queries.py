@@ -0,0 +1,610 @@
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import (
+    Float, Text, and_, bindparam, case, cast, desc, exists, func, literal, literal_column, null, or_, select, text, true,
+    tuple_, union_all, update
+)
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import Insert, Select, Update
+
+from embedding_queue import EMBEDDING_FAILED, EMBEDDING_PENDING, EMBEDDING_READY
+from models import MemoryDB, MemoryChunkDB, MemoryPayloadDB, SEARCH_VECTOR_TEMPLATE
+
+# Columns returned by list and search; the embedding and large JSONB
+# payloads are never loaded unless a response needs them
+SUMMARY_COLUMNS = (MemoryDB.id, MemoryDB.created_at, MemoryDB.structured, MemoryDB.status)
+# Selecting payload columns requires join_payloads
+DETAIL_COLUMNS = (
+    MemoryDB.id,
+    MemoryDB.created_at,
+    MemoryDB.structured,
+    MemoryPayloadDB.transcript_segments,
+    MemoryPayloadDB.plugins_results,
+    MemoryPayloadDB.external_data,
+    MemoryDB.geolocation,
+    MemoryPayloadDB.photos,
+    MemoryDB.status,
+)
+# Memory fields stored in omi_memory_payloads rather than omi_memories
+PAYLOAD_COLUMNS = ("transcript_segments", "plugins_results", "photos", "external_data")
+
+# Nearest chunks fetched per requested result before aggregating to memories
+SEARCH_CHUNK_OVERSAMPLE = int(os.getenv("SEARCH_CHUNK_OVERSAMPLE", "4"))
+
+# Compact index searched before exact re-ranking: vector (full precision),
+# halfvec or binary; must match the index built by the migrations
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "vector")
+VECTOR_STORAGES = ("vector", "halfvec", "binary")
+# Compact-index candidates fetched per result that is re-ranked exactly
+RERANK_OVERSAMPLE = int(os.getenv("RERANK_OVERSAMPLE", "4"))
+
+# pgvector 0.8+ iterative index scans for vector searches: strict_order,
+# relaxed_order or off (for older pgvector). Relaxed order is safe here
+# since every search re-sorts its candidates by exact distance.
+VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN", "relaxed_order")
+
+# Set to "monthly" once omi_memories is range partitioned on created_at
+# (python migrations.py partition); unique indexes then include created_at
+MEMORY_PARTITIONING = os.getenv("MEMORY_PARTITIONING", "none")
+
+# Hybrid search: depth of each candidate list and the reciprocal rank fusion constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "40"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Text search configuration of the search_vector column
+FULLTEXT_CONFIG = "english"
+
+# search_vector of a memory as it is written, computed in the same statement
+# from the search_structured and search_transcript parameters (see search_params)
+SEARCH_VECTOR_VALUE = text(SEARCH_VECTOR_TEMPLATE.format(
+    structured="CAST(:search_structured AS jsonb)",
+    transcript_segments="CAST(:search_transcript AS jsonb)",
+)).bindparams(bindparam("search_structured", type_=JSONB), bindparam("search_transcript", type_=JSONB))
+
+# Columns an ingest retry overwrites; created_at and the id of the first delivery are kept
+UPSERT_COLUMNS = (
+    "started_at",
+    "finished_at",
+    "source",
+    "language",
+    "structured",
+    "geolocation",
+    "discarded",
+    "deleted",
+    "visibility",
+    "status",
+    "search_vector",
+)
+
+def _as_utc(value: datetime) -> datetime:
+    # Dates without a zone are taken as UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def structured_field(key: str, as_text: bool = True):
+    # The key is inlined rather than bound so the expression matches the
+    # indexes built by the migrations under generic plans too
+    if as_text:
+        return MemoryDB.structured.op("->>", return_type=Text)(literal_column(f"'{key}'"))
+    return MemoryDB.structured.op("->", return_type=JSONB)(literal_column(f"'{key}'"))
+
+# Matches the predicate of the partial action items index
+HAS_ACTION_ITEMS = structured_field("actionItems", as_text=False) != literal_column("'[]'::jsonb")
+
+def memory_filters(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    started_after: Optional[datetime] = None,
+    finished_before: Optional[datetime] = None,
+    category: Optional[str] = None,
+    has_action_items: Optional[bool] = None,
+    event: Optional[str] = None,
+    source: Optional[str] = None,
+    language: Optional[str] = None,
+) -> List:
+    """Conditions on MemoryDB shared by list and search.
+
+    ``start_date`` is inclusive and ``end_date`` exclusive on created_at, so
+    consecutive ranges don't overlap and partitions outside them are pruned.
+    ``event`` matches memories with an event of exactly that title.
+    """
+    filters = []
+    if start_date is not None:
+        filters.append(MemoryDB.created_at >= _as_utc(start_date))
+    if end_date is not None:
+        filters.append(MemoryDB.created_at < _as_utc(end_date))
+    if started_after is not None:
+        filters.append(MemoryDB.started_at >= _as_utc(started_after))
+    if finished_before is not None:
+        filters.append(MemoryDB.finished_at <= _as_utc(finished_before))
+    if category is not None:
+        filters.append(structured_field("category") == category)
+    if has_action_items is True:
+        filters.append(HAS_ACTION_ITEMS)
+    elif has_action_items is False:
+        filters.append(or_(structured_field("actionItems", as_text=False).is_(None), ~HAS_ACTION_ITEMS))
+    if event is not None:
+        # Containment, served by the jsonb_path_ops GIN index on structured
+        filters.append(MemoryDB.structured.contains({"events": [{"title": event}]}))
+    if source is not None:
+        filters.append(MemoryDB.source == source)
+    if language is not None:
+        filters.append(MemoryDB.language == language)
+    return filters
+
+def scan_settings(ef_search: Optional[int] = None, probes: Optional[int] = None, iterative: bool = True) -> Dict[str, str]:
+    """ANN settings for one search, to be applied with set_config for its transaction.
+
+    Every vector search filters at least by user, so the index scan keeps
+    going until enough rows pass the filters instead of filtering a fixed
+    top-k; without it other users' neighbours leave pages short.
+    """
+    settings = {}
+    if ef_search is not None:
+        settings["hnsw.ef_search"] = str(ef_search)
+    if probes is not None:
+        settings["ivfflat.probes"] = str(probes)
+    if iterative and VECTOR_ITERATIVE_SCAN != "off":
+        settings["hnsw.iterative_scan"] = VECTOR_ITERATIVE_SCAN
+        # IVFFlat only supports relaxed ordering
+        settings["ivfflat.iterative_scan"] = "relaxed_order"
+    return settings
+
+def search_params(memory_data: dict) -> dict:
+    """Parameters of SEARCH_VECTOR_VALUE for a memory's column values, payload included."""
+    return {
+        "search_structured": memory_data.get("structured"),
+        "search_transcript": memory_data.get("transcript_segments"),
+    }
+
+def insert_memories() -> Insert:
+    """Insert memories with their search_vector; each row also needs its search_params."""
+    return pg_insert(MemoryDB).values(search_vector=SEARCH_VECTOR_VALUE)
+
+def upsert_memories() -> Insert:
+    """Insert memories, updating the existing row for a repeated processing_memory_id.
+
+    When the content hash is unchanged, the stored embedding is ready and
+    the new row carries no embedding, the stored embedding and its status are
+    kept, so a retried delivery costs no embedding call. A pending or failed
+    row takes the new status instead. Rows without a processing_memory_id
+    never conflict.
+    """
+    statement = insert_memories()
+    excluded = statement.excluded
+    unchanged = and_(
+        MemoryDB.content_hash == excluded.content_hash,
+        excluded.embedding.is_(None),
+        # NULL marks rows embedded inline, before the status existed
+        func.coalesce(MemoryDB.embedding_status, EMBEDDING_READY) == EMBEDDING_READY,
+    )
+    # A partitioned table can only enforce uniqueness together with the
+    # partition key; callers reuse the stored created_at of a redelivery
+    index_elements = [MemoryDB.user_id, MemoryDB.processing_memory_id]
+    if MEMORY_PARTITIONING != "none":
+        index_elements.append(MemoryDB.created_at)
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        index_where=MemoryDB.processing_memory_id.isnot(None),
+        set_={
+            **{column: excluded[column] for column in UPSERT_COLUMNS},
+            "content_hash": excluded.content_hash,
+            "embedding": case((unchanged, MemoryDB.embedding), else_=excluded.embedding),
+            "embedding_status": case((unchanged, MemoryDB.embedding_status), else_=excluded.embedding_status),
+            "embedding_attempts": case((unchanged, MemoryDB.embedding_attempts), else_=excluded.embedding_attempts),
+            "embedding_retry_at": case((unchanged, MemoryDB.embedding_retry_at), else_=excluded.embedding_retry_at),
+        }
+    )
+
+def claim_due_embeddings(limit: int, max_attempts: int, grace: float) -> Update:
+    """Claim memories whose embedding is due, returning what is needed to queue them.
+
+    Due are memories still pending past their ``embedding_retry_at`` (the
+    ingest's queue was full or its worker stopped) and failed ones whose
+    backoff has passed. Claimed rows are pushed back by ``grace`` seconds,
+    and rows another sweep holds are skipped, so a memory is claimed once.
+    """
+    due = select(MemoryDB.id).where(
+        # Matches the predicate of ix_omi_memories_embedding_retry
+        text(f"embedding_status IN ('{EMBEDDING_PENDING}', '{EMBEDDING_FAILED}')"),
+        or_(MemoryDB.embedding_retry_at.is_(None), MemoryDB.embedding_retry_at <= func.now()),
+        MemoryDB.embedding_attempts < max_attempts,
+    ).order_by(MemoryDB.embedding_retry_at.asc().nulls_first()).limit(limit).with_for_update(skip_locked=True)
+    return update(MemoryDB).where(MemoryDB.id.in_(due.scalar_subquery())).values(
+        embedding_retry_at=func.now() + func.make_interval(0, 0, 0, 0, 0, 0, literal(grace, Float))
+    ).returning(MemoryDB.id, MemoryDB.user_id, MemoryDB.structured, MemoryDB.content_hash)
+
+def split_payload(memory_data: dict) -> Tuple[dict, dict]:
+    """Separate a memory's column values into those of omi_memories and of omi_memory_payloads."""
+    memory = {key: value for key, value in memory_data.items() if key not in PAYLOAD_COLUMNS}
+    payload = {key: memory_data.get(key) for key in PAYLOAD_COLUMNS}
+    return memory, payload
+
+def upsert_payloads() -> Insert:
+    """Insert payloads, replacing those of a memory that is stored again.
+
+    Write a memory's payload after its omi_memories row, whose foreign key it references.
+    """
+    statement = pg_insert(MemoryPayloadDB)
+    return statement.on_conflict_do_update(
+        index_elements=[MemoryPayloadDB.memory_id],
+        set_={column: statement.excluded[column] for column in PAYLOAD_COLUMNS}
+    )
+
+def join_payloads(query: Select) -> Select:
+    """Add the payloads of the selected memories, for queries selecting payload columns."""
+    return query.outerjoin(MemoryPayloadDB, MemoryPayloadDB.memory_id == MemoryDB.id)
+
+def existing_memories(user_id: str, processing_memory_ids: Sequence[str]) -> Select:
+    """Ids, creation times, content hashes and embedding statuses stored for these processing_memory_ids."""
+    return select(
+        MemoryDB.id, MemoryDB.processing_memory_id, MemoryDB.created_at, MemoryDB.content_hash,
+        MemoryDB.embedding_status
+    ).where(
+        MemoryDB.user_id == user_id,
+        MemoryDB.processing_memory_id.in_(processing_memory_ids)
+    )
+
+def query_vector_param(query_embedding: Sequence[float]):
+    # One bound parameter so the vector is sent once however often it is used
+    return bindparam("query_vector", query_embedding, type_=Vector(1536))
+
+def compact_distance(embedding, query_vector, storage: str):
+    """Distance on the compact representation, matching the expression index."""
+    query_vector = cast(query_vector, Vector(1536))
+    if storage == "halfvec":
+        return cast(embedding, HALFVEC(1536)).cosine_distance(cast(query_vector, HALFVEC(1536)))
+    if storage == "binary":
+        return cast(func.binary_quantize(embedding), BIT(1536)).hamming_distance(func.binary_quantize(query_vector))
+    raise ValueError(f"Unsupported VECTOR_STORAGE: {storage}")
+
+def _nearest(hits: Select, embedding, query_vector, limit: int, floor: Optional[float], storage: str):
+    """Order ``hits`` by exact ``distance``, scanning the compact index first if configured."""
+    distance = embedding.cosine_distance(query_vector)
+    hits = hits.add_columns(distance.label("distance")).where(embedding.isnot(None))
+    if floor is not None:
+        hits = hits.where(distance >= floor)
+    # Order by distance alone so the ANN index can serve the scan; the floor
+    # of later pages is applied during the scan, which keeps iterating until
+    # the limit is met (see scan_settings), and ties are broken by the caller
+    if storage == "vector":
+        return hits.order_by(distance).limit(limit)
+    candidates = hits.order_by(
+        compact_distance(embedding, query_vector, storage)
+    ).limit(limit * RERANK_OVERSAMPLE).subquery()
+    return select(candidates).order_by(candidates.c.distance).limit(limit)
+
+def _best_vector_hits(
+    user_id: str,
+    query_vector,
+    candidate_limit: int,
+    floor: Optional[float] = None,
+    storage: str = VECTOR_STORAGE,
+    filters: Sequence = (),
+    outer: Sequence = (),
+):
+    """Nearest chunks and memory embeddings, ranked per memory by distance.
+
+    Memory-level embeddings also cover memories without chunks. Rows with
+    ``rank == 1`` are each memory's best hit. ``filters`` are conditions on
+    MemoryDB; chunks are checked against their memory. ``outer`` names the
+    enclosing FROM a ``query_vector`` column comes from, for LATERAL use.
+    """
+    chunk_hits = select(
+        MemoryChunkDB.memory_id.label("memory_id"),
+        MemoryChunkDB.start.label("match_start"),
+        MemoryChunkDB.end.label("match_end"),
+    ).where(
+        MemoryChunkDB.user_id == user_id
+    )
+    memory_hits = select(
+        MemoryDB.id.label("memory_id"),
+        cast(null(), Float).label("match_start"),
+        cast(null(), Float).label("match_end"),
+    ).where(
+        MemoryDB.user_id == user_id,
+        *filters
+    )
+    if filters:
+        chunk_hits = chunk_hits.where(
+            exists().where(MemoryDB.id == MemoryChunkDB.memory_id, *filters)
+        )
+    if outer:
+        chunk_hits = chunk_hits.correlate(*outer)
+        memory_hits = memory_hits.correlate(*outer)
+
+    candidates = union_all(
+        _nearest(chunk_hits, MemoryChunkDB.embedding, query_vector, candidate_limit, floor, storage),
+        _nearest(memory_hits, MemoryDB.embedding, query_vector, candidate_limit, floor, storage),
+    ).subquery("candidates")
+
+    return _best_per_memory(candidates)
+
+def _best_per_memory(candidates):
+    """Rank ``candidates`` hits per memory by distance; ``rank == 1`` is each memory's best."""
+    return select(
+        candidates,
+        func.row_number().over(
+            partition_by=candidates.c.memory_id,
+            order_by=candidates.c.distance
+        ).label("rank")
+    ).subquery("best")
+
+def vector_search(
+    user_id: str,
+    query_embedding: Sequence[float],
+    limit: int,
+    after: Optional[Tuple[float, UUID]] = None,
+    storage: str = VECTOR_STORAGE,
+    filters: Sequence = (),
+) -> Select:
+    """Rank a user's memories by their closest transcript chunk or memory embedding.
+
+    Rows carry ``distance`` and the time span of the matching chunk as
+    ``match_start``/``match_end`` (NULL when the memory as a whole matched
+    best). ``after`` continues from the last ``(distance, id)`` of a
+    previous page. With a compact ``storage`` the distances are still exact:
+    candidates from the compact index are re-ranked on the full vectors.
+    """
+    return _ranked_memories(user_id, query_vector_param(query_embedding), limit, after, storage, filters)
+
+def _ranked_memories(
+    user_id: str,
+    query_vector,
+    limit: int,
+    after: Optional[Tuple[float, UUID]] = None,
+    storage: str = VECTOR_STORAGE,
+    filters: Sequence = (),
+    outer: Sequence = (),
+) -> Select:
+    best = _best_vector_hits(
+        user_id, query_vector, limit * SEARCH_CHUNK_OVERSAMPLE, after[0] if after else None, storage, filters, outer
+    )
+
+    statement = select(
+        *SUMMARY_COLUMNS,
+        best.c.distance,
+        best.c.match_start,
+        best.c.match_end,
+    ).select_from(MemoryDB).join(
+        best, best.c.memory_id == MemoryDB.id
+    ).where(
+        best.c.rank == 1,
+        MemoryDB.user_id == user_id,
+        *filters
+    )
+
+    if after:
+        # Memories whose best hit lies before the cursor were on an earlier page
+        earlier_chunk = aliased(MemoryChunkDB)
+        statement = statement.where(
+            tuple_(best.c.distance, MemoryDB.id) > tuple_(*after),
+            ~exists().where(
+                earlier_chunk.memory_id == MemoryDB.id,
+                earlier_chunk.embedding.cosine_distance(query_vector) < after[0]
+            ),
+            or_(MemoryDB.embedding.is_(None), MemoryDB.embedding.cosine_distance(query_vector) >= after[0])
+        )
+
+    # Ties on distance are broken by id, matching the cursor, so pages
+    # neither repeat nor skip memories at equal distance
+    return statement.order_by(best.c.distance, MemoryDB.id).limit(limit)
+
+def rescore_memories(user_id: str, query_embedding: Sequence[float], memory_ids: Sequence) -> Select:
+    """Rank the given memories exactly as ``vector_search`` would, without an index scan.
+
+    Used for the candidates of the in-process vector cache, so their
+    distances, and the cursor built from the last one, are those the next
+    page's SQL search continues from.
+    """
+    query_vector = query_vector_param(query_embedding)
+    chunk_hits = select(
+        MemoryChunkDB.memory_id.label("memory_id"),
+        MemoryChunkDB.start.label("match_start"),
+        MemoryChunkDB.end.label("match_end"),
+        MemoryChunkDB.embedding.cosine_distance(query_vector).label("distance"),
+    ).where(
+        MemoryChunkDB.user_id == user_id,
+        MemoryChunkDB.memory_id.in_(memory_ids),
+        MemoryChunkDB.embedding.isnot(None)
+    )
+    memory_hits = select(
+        MemoryDB.id.label("memory_id"),
+        cast(null(), Float).label("match_start"),
+        cast(null(), Float).label("match_end"),
+        MemoryDB.embedding.cosine_distance(query_vector).label("distance"),
+    ).where(
+        MemoryDB.user_id == user_id,
+        MemoryDB.id.in_(memory_ids),
+        MemoryDB.embedding.isnot(None)
+    )
+    best = _best_per_memory(union_all(chunk_hits, memory_hits).subquery("candidates"))
+
+    return select(
+        *SUMMARY_COLUMNS,
+        best.c.distance,
+        best.c.match_start,
+        best.c.match_end,
+    ).select_from(MemoryDB).join(
+        best, best.c.memory_id == MemoryDB.id
+    ).where(
+        best.c.rank == 1,
+        MemoryDB.user_id == user_id
+    ).order_by(best.c.distance, MemoryDB.id)
+
+def batch_vector_search(
+    user_id: str,
+    query_embeddings: Sequence[Sequence[float]],
+    limit: int,
+    dedupe: bool = False,
+    storage: str = VECTOR_STORAGE,
+    filters: Sequence = (),
+) -> Select:
+    """Vector search for several queries of one user in a single statement.
+
+    The query vectors form a derived table that a LATERAL subquery runs the
+    single-query ranking against, so every query is served by the same ANN
+    scans as ``vector_search``. Rows carry the ``query_index`` they answer
+    and come back grouped by query, nearest first. With ``dedupe`` a memory
+    is only returned for the query it is closest to; each query then ranks
+    deeper so it can still fill ``limit``.
+    """
+    queries = union_all(*(
+        select(
+            literal(index).label("query_index"),
+            cast(bindparam(f"query_vector_{index}", embedding, type_=Vector(1536)), Vector(1536)).label("query_vector"),
+        )
+        for index, embedding in enumerate(query_embeddings)
+    )).subquery("queries")
+
+    depth = limit * len(query_embeddings) if dedupe else limit
+    ranked = _ranked_memories(
+        user_id, queries.c.query_vector, depth, storage=storage, filters=filters, outer=[queries]
+    ).lateral("ranked")
+    hits = select(queries.c.query_index, ranked).select_from(queries.join(ranked, true()))
+    if not dedupe:
+        return hits.order_by(queries.c.query_index, ranked.c.distance, ranked.c.id)
+
+    hits = hits.add_columns(
+        func.row_number().over(
+            partition_by=ranked.c.id, order_by=(ranked.c.distance, queries.c.query_index)
+        ).label("closest")
+    ).subquery("hits")
+    unique = select(hits).where(hits.c.closest == 1).subquery("unique_hits")
+    positioned = select(
+        unique,
+        func.row_number().over(
+            partition_by=unique.c.query_index, order_by=(unique.c.distance, unique.c.id)
+        ).label("position")
+    ).subquery("positioned")
+    columns = [column for column in positioned.c if column.name not in ("closest", "position")]
+    return select(*columns).where(
+        positioned.c.position <= limit
+    ).order_by(positioned.c.query_index, positioned.c.distance, positioned.c.id)
+
+def related_memories(
+    user_id: str,
+    sources: Select,
+    limit: int,
+    max_distance: Optional[float] = None,
+    storage: str = VECTOR_STORAGE,
+    filters: Sequence = (),
+    keep_sources: bool = False,
+) -> Select:
+    """Nearest memories to stored memories, searched with their own embeddings.
+
+    ``sources`` selects the ``id``, ``created_at`` and ``embedding`` of the
+    memories to start from. Each one runs the single-query ranking through a
+    LATERAL subquery, so nothing is embedded and one statement serves every
+    source. A memory never matches itself, and sources still waiting for
+    their embedding match nothing. Rows carry ``source_id`` and come back
+    newest source first, nearest match first. With ``keep_sources`` a source
+    without matches still yields one row whose memory columns are NULL.
+    """
+    source = sources.subquery("sources")
+    nearest = _ranked_memories(
+        user_id, source.c.embedding, limit + 1, storage=storage, filters=filters, outer=[source]
+    ).subquery("nearest")
+    neighbours = select(nearest).where(nearest.c.id != source.c.id, source.c.embedding.isnot(None))
+    if max_distance is not None:
+        neighbours = neighbours.where(nearest.c.distance <= max_distance)
+    ranked = neighbours.order_by(nearest.c.distance, nearest.c.id).limit(limit).correlate(source).lateral("ranked")
+
+    join = source.outerjoin(ranked, true()) if keep_sources else source.join(ranked, true())
+    return select(source.c.id.label("source_id"), ranked).select_from(join).order_by(
+        desc(source.c.created_at), source.c.id, ranked.c.distance, ranked.c.id
+    )
+
+def _text_match(query_text: str):
+    tsquery = func.websearch_to_tsquery(FULLTEXT_CONFIG, query_text)
+    return MemoryDB.search_vector.op("@@")(tsquery), func.ts_rank_cd(MemoryDB.search_vector, tsquery)
+
+def lexical_search(
+    user_id: str,
+    query_text: str,
+    limit: int,
+    after: Optional[Tuple[float, UUID]] = None,
+    filters: Sequence = (),
+) -> Select:
+    """Full-text search over title, overview and transcript, best ``score`` first."""
+    matches, rank = _text_match(query_text)
+    statement = select(
+        *SUMMARY_COLUMNS,
+        rank.label("score"),
+        cast(null(), Float).label("match_start"),
+        cast(null(), Float).label("match_end"),
+    ).where(
+        MemoryDB.user_id == user_id,
+        matches,
+        *filters
+    )
+    if after:
+        statement = statement.where(tuple_(rank, MemoryDB.id) < tuple_(*after))
+    return statement.order_by(rank.desc(), MemoryDB.id.desc()).limit(limit)
+
+def hybrid_search(
+    user_id: str,
+    query_embedding: Sequence[float],
+    query_text: str,
+    limit: int,
+    after: Optional[Tuple[float, UUID]] = None,
+    filters: Sequence = (),
+) -> Select:
+    """Merge the vector and full-text rankings with reciprocal rank fusion.
+
+    Each side contributes its top ``HYBRID_CANDIDATES`` memories and a memory
+    scores ``1 / (RRF_K + rank)`` per list it appears in. Both lists are
+    computed in the same statement, highest ``score`` first.
+    """
+    query_vector = query_vector_param(query_embedding)
+    best = _best_vector_hits(user_id, query_vector, HYBRID_CANDIDATES, filters=filters)
+    vector_ranked = select(
+        best.c.memory_id,
+        best.c.match_start,
+        best.c.match_end,
+        func.row_number().over(order_by=(best.c.distance, best.c.memory_id)).label("position"),
+    ).where(
+        best.c.rank == 1
+    ).order_by(best.c.distance, best.c.memory_id).limit(HYBRID_CANDIDATES).subquery("vector_ranked")
+
+    matches, rank = _text_match(query_text)
+    lexical_ranked = select(
+        MemoryDB.id.label("memory_id"),
+        func.row_number().over(order_by=rank.desc()).label("position"),
+    ).where(
+        MemoryDB.user_id == user_id,
+        matches,
+        *filters
+    ).order_by(rank.desc()).limit(HYBRID_CANDIDATES).subquery("lexical_ranked")
+
+    fused = select(
+        func.coalesce(vector_ranked.c.memory_id, lexical_ranked.c.memory_id).label("memory_id"),
+        vector_ranked.c.match_start,
+        vector_ranked.c.match_end,
+        (
+            func.coalesce(1.0 / (RRF_K + cast(vector_ranked.c.position, Float)), 0.0)
+            + func.coalesce(1.0 / (RRF_K + cast(lexical_ranked.c.position, Float)), 0.0)
+        ).label("score"),
+    ).select_from(
+        vector_ranked.join(
+            lexical_ranked, vector_ranked.c.memory_id == lexical_ranked.c.memory_id, full=True
+        )
+    ).subquery("fused")
+
+    statement = select(
+        *SUMMARY_COLUMNS,
+        fused.c.score,
+        fused.c.match_start,
+        fused.c.match_end,
+    ).select_from(MemoryDB).join(
+        fused, fused.c.memory_id == MemoryDB.id
+    ).where(
+        MemoryDB.user_id == user_id
+    )
+    if after:
+        statement = statement.where(tuple_(fused.c.score, MemoryDB.id) < tuple_(*after))
+    return statement.order_by(fused.c.score.desc(), MemoryDB.id.desc()).limit(limit)
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from chunking import chunk_transcript, transcript_windows
+
+logger = logging.getLogger(__name__)
+
+class TranscriptSession:
+    """Segments buffered for one live conversation plus the windows embedded so far."""
+
+    def __init__(self, user_id: str, session_id: str):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.segments: List[Dict[str, Any]] = []
+        self.bytes = 0
+        self.last_seen = time.monotonic()
+        self.lock = asyncio.Lock()
+        # chunk_index -> embedding for windows that can no longer change
+        self.embedded: Dict[int, List[float]] = {}
+        # Segment offset and chunk_index of the last, still open window
+        self.open_start = 0
+        self.open_index = 0
+        self.tasks: List[asyncio.Task] = []
+
+class TranscriptSessionStore:
+    """Per-session incremental assembly of realtime transcripts.
+
+    Segments are buffered in memory. Every transcript window that is closed
+    (a later window has started) is embedded in the background as soon as it
+    exists. When a session ends, goes idle, or outgrows its buffer, it is
+    handed to ``finalize(user_id, session_id, segments, windows)`` where
+    ``windows`` pairs every transcript window with its embedding, or
+    ``None`` when it has not been embedded yet.
+    """
+
+    def __init__(
+        self,
+        embed_texts: Callable[[List[str]], Awaitable[List[List[float]]]],
+        finalize: Callable[[str, str, List[Dict[str, Any]], List[Tuple[Dict[str, Any], Optional[List[float]]]]], Awaitable[Any]],
+        max_segments: int = 5000,
+        max_bytes: int = 1024 * 1024,
+        max_sessions: int = 1000,
+        idle_timeout: float = 120.0,
+    ):
+        self.embed_texts = embed_texts
+        self.finalize = finalize
+        self.max_segments = max_segments
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[Tuple[str, str], TranscriptSession] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        self.finalized = 0
+        self.evicted = 0
+
+    async def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep(), name="realtime-session-sweeper")
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        # Persist whatever is still buffered rather than dropping it
+        for user_id, session_id in list(self._sessions):
+            try:
+                await self.end(user_id, session_id)
+            except Exception as e:
+                logger.error(f"Error finalizing session {session_id} on shutdown: {e}", exc_info=True)
+
+    async def add_segments(self, user_id: str, session_id: str, segments: List[Dict[str, Any]]) -> int:
+        """Buffer new segments and return how many the session now holds."""
+        key = (user_id, session_id)
+        while True:
+            session = self._sessions.get(key)
+            if session is None:
+                if len(self._sessions) >= self.max_sessions:
+                    await self._evict_least_recent()
+                session = self._sessions.setdefault(key, TranscriptSession(user_id, session_id))
+            await session.lock.acquire()
+            if self._sessions.get(key) is session:
+                break
+            # The session was finalized while we waited; start a new one
+            session.lock.release()
+
+        try:
+            for segment in segments:
+                if not segment.get("text"):
+                    continue
+                session.segments.append(segment)
+                session.bytes += len(segment["text"].encode("utf-8"))
+            session.last_seen = time.monotonic()
+            self._embed_closed_windows(session)
+            count = len(session.segments)
+            full = count >= self.max_segments or session.bytes >= self.max_bytes
+        finally:
+            session.lock.release()
+
+        if full:
+            # Roll over: store what we have as one memory and start a fresh buffer
+            await self.end(user_id, session_id)
+        return count
+
+    async def end(self, user_id: str, session_id: str) -> Any:
+        """Finalize a session into a memory; returns the finalize result or None."""
+        session = self._sessions.pop((user_id, session_id), None)
+        if session is None:
+            return None
+        async with session.lock:
+            await asyncio.gather(*session.tasks, return_exceptions=True)
+            if not session.segments:
+                return None
+            windows = [
+                (chunk, session.embedded.get(chunk["chunk_index"]))
+                for chunk in chunk_transcript(session.segments)
+            ]
+            self.finalized += 1
+            return await self.finalize(user_id, session_id, session.segments, windows)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "buffered_segments": sum(len(s.segments) for s in self._sessions.values()),
+            "buffered_bytes": sum(s.bytes for s in self._sessions.values()),
+            "finalized": self.finalized,
+            "evicted": self.evicted,
+        }
+
+    def _embed_closed_windows(self, session: TranscriptSession):
+        # Windows are built greedily from the start, so all but the last are
+        # final and only the segments from the open window on are chunked again
+        tail = session.segments[session.open_start:]
+        windows = transcript_windows(tail)
+        if len(windows) < 2:
+            return
+        new = chunk_transcript(tail, first_index=session.open_index)[:-1]
+        session.open_start += windows[-1][0]
+        session.open_index += len(new)
+        task = asyncio.create_task(self._embed_windows(session, new))
+        session.tasks = [t for t in session.tasks if not t.done()] + [task]
+
+    async def _embed_windows(self, session: TranscriptSession, chunks: List[Dict[str, Any]]):
+        try:
+            embeddings = await self.embed_texts([chunk["text"] for chunk in chunks])
+        except Exception as e:
+            # Left for finalization to embed again
+            logger.warning(f"Incremental embedding for session {session.session_id} failed: {e}")
+            return
+        for chunk, embedding in zip(chunks, embeddings):
+            session.embedded[chunk["chunk_index"]] = embedding
+
+    async def _evict_least_recent(self):
+        user_id, session_id = min(self._sessions, key=lambda key: self._sessions[key].last_seen)
+        self.evicted += 1
+        try:
+            await self.end(user_id, session_id)
+        except Exception as e:
+            logger.error(f"Error finalizing evicted session {session_id}: {e}", exc_info=True)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 4))
+            cutoff = time.monotonic() - self.idle_timeout
+            for key, session in list(self._sessions.items()):
+                if session.last_seen < cutoff:
+                    try:
+                        await self.end(*key)
+                    except Exception as e:
+                        logger.error(f"Error finalizing idle session {key[1]}: {e}", exc_info=True)
+
+def parse_segments(payload: Any) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """Accept either ``{"session_id": ..., "segments": [...]}`` or a bare segment list."""
+    if isinstance(payload, (str, bytes)):
+        payload = json.loads(payload)
+    if isinstance(payload, list):
+        return None, payload
+    if isinstance(payload, dict) and isinstance(payload.get("segments"), list):
+        return payload.get("session_id"), payload["segments"]
+    raise ValueError("Expected a list of transcript segments")
@@ -0,0 +1,80 @@
+"""Compare recall and latency of the vector storage modes.
+
+Usage:
+    python recall.py --queries 200 --k 10 --storages vector halfvec binary
+
+Stored memory embeddings are sampled as queries. For each query the exact
+ranking (sequential scan, no ANN index) is the ground truth; every storage
+mode is then timed and scored by recall@k against it. One JSON object per
+mode is printed so runs can be compared. Modes other than ``vector`` need
+their indexes (``python migrations.py compact-indexes``).
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+from sqlalchemy import func, select, text
+
+import queries
+from database import AsyncSessionLocal
+from models import MemoryDB
+from queries import vector_search
+
+async def sample_queries(count: int):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(MemoryDB.user_id, MemoryDB.embedding)
+            .where(MemoryDB.embedding.isnot(None))
+            .order_by(func.random())
+            .limit(count)
+        )
+        return result.all()
+
+async def run_search(user_id, embedding, k, storage, ef_search=None, exact=False):
+    async with AsyncSessionLocal() as db:
+        if exact:
+            await db.execute(text("SELECT set_config('enable_indexscan', 'off', true)"))
+            await db.execute(text("SELECT set_config('enable_bitmapscan', 'off', true)"))
+        if ef_search is not None:
+            await db.execute(text("SELECT set_config('hnsw.ef_search', :value, true)"), {"value": str(ef_search)})
+        started = time.perf_counter()
+        rows = (await db.execute(vector_search(user_id, embedding, k, storage=storage))).all()
+        elapsed = time.perf_counter() - started
+    return [row.id for row in rows], elapsed
+
+async def main(args):
+    queries.RERANK_OVERSAMPLE = args.oversample
+    samples = await sample_queries(args.queries)
+    truth = []
+    for user_id, embedding in samples:
+        ids, _ = await run_search(user_id, embedding, args.k, "vector", exact=True)
+        truth.append(set(ids))
+
+    for storage in args.storages:
+        recalls, latencies = [], []
+        for (user_id, embedding), expected in zip(samples, truth):
+            ids, elapsed = await run_search(user_id, embedding, args.k, storage, args.ef_search)
+            latencies.append(elapsed * 1000)
+            if expected:
+                recalls.append(len(expected.intersection(ids)) / len(expected))
+        print(json.dumps({
+            "storage": storage,
+            "queries": len(samples),
+            "k": args.k,
+            "oversample": args.oversample,
+            "ef_search": args.ef_search,
+            "recall": round(float(np.mean(recalls)), 4) if recalls else None,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2) if latencies else None,
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2) if latencies else None,
+        }))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall vs latency of the vector storage modes")
+    parser.add_argument("--queries", type=int, default=100, help="Stored embeddings sampled as queries")
+    parser.add_argument("--k", type=int, default=10, help="Results compared per query")
+    parser.add_argument("--storages", nargs="+", choices=queries.VECTOR_STORAGES, default=list(queries.VECTOR_STORAGES))
+    parser.add_argument("--oversample", type=int, default=queries.RERANK_OVERSAMPLE, help="Compact candidates per re-ranked result")
+    parser.add_argument("--ef-search", type=int, default=None, help="hnsw.ef_search for the indexed searches")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,50 @@
+from typing import Any, AsyncIterable, AsyncIterator, Optional
+
+import orjson
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+
+from cache import CachedResponse
+from metrics import stage
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Rows fetched per round trip when streaming from a server-side cursor
+STREAM_BATCH_SIZE = 100
+
+def wants_ndjson(accept: Optional[str]) -> bool:
+    """True when the client asked for newline-delimited JSON in its Accept header."""
+    if not accept:
+        return False
+    return any(part.split(";")[0].strip() == NDJSON_MEDIA_TYPE for part in accept.split(","))
+
+def json_response(content: Any, headers: Optional[dict] = None) -> ORJSONResponse:
+    """Serialize straight to bytes with orjson, skipping jsonable_encoder.
+
+    orjson handles the UUID, datetime and JSONB values of query rows natively.
+    """
+    with stage("encode"):
+        return ORJSONResponse(content, headers=headers)
+
+def ndjson_line(item: Any) -> bytes:
+    return orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE)
+
+async def ndjson_lines(items: AsyncIterable[Any]) -> AsyncIterator[bytes]:
+    async for item in items:
+        yield ndjson_line(item)
+
+def ndjson_response(items: AsyncIterable[Any], headers: Optional[dict] = None) -> StreamingResponse:
+    return StreamingResponse(ndjson_lines(items), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as If-None-Match requires
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def conditional_response(cached: CachedResponse, if_none_match: Optional[str]) -> Response:
+    """Serve an encoded body with its ETag, or 304 when the client already has it."""
+    headers = {**cached.headers, "ETag": cached.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(cached.etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
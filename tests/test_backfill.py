@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+from uuid import UUID
+import pytest
+import backfill
+from backfill import Backfill, Checkpoint, RateLimiter, format_eta
+
+def ids(*numbers):
+    return [UUID(int=n) for n in numbers]
+
+def test_checkpoint_waits_for_earlier_batches():
+    first, second, third = ids(1, 2, 3)
+    checkpoint = Checkpoint()
+    for batch in (first, second, third):
+        checkpoint.start(batch)
+
+    assert not checkpoint.finish(second)
+    assert checkpoint.last_id is None
+    assert checkpoint.finish(first)
+    assert checkpoint.last_id == second
+    assert checkpoint.finish(third)
+    assert checkpoint.last_id == third
+
+def test_checkpoint_resumes_from_saved_id():
+    assert Checkpoint(UUID(int=7)).last_id == UUID(int=7)
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.mark.asyncio
+async def test_rate_limiter_waits_for_budget():
+    fake = FakeTime()
+    limiter = RateLimiter(60, clock=fake.clock, sleep=fake.sleep)
+    await limiter.acquire(60)
+    assert fake.slept == []
+    await limiter.acquire(30)
+    assert fake.slept == [30.0]
+
+@pytest.mark.asyncio
+async def test_rate_limiter_lets_oversized_requests_through():
+    fake = FakeTime()
+    limiter = RateLimiter(10, clock=fake.clock, sleep=fake.sleep)
+    await limiter.acquire(1000)
+    assert fake.slept == []
+
+def test_format_eta():
+    assert format_eta(None) == "unknown"
+    assert format_eta(75) == "1m15s"
+    assert format_eta(3 * 3600 + 120) == "3h02m"
+
+class InPlaceSession:
+    """Session whose memory UPDATE matches only ``current`` ids, recording statements."""
+    def __init__(self, current):
+        self.current = current
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        self.statements.append(statement)
+        memory_id = statement.compile().params.get("id_1")
+        return SimpleNamespace(first=lambda: (memory_id,) if memory_id in self.current else None)
+
+    async def commit(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+@pytest.mark.asyncio
+async def test_in_place_skips_rows_changed_while_embedding(monkeypatch):
+    kept, changed = ids(1, 2)
+    session = InPlaceSession({kept})
+    monkeypatch.setattr(backfill, "AsyncSessionLocal", lambda: session)
+    args = SimpleNamespace(
+        job=None, column=backfill.LIVE_COLUMN, model="m", dimensions=None, tpm=0, rpm=0, changed_only=False
+    )
+    job = Backfill(args)
+
+    async def embed(texts):
+        return [[0.0] for _ in texts]
+
+    job.embed = embed
+    segments = [{"text": "Hello", "start": 0.0, "end": 1.0}]
+    batch = [
+        SimpleNamespace(id=memory_id, user_id="u", structured={"title": "t"}, transcript_segments=segments, content_hash="read")
+        for memory_id in (kept, changed)
+    ]
+    await job.process_in_place(batch)
+
+    updates = [str(statement) for statement in session.statements if str(statement).startswith("UPDATE")]
+    assert all("omi_memories.content_hash IS NOT DISTINCT FROM" in statement for statement in updates)
+    # Chunks are replaced only for the row that still held the embedded text
+    chunk_writes = [statement for statement in session.statements if "omi_memory_chunks" in str(statement)]
+    assert [statement.compile().params.get("memory_id_1") for statement in chunk_writes[:1]] == [kept]
+    assert len(chunk_writes) == 2
+    assert job.skipped == 1
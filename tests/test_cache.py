@@ -0,0 +1,163 @@
+import numpy as np
+import pytest
+from cache import LRUCache, QueryEmbeddingCache, ResponseCache, make_etag, normalize_query
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class FakeBackend:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ttl):
+        self.data[key] = value
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, b"0")) + 1).encode()
+        return int(self.data[key])
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1, 1)
+    cache.set("b", 2, 1)
+    assert cache.get("a") == 1
+    cache.set("c", 3, 1)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.evictions == 1
+
+def test_lru_respects_byte_budget():
+    cache = LRUCache(max_bytes=10)
+    cache.set("a", 1, 6)
+    cache.set("b", 2, 6)
+    assert cache.get("a") is None
+    assert cache.bytes == 6
+
+def test_lru_expires_entries():
+    clock = FakeClock()
+    cache = LRUCache(ttl=10, clock=clock)
+    cache.set("a", 1, 1)
+    clock.now = 11
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_normalize_query():
+    assert normalize_query("  Meetings\tTODAY ") == "meetings today"
+
+@pytest.mark.asyncio
+async def test_query_cache_hits_on_normalized_query():
+    calls = []
+
+    async def embed(text):
+        calls.append(text)
+        return [0.5, 0.25]
+
+    cache = QueryEmbeddingCache(embed=embed, model="test-model")
+    first = await cache.get_embedding("Political")
+    second = await cache.get_embedding("  political ")
+
+    assert calls == ["political"]
+    assert list(second) == list(first)
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+@pytest.mark.asyncio
+async def test_query_cache_key_includes_model():
+    async def embed(text):
+        return [1.0]
+
+    a = QueryEmbeddingCache(embed=embed, model="model-a")
+    b = QueryEmbeddingCache(embed=embed, model="model-b")
+    assert a.key("q") != b.key("q")
+
+@pytest.mark.asyncio
+async def test_query_cache_reads_shared_backend():
+    backend = FakeBackend()
+
+    async def embed(text):
+        return [1.0, 2.0]
+
+    writer = QueryEmbeddingCache(embed=embed, model="m", backend=backend)
+    await writer.get_embedding("hello")
+
+    async def failing_embed(text):
+        raise AssertionError("should be served from the shared backend")
+
+    reader = QueryEmbeddingCache(embed=failing_embed, model="m", backend=backend)
+    vector = await reader.get_embedding("HELLO")
+    assert list(vector) == [1.0, 2.0]
+    assert reader.stats()["shared_hits"] == 1
+
+@pytest.mark.asyncio
+async def test_query_cache_embeds_misses_in_one_call():
+    calls = []
+
+    async def embed(text):
+        raise AssertionError("misses should go through embed_many")
+
+    async def embed_many(texts):
+        calls.append(texts)
+        return [[float(len(text))] for text in texts]
+
+    cache = QueryEmbeddingCache(embed=embed, model="m", embed_many=embed_many)
+    cache.local.set(cache.key("cached"), np.array([9.0], dtype=np.float32), 4)
+    vectors = await cache.get_embeddings(["Lunch", "cached", "lunch ", "dinner"])
+
+    assert calls == [["lunch", "dinner"]]
+    assert [list(v) for v in vectors] == [[5.0], [9.0], [5.0], [6.0]]
+    assert cache.stats()["misses"] == 2
+
+@pytest.mark.asyncio
+async def test_response_cache_key_is_independent_of_param_order():
+    cache = ResponseCache()
+    a = await cache.key("u1", "memories", [("user_id", "u1"), ("limit", "5")])
+    b = await cache.key("u1", "memories", [("limit", "5"), ("user_id", "u1")])
+    assert a == b
+    assert a != await cache.key("u1", "memories", [("user_id", "u1"), ("limit", "6")])
+
+@pytest.mark.asyncio
+async def test_response_cache_invalidate_drops_user_entries():
+    cache = ResponseCache()
+    key = await cache.key("u1", "memories", [("user_id", "u1")])
+    other = await cache.key("u2", "memories", [("user_id", "u2")])
+    stored = await cache.set(key, b'[{"id": 1}]', {"X-Next-Cursor": "abc"})
+    await cache.set(other, b"[]", {})
+    assert stored.etag == make_etag(b'[{"id": 1}]')
+    assert await cache.get(key) == stored
+
+    await cache.invalidate("u1")
+    assert await cache.get(await cache.key("u1", "memories", [("user_id", "u1")])) is None
+    assert await cache.get(await cache.key("u2", "memories", [("user_id", "u2")])) is not None
+    assert cache.stats()["invalidations"] == 1
+
+@pytest.mark.asyncio
+async def test_response_cache_shares_entries_and_invalidations():
+    backend = FakeBackend()
+    writer, reader = ResponseCache(backend=backend), ResponseCache(backend=backend)
+    params = [("user_id", "u1")]
+    await writer.set(await writer.key("u1", "memories", params), b"[1]", {})
+
+    cached = await reader.get(await reader.key("u1", "memories", params))
+    assert cached.body == b"[1]"
+    assert reader.stats()["shared_hits"] == 1
+
+    # A write on one worker hides the other worker's local copy too
+    await writer.invalidate("u1")
+    assert await reader.get(await reader.key("u1", "memories", params)) is None
+
+def test_response_cache_disabled_without_entries():
+    assert not ResponseCache(max_entries=0).enabled
+
+@pytest.mark.parametrize("shared, local_ok, expected", [(False, False, 0), (False, True, 100), (True, False, 100)])
+def test_response_cache_needs_shared_backend_or_opt_in(shared, local_ok, expected):
+    from main import response_cache_entries
+    assert response_cache_entries(100, shared=shared, local_ok=local_ok) == expected
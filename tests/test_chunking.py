@@ -0,0 +1,38 @@
+from chunking import chunk_transcript, estimate_tokens, transcript_windows, truncate_for_embedding
+
+def segment(text, start, end):
+    return {"text": text, "speaker": "SPEAKER_01", "start": start, "end": end}
+
+def test_short_transcript_is_one_chunk():
+    segments = [segment("Hello", 0.0, 1.0), segment("there", 1.0, 2.0)]
+    chunks = chunk_transcript(segments, max_tokens=100, overlap_tokens=10)
+    assert chunks == [{"chunk_index": 0, "start": 0.0, "end": 2.0, "text": "Hello there"}]
+
+def test_windows_overlap_and_keep_time_spans():
+    segments = [segment("x" * 30, float(i), float(i + 1)) for i in range(10)]
+    chunks = chunk_transcript(segments, max_tokens=35, overlap_tokens=11)
+
+    assert len(chunks) > 1
+    assert chunks[0]["start"] == 0.0
+    assert chunks[-1]["end"] == 10.0
+    for previous, current in zip(chunks, chunks[1:]):
+        # The next window starts inside the previous one
+        assert current["start"] < previous["end"]
+        assert current["end"] > previous["end"]
+
+def test_chunking_from_the_last_window_repeats_it():
+    segments = [segment("x" * (10 * (i % 7) + 5), float(i), float(i + 1)) for i in range(60)]
+    chunks = chunk_transcript(segments, max_tokens=35, overlap_tokens=11)
+    start, _ = transcript_windows(segments, max_tokens=35, overlap_tokens=11)[-1]
+    tail = chunk_transcript(segments[start:], max_tokens=35, overlap_tokens=11, first_index=len(chunks) - 1)
+    assert tail == chunks[-1:]
+
+def test_empty_segments_are_skipped():
+    assert chunk_transcript([segment("", 0.0, 1.0)]) == []
+    assert chunk_transcript(None) == []
+
+def test_truncate_for_embedding_respects_limit():
+    text = "word " * 50000
+    truncated = truncate_for_embedding(text, max_tokens=1000)
+    assert estimate_tokens(truncated) <= 1000
+    assert text.startswith(truncated)
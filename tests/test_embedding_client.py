@@ -0,0 +1,89 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from embedding_client import EmbeddingClient, retry_after
+
+def rate_limit_error(headers=None):
+    response = httpx.Response(429, headers=headers or {}, request=httpx.Request("POST", "https://api.test/embeddings"))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+class FakeSend:
+    def __init__(self, failures=0):
+        self.requests = []
+        self.failures = failures
+
+    async def __call__(self, texts):
+        self.requests.append(list(texts))
+        if self.failures:
+            self.failures -= 1
+            raise rate_limit_error({"retry-after-ms": "1"})
+        return [[float(len(text))] for text in texts]
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_request():
+    send = FakeSend()
+    client = EmbeddingClient(send, window=0.01)
+    results = await asyncio.gather(client.embed("a"), client.embed("bb"), client.embed_many(["ccc", "a"]))
+    assert results == [[1.0], [2.0], [[3.0], [1.0]]]
+    assert send.requests == [["a", "bb", "ccc"]]
+    stats = client.stats()
+    assert stats["calls"] == 4 and stats["shared"] == 1 and stats["requests"] == 1
+
+@pytest.mark.asyncio
+async def test_requests_respect_input_and_token_limits():
+    send = FakeSend()
+    client = EmbeddingClient(send, window=0.01, max_inputs=2, max_tokens=10)
+    await client.embed_many(["a", "b", "c", "x" * 30])
+    assert send.requests == [["a", "b"], ["c"], ["x" * 30]]
+
+@pytest.mark.asyncio
+async def test_rate_limits_are_retried():
+    send = FakeSend(failures=2)
+    client = EmbeddingClient(send, window=0, base_delay=0.001, max_delay=0.01)
+    assert await client.embed("hello") == [5.0]
+    assert len(send.requests) == 3
+    assert client.stats()["rate_limited"] == 2
+
+@pytest.mark.asyncio
+async def test_exhausted_retries_fail_every_caller():
+    send = FakeSend(failures=5)
+    client = EmbeddingClient(send, window=0.01, max_retries=1, base_delay=0.001, max_delay=0.01)
+    results = await asyncio.gather(client.embed("a"), client.embed("a"), return_exceptions=True)
+    assert all(isinstance(result, openai.RateLimitError) for result in results)
+    assert len(send.requests) == 2
+    # Nothing is left in flight, so the next call makes a new request
+    send.failures = 0
+    assert await client.embed("a") == [1.0]
+
+def test_retry_after_reads_headers():
+    assert retry_after(rate_limit_error({"retry-after": "2"})) == 2.0
+    assert retry_after(rate_limit_error({"retry-after-ms": "250"})) == 0.25
+    assert retry_after(rate_limit_error()) is None
+
+class RejectingSend(FakeSend):
+    """Rejects any request that contains ``bad``, as the API does for an invalid input."""
+    def __init__(self, bad):
+        super().__init__()
+        self.bad = bad
+
+    async def __call__(self, texts):
+        if self.bad in texts:
+            self.requests.append(list(texts))
+            response = httpx.Response(400, request=httpx.Request("POST", "https://api.test/embeddings"))
+            raise openai.BadRequestError("invalid input", response=response, body=None)
+        return await super().__call__(texts)
+
+@pytest.mark.asyncio
+async def test_rejected_input_only_fails_its_own_caller():
+    send = RejectingSend("")
+    client = EmbeddingClient(send, window=0.01)
+    results = await asyncio.gather(
+        client.embed("a"), client.embed(""), client.embed("bb"), client.embed("ccc"), return_exceptions=True
+    )
+    assert results[0] == [1.0] and results[2] == [2.0] and results[3] == [3.0]
+    assert isinstance(results[1], openai.BadRequestError)
+    # Not retried: the batch is bisected down to the rejected text
+    assert send.requests == [["a", "", "bb", "ccc"], ["a", ""], ["bb", "ccc"], ["a"], [""]]
+    assert client.stats()["splits"] == 2
+    assert client.stats()["in_flight"] == 0
@@ -0,0 +1,106 @@
+import pytest
+from embedding_queue import EmbeddingQueue, EMBEDDING_READY, EMBEDDING_FAILED
+
+class FakeStore:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, memory_id, payload, embedding, status):
+        self.calls.append((memory_id, payload, embedding, status))
+
+@pytest.mark.asyncio
+async def test_embedding_stored_as_ready():
+    async def embed(text):
+        return [float(len(text))]
+
+    store = FakeStore()
+    queue = EmbeddingQueue(embed=embed, store=store, workers=2)
+    await queue.start()
+    try:
+        assert queue.enqueue("m1", "hello")
+        await queue.join()
+    finally:
+        await queue.stop()
+
+    assert store.calls == [("m1", "hello", [5.0], EMBEDDING_READY)]
+    assert queue.stats()["completed"] == 1
+
+@pytest.mark.asyncio
+async def test_embedding_retries_then_succeeds():
+    attempts = []
+
+    async def embed(text):
+        attempts.append(text)
+        if len(attempts) < 3:
+            raise RuntimeError("rate limited")
+        return [1.0]
+
+    store = FakeStore()
+    queue = EmbeddingQueue(embed=embed, store=store, base_delay=0)
+    await queue.start()
+    try:
+        queue.enqueue("m1", "hello")
+        await queue.join()
+    finally:
+        await queue.stop()
+
+    assert len(attempts) == 3
+    assert store.calls == [("m1", "hello", [1.0], EMBEDDING_READY)]
+    assert queue.stats()["retries"] == 2
+
+@pytest.mark.asyncio
+async def test_embedding_marked_failed_after_max_retries():
+    async def embed(text):
+        raise RuntimeError("down")
+
+    store = FakeStore()
+    queue = EmbeddingQueue(embed=embed, store=store, max_retries=2, base_delay=0)
+    await queue.start()
+    try:
+        queue.enqueue("m1", "hello")
+        await queue.join()
+    finally:
+        await queue.stop()
+
+    assert store.calls == [("m1", "hello", None, EMBEDDING_FAILED)]
+    assert queue.stats()["failed"] == 1
+
+@pytest.mark.asyncio
+async def test_enqueue_reports_full_queue():
+    async def embed(text):
+        return [1.0]
+
+    queue = EmbeddingQueue(embed=embed, store=FakeStore(), maxsize=1)
+    assert queue.enqueue("m1", "a")
+    assert not queue.enqueue("m2", "b")
+    stats = queue.stats()
+    assert stats["queued"] == 1
+    assert stats["dropped"] == 1
+
+@pytest.mark.asyncio
+async def test_copy_of_a_job_still_queued_past_the_sweep_grace_is_skipped():
+    embedded = []
+    status = {"m1": "pending"}
+
+    async def embed(text):
+        embedded.append(text)
+        return [1.0]
+
+    async def store(memory_id, payload, result, outcome):
+        status[memory_id] = outcome
+
+    async def claim(memory_id, payload):
+        return status[memory_id] != EMBEDDING_READY
+
+    queue = EmbeddingQueue(embed=embed, store=store, workers=1, claim=claim)
+    # The ingest's job and the copy the sweep queued once the grace period passed
+    queue.enqueue("m1", "hello")
+    queue.enqueue("m1", "hello")
+    await queue.start()
+    try:
+        await queue.join()
+    finally:
+        await queue.stop()
+
+    assert embedded == ["hello"]
+    assert queue.stats()["skipped"] == 1
@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+import pytest
+import embeddings
+from embeddings import batch_texts, build_embedding_text, content_hash
+
+def test_batch_texts_respects_input_and_token_limits():
+    texts = ["a" * 30] * 5
+    assert batch_texts(texts, max_inputs=2, max_tokens=1000) == [[0, 1], [2, 3], [4]]
+    assert batch_texts(texts, max_inputs=10, max_tokens=25) == [[0, 1], [2, 3], [4]]
+
+def test_build_embedding_text():
+    structured = {"title": "Lunch", "overview": "Talked about travel"}
+    segments = [{"text": "hello"}, {"text": ""}, {"text": "world"}]
+    assert build_embedding_text(structured, segments) == "Lunch Talked about travel hello world"
+    assert build_embedding_text(None, []) == "Empty memory"
+
+def test_content_hash_tracks_text_and_order():
+    assert content_hash(["a", "b"]) == content_hash(["a", "b"])
+    assert content_hash(["a", "b"]) != content_hash(["b", "a"])
+    assert content_hash(["ab"]) != content_hash(["a", "b"])
+
+def test_content_hash_tracks_model_and_dimensions():
+    assert content_hash(["a"], model="m1") != content_hash(["a"], model="m2")
+    assert content_hash(["a"], model="m1", dimensions=512) != content_hash(["a"], model="m1")
+
+class FakeEmbeddings:
+    async def create(self, model, input, dimensions=None):
+        # The API may return items out of order
+        data = [SimpleNamespace(index=i, embedding=[float(i)]) for i in range(len(input))]
+        return SimpleNamespace(data=list(reversed(data)), usage=SimpleNamespace(prompt_tokens=len(input)))
+
+@pytest.mark.asyncio
+async def test_embed_texts_restores_input_order(monkeypatch):
+    monkeypatch.setattr(embeddings, "_client", SimpleNamespace(embeddings=FakeEmbeddings()))
+    monkeypatch.setattr(embeddings, "batch_texts", lambda texts: [[0, 1], [2]])
+    # Both batches fall into one coalescing window and share a request
+    assert await embeddings.embed_texts(["a", "b", "c"]) == [[0.0], [1.0], [2.0]]
+
+@pytest.mark.asyncio
+async def test_other_models_bypass_coalescing(monkeypatch):
+    monkeypatch.setattr(embeddings, "_client", SimpleNamespace(embeddings=FakeEmbeddings()))
+    monkeypatch.setattr(embeddings, "batch_texts", lambda texts: [[0, 1], [2]])
+    assert await embeddings.embed_texts(["a", "b", "c"], model="other-model") == [[0.0], [1.0], [0.0]]
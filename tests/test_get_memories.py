@@ -2,7 +2,7 @@ import pytest
 import httpx
 from sqlalchemy.orm import Session
 from database import SessionLocal
-from models import MemoryDB
+from models import MemoryDB, MemoryPayloadDB
 from datetime import datetime
 import uuid
 
@@ -20,8 +20,9 @@ def setup_db():
 
         # Insert test memories
         for i in range(3):
+            memory_id = uuid.uuid4()
             test_memory = MemoryDB(
-                id=str(uuid.uuid4()),
+                id=memory_id,
                 user_id=TEST_USER_ID,  # Use the placeholder user ID
                 created_at=datetime.utcnow(),
                 started_at=datetime.utcnow(),
@@ -29,11 +30,7 @@ def setup_db():
                 source="test-source",
                 language="en",
                 structured={"title": f"Test Memory {i+1}", "overview": "Test overview", "emoji": "🧠", "category": "test", "actionItems": [], "events": []},
-                transcript_segments=[{"text": "Sample text", "speaker": "SPEAKER_01", "speaker_id": 1, "is_user": True, "start": 0.0, "end": 1.0}],
                 geolocation=None,
-                photos=[],
-                plugins_results=[],
-                external_data=None,
                 discarded=False,
                 deleted=False,
                 visibility="private",
@@ -41,6 +38,14 @@ def setup_db():
                 status="completed"
             )
             db.add(test_memory)
+            db.flush()
+            db.add(MemoryPayloadDB(
+                memory_id=memory_id,
+                transcript_segments=[{"text": "Sample text", "speaker": "SPEAKER_01", "speaker_id": 1, "is_user": True, "start": 0.0, "end": 1.0}],
+                photos=[],
+                plugins_results=[],
+                external_data=None
+            ))
         db.commit()
         yield
     finally:
@@ -0,0 +1,259 @@
+import uuid
+from types import SimpleNamespace
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.sql import Select
+import main
+import queries
+from database import get_async_db
+from embedding_queue import EMBEDDING_FAILED, EMBEDDING_PENDING, EMBEDDING_READY
+
+MEMORY = {
+    "created_at": "2023-11-04T12:00:00",
+    "structured": {"title": "Dining Out Decision", "overview": "Choosing a restaurant."},
+    "transcript_segments": [{"text": "Hello", "speaker": "SPEAKER_01", "speaker_id": 1, "is_user": True, "start": 0.0, "end": 1.0}],
+    "processing_memory_id": "pm-1",
+    "status": "completed",
+}
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def scalar_one(self):
+        return self.rows[0].id if self.rows else uuid.uuid4()
+
+class FakeSession:
+    """Answers lookups with the stored rows given and accepts every write."""
+    def __init__(self, existing=()):
+        self.existing = list(existing)
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        self.statements.append(statement)
+        return FakeResult(self.existing)
+
+    async def commit(self):
+        pass
+
+def stored(content_hash, embedding_status):
+    return SimpleNamespace(
+        id=uuid.uuid4(), processing_memory_id="pm-1", created_at=None,
+        content_hash=content_hash, embedding_status=embedding_status
+    )
+
+def current_hash():
+    memory = main.prepare_memory(main.Memory(**MEMORY))
+    return main.embedding_job(None, "u", memory["structured"], memory["transcript_segments"])["content_hash"]
+
+@pytest.fixture
+def ingest(monkeypatch):
+    """Post to an ingest endpoint against stored rows; returns the queued and embedded memories."""
+    queued, embedded = [], []
+    monkeypatch.setattr(main.embedding_queue, "enqueue", lambda memory_id, job: queued.append(memory_id) or True)
+
+    async def embed_batch(texts):
+        embedded.extend(texts)
+        return [[0.0] * 1536 for _ in texts]
+
+    monkeypatch.setattr(main, "embed_batch", embed_batch)
+
+    def post(path, body, existing=()):
+        main.app.dependency_overrides[get_async_db] = lambda: FakeSession(existing)
+        try:
+            response = TestClient(main.app).post(path, params={"uid": "u"}, json=body)
+        finally:
+            main.app.dependency_overrides.clear()
+        assert response.status_code == 200
+        return queued, embedded
+
+    return post
+
+@pytest.mark.parametrize("content_hash, status, expected", [
+    ("other", EMBEDDING_READY, True),
+    (None, None, True),
+    ("same", EMBEDDING_READY, False),
+    ("same", None, False),
+    ("same", EMBEDDING_PENDING, True),
+    ("same", EMBEDDING_FAILED, True),
+])
+def test_needs_embedding(content_hash, status, expected):
+    previous = SimpleNamespace(content_hash=content_hash, embedding_status=status)
+    assert main.needs_embedding(previous, {"content_hash": "same"}) is expected
+    assert main.needs_embedding(None, {"content_hash": "same"})
+
+def test_unchanged_ready_redelivery_is_not_requeued(ingest):
+    queued, _ = ingest("/memory-created", MEMORY, [stored(current_hash(), EMBEDDING_READY)])
+    assert queued == []
+
+@pytest.mark.parametrize("status", [EMBEDDING_PENDING, EMBEDDING_FAILED])
+def test_unfinished_redelivery_is_requeued(ingest, status):
+    row = stored(current_hash(), status)
+    queued, _ = ingest("/memory-created", MEMORY, [row])
+    assert queued == [row.id]
+
+def test_changed_redelivery_is_requeued(ingest):
+    row = stored("stale", EMBEDDING_READY)
+    queued, _ = ingest("/memory-created", MEMORY, [row])
+    assert queued == [row.id]
+
+def test_batch_skips_only_ready_redeliveries(ingest):
+    _, embedded = ingest("/memories/batch", [MEMORY], [stored(current_hash(), EMBEDDING_READY)])
+    assert embedded == []
+    _, embedded = ingest("/memories/batch", [MEMORY], [stored(current_hash(), EMBEDDING_FAILED)])
+    assert len(embedded) == 2  # the memory text and its one chunk
+
+def chunk_deletes(session):
+    return [statement for statement in session.statements if str(statement).startswith("DELETE FROM omi_memory_chunks")]
+
+def post_to(session, path, body):
+    main.app.dependency_overrides[get_async_db] = lambda: session
+    try:
+        assert TestClient(main.app).post(path, params={"uid": "u"}, json=body).status_code == 200
+    finally:
+        main.app.dependency_overrides.clear()
+
+@pytest.mark.parametrize("content_hash, deletes", [("stale", 1), (None, 0)])
+def test_changed_redelivery_drops_old_chunks(ingest, content_hash, deletes):
+    session = FakeSession([stored(content_hash or current_hash(), EMBEDDING_READY)])
+    post_to(session, "/memory-created", MEMORY)
+    # Pending memories are not searchable, their earlier chunks included
+    assert len(chunk_deletes(session)) == deletes
+
+def test_batch_drops_old_chunks_of_content_without_windows(ingest):
+    session = FakeSession([stored("stale", EMBEDDING_READY)])
+    post_to(session, "/memories/batch", [dict(MEMORY, transcript_segments=[])])
+    assert len(chunk_deletes(session)) == 1
+
+class StoreSession(FakeSession):
+    """Session whose UPDATE matches ``matched`` rows, recording statements."""
+    def __init__(self, matched):
+        super().__init__()
+        self.matched = matched
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        self.statements.append(statement)
+        return SimpleNamespace(rowcount=self.matched)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("matched", [0, 1])
+async def test_stale_job_does_not_overwrite_newer_content(monkeypatch, matched):
+    session = StoreSession(matched)
+    monkeypatch.setattr(main, "AsyncSessionLocal", lambda: session)
+    job = {"content_hash": "old"}
+    result = {"user_id": "u", "embedding": [0.0] * 1536, "chunks": [{"start": 0.0, "end": 1.0, "embedding": [0.0] * 1536}]}
+    await main.store_embedding(uuid.uuid4(), job, result, EMBEDDING_READY)
+    update = str(session.statements[0])
+    assert "omi_memories.content_hash IS NOT DISTINCT FROM" in update
+    # Chunks are only replaced when the memory still holds the job's content
+    assert len(session.statements) == (1 if matched == 0 else 3)
+
+class SweepSession(FakeSession):
+    """Session that grants the sweep's advisory lock if ``leader``, then returns ``due`` rows."""
+    def __init__(self, leader, due):
+        super().__init__()
+        self.leader = leader
+        self.due = due
+
+    async def execute(self, statement, params=None):
+        text = str(statement)
+        if "pg_try_advisory_xact_lock" in text:
+            return SimpleNamespace(scalar=lambda: self.leader)
+        if text.startswith("UPDATE"):
+            return FakeResult(self.due)
+        return FakeResult([(row.id, [{"text": "Hello"}]) for row in self.due])
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("leader", [False, True])
+async def test_only_the_sweep_leader_requeues(monkeypatch, leader):
+    due = [SimpleNamespace(id=uuid.uuid4(), user_id="u", structured={"title": "t"}, content_hash="stored")]
+    monkeypatch.setattr(main, "AsyncSessionLocal", lambda: SweepSession(leader, due))
+    queued = []
+    monkeypatch.setattr(main.embedding_queue, "enqueue", lambda memory_id, job: queued.append((memory_id, job)) or True)
+    assert await main.requeue_due() == (1 if leader else 0)
+    if leader:
+        # The job carries the stored hash, so the store guard matches the row
+        assert [(memory_id, job["content_hash"]) for memory_id, job in queued] == [(due[0].id, "stored")]
+    else:
+        assert queued == []
+
+def test_failed_embedding_backs_off():
+    values = main.embedding_outcome(None, EMBEDDING_FAILED)
+    assert str(values["embedding_attempts"]) == "omi_memories.embedding_attempts + :embedding_attempts_1"
+    assert "power" in str(values["embedding_retry_at"])
+    assert main.embedding_outcome({"embedding": [0.0]}, EMBEDDING_READY)["embedding_retry_at"] is None
+
+class ClaimSession(StoreSession):
+    """Session whose claiming UPDATE returns ``matched`` rows."""
+    async def execute(self, statement, params=None):
+        self.statements.append(statement)
+        return FakeResult([SimpleNamespace(id=1)] * self.matched)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("matched", [0, 1])
+async def test_worker_claims_only_current_unfinished_jobs(monkeypatch, matched):
+    session = ClaimSession(matched)
+    monkeypatch.setattr(main, "AsyncSessionLocal", lambda: session)
+    assert await main.claim_embedding(uuid.uuid4(), {"content_hash": "h"}) is bool(matched)
+    claim = str(session.statements[0])
+    assert "omi_memories.content_hash IS NOT DISTINCT FROM" in claim
+    assert "omi_memories.embedding_status IN" in claim
+    # The sweep leaves the memory alone while the worker embeds it
+    assert "SET embedding_retry_at=" in claim
+
+class RecordingSession:
+    """Stands in for the database, recording each statement and its parameters."""
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        self.statements.append((str(statement), params or {}))
+        return self
+
+    def all(self):
+        return []
+
+def test_unfiltered_search_uses_iterative_scan(monkeypatch):
+    async def get_embedding(query):
+        return [0.0] * 1536
+
+    session = RecordingSession()
+    monkeypatch.setattr(queries, "VECTOR_ITERATIVE_SCAN", "relaxed_order")
+    monkeypatch.setattr(main.query_cache, "get_embedding", get_embedding)
+    main.app.dependency_overrides[get_async_db] = lambda: session
+    try:
+        # Only the user filter applies, which alone can empty an ANN page
+        response = TestClient(main.app).get("/memories/search", params={"user_id": "u", "query": "political"})
+    finally:
+        main.app.dependency_overrides.clear()
+    assert response.status_code == 200
+    statement, params = session.statements[0]
+    assert statement.startswith("SELECT set_config")
+    assert {"hnsw.iterative_scan", "ivfflat.iterative_scan"} <= set(params.values())
+
+def test_blank_query_is_rejected():
+    main.app.dependency_overrides[get_async_db] = lambda: RecordingSession()
+    try:
+        response = TestClient(main.app).get("/memories/search", params={"user_id": "u", "query": "  "})
+    finally:
+        main.app.dependency_overrides.clear()
+    assert response.status_code == 400
@@ -4,7 +4,7 @@ from main import app  # Import your FastAPI app
 import uuid
 from sqlalchemy.orm import Session
 from database import SessionLocal
-from models import MemoryDB
+from models import MemoryDB, MemoryPayloadDB
 from datetime import datetime
 
 # Use a placeholder user ID for testing
@@ -21,8 +21,9 @@ def setup_db():
 
         # Insert test memories
         for i in range(3):
+            memory_id = uuid.uuid4()
             test_memory = MemoryDB(
-                id=str(uuid.uuid4()),
+                id=memory_id,
                 user_id=TEST_USER_ID,  # Use the placeholder user ID
                 created_at=datetime.utcnow(),
                 started_at=datetime.utcnow(),
@@ -30,11 +31,7 @@ def setup_db():
                 source="test-source",
                 language="en",
                 structured={"title": f"Test Memory {i+1}", "overview": "Test overview", "emoji": "🧠", "category": "test", "actionItems": [], "events": []},
-                transcript_segments=[{"text": "Sample text", "speaker": "SPEAKER_01", "speaker_id": 1, "is_user": True, "start": 0.0, "end": 1.0}],
                 geolocation=None,
-                photos=[],
-                plugins_results=[],
-                external_data=None,
                 discarded=False,
                 deleted=False,
                 visibility="private",
@@ -42,6 +39,14 @@ def setup_db():
                 status="completed"
             )
             db.add(test_memory)
+            db.flush()
+            db.add(MemoryPayloadDB(
+                memory_id=memory_id,
+                transcript_segments=[{"text": "Sample text", "speaker": "SPEAKER_01", "speaker_id": 1, "is_user": True, "start": 0.0, "end": 1.0}],
+                photos=[],
+                plugins_results=[],
+                external_data=None
+            ))
         db.commit()
         yield
     finally:
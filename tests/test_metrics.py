@@ -0,0 +1,24 @@
+from metrics import _timings, server_timing, stage
+
+def test_stage_accumulates_within_a_request():
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        with stage("db"):
+            pass
+        with stage("db"):
+            pass
+        with stage("encode"):
+            pass
+    finally:
+        _timings.reset(token)
+    assert set(timings) == {"db", "encode"}
+    assert all(seconds >= 0 for seconds in timings.values())
+
+def test_stage_outside_a_request_is_a_no_op():
+    with stage("db"):
+        pass
+    assert _timings.get() is None
+
+def test_server_timing_header():
+    assert server_timing({"embed": 0.0123, "db": 0.004}, 0.02) == "embed;dur=12.3, db;dur=4.0, total;dur=20.0"
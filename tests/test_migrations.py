@@ -0,0 +1,101 @@
+from contextlib import contextmanager
+from datetime import date
+from types import SimpleNamespace
+import migrations
+from migrations import DEFAULT_PARTITION, _create_partitions, add_months, partition_bounds
+
+def test_add_months_crosses_years():
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 1), -13) == date(2022, 12, 1)
+
+def test_partition_bounds_cover_whole_months():
+    bounds = partition_bounds(date(2023, 12, 15), date(2024, 2, 1))
+    assert bounds == [
+        ("omi_memories_2023_12", date(2023, 12, 1), date(2024, 1, 1)),
+        ("omi_memories_2024_01", date(2024, 1, 1), date(2024, 2, 1)),
+        ("omi_memories_2024_02", date(2024, 2, 1), date(2024, 3, 1)),
+    ]
+
+class FakeConnection:
+    """Answers the catalog and stray-row lookups of _create_partitions, recording DDL."""
+    def __init__(self, existing, strays):
+        self.existing = existing
+        self.strays = strays
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        if "to_regclass" in sql:
+            value = params["name"] in self.existing
+        elif sql.startswith("SELECT EXISTS"):
+            value = params["start"].startswith(self.strays)
+        elif "information_schema.columns" in sql:
+            return [SimpleNamespace(column_name="id"), SimpleNamespace(column_name="created_at")]
+        else:
+            value = None
+        return SimpleNamespace(scalar=lambda: value, rowcount=1)
+
+def test_new_partition_takes_rows_from_default_partition():
+    conn = FakeConnection({"omi_memories_2024_01", DEFAULT_PARTITION}, strays="2024-02")
+    _create_partitions(conn, "omi_memories", date(2024, 1, 1), date(2024, 3, 1))
+    ddl = [sql for sql in conn.statements if not sql.startswith("SELECT")]
+    assert ddl[0] == f"ALTER TABLE omi_memories DETACH PARTITION {DEFAULT_PARTITION}"
+    assert ddl[1].startswith("CREATE TABLE omi_memories_2024_02 PARTITION OF omi_memories")
+    assert ddl[2].startswith(f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION}")
+    assert ddl[3] == f"ALTER TABLE omi_memories ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"
+    # No stray rows for March: created without touching the default partition
+    assert ddl[4].startswith("CREATE TABLE omi_memories_2024_03 PARTITION OF omi_memories")
+    assert len(ddl) == 5
+
+class FakeEngine:
+    """Hands out a connection per transaction over a detached partition of ``ids``."""
+    def __init__(self, ids):
+        self.ids = ids
+        self.transactions = []
+
+    @contextmanager
+    def begin(self):
+        statements = []
+        self.transactions.append(statements)
+        yield self
+
+    def execute(self, statement, params=None):
+        self.transactions[-1].append((str(statement), params))
+        rows = [memory_id for memory_id in self.ids if memory_id > params.get("after", "")][:params.get("limit", 0)]
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: rows))
+
+def test_expired_partition_dependents_are_deleted_in_batches(monkeypatch):
+    engine = FakeEngine(["a", "b", "c"])
+    monkeypatch.setattr(migrations, "get_vector_engine", lambda: engine)
+    monkeypatch.setattr(migrations.time, "sleep", lambda seconds: None)
+    migrations._delete_partition_dependents("omi_memories_2020_01", batch_size=2, batch_delay=0)
+    deletes = [[params["ids"] for sql, params in transaction if sql.startswith("DELETE")] for transaction in engine.transactions]
+    # Each batch commits on its own; the last transaction finds nothing left
+    assert deletes == [[["a", "b"], ["a", "b"]], [["c"], ["c"]], []]
+
+class CatalogConnection:
+    """Answers catalog lookups with ``answers`` (first matching substring wins), recording statements."""
+    def __init__(self, answers):
+        self.answers = answers
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        value = next((answer for key, answer in self.answers.items() if key in sql), None)
+        return SimpleNamespace(scalar=lambda: value, first=lambda: value)
+
+def test_payload_table_on_partitioned_memories_has_no_foreign_key():
+    conn = CatalogConnection({"relkind = 'p'": True, "to_regclass('omi_memory_payloads')": None})
+    migrations._create_payload_table(conn)
+    create = next(sql for sql in conn.statements if sql.strip().startswith("CREATE TABLE omi_memory_payloads"))
+    assert "REFERENCES" not in create
+
+def test_invalid_partitioned_index_is_dropped_without_concurrently():
+    conn = CatalogConnection({"NOT i.indisvalid": SimpleNamespace(relkind="I")})
+    migrations._drop_invalid_index("ix_omi_memories_embedding_retry")(conn)
+    assert conn.statements[-1] == "DROP INDEX IF EXISTS ix_omi_memories_embedding_retry"
+    conn = CatalogConnection({"NOT i.indisvalid": SimpleNamespace(relkind="i")})
+    migrations._drop_invalid_index("ix_omi_memories_embedding_retry")(conn)
+    assert conn.statements[-1] == "DROP INDEX CONCURRENTLY IF EXISTS ix_omi_memories_embedding_retry"
@@ -0,0 +1,31 @@
+import pytest
+from datetime import datetime, timezone
+from uuid import uuid4
+from pagination import (
+    InvalidCursor, encode_memory_cursor, decode_memory_cursor,
+    search_fingerprint, encode_search_cursor, decode_search_cursor
+)
+
+def test_memory_cursor_round_trip():
+    created_at = datetime(2024, 11, 4, 12, 0, tzinfo=timezone.utc)
+    memory_id = uuid4()
+    cursor = encode_memory_cursor(created_at, memory_id)
+    assert "=" not in cursor
+    assert decode_memory_cursor(cursor) == (created_at, memory_id)
+
+def test_search_cursor_round_trip():
+    fingerprint = search_fingerprint("user", "political")
+    memory_id = uuid4()
+    cursor = encode_search_cursor(fingerprint, 0.123456789, memory_id)
+    assert decode_search_cursor(cursor, fingerprint) == (0.123456789, memory_id)
+
+def test_search_cursor_rejects_other_search():
+    memory_id = uuid4()
+    cursor = encode_search_cursor(search_fingerprint("user", "political"), 0.5, memory_id)
+    with pytest.raises(InvalidCursor):
+        decode_search_cursor(cursor, search_fingerprint("user", "finance"))
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "e30", "W10"])
+def test_malformed_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_memory_cursor(cursor)
@@ -0,0 +1,95 @@
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+import queries
+from models import MemoryDB
+from migrations import FILTER_INDEXES
+from queries import memory_filters, scan_settings
+
+def render(clause) -> str:
+    return str(clause.compile(dialect=postgresql.asyncpg.dialect()))
+
+def test_structured_filters_match_index_expressions():
+    category, action_items = memory_filters(category="work", has_action_items=True)
+    assert "(omi_memories.structured ->> 'category')" in render(category)
+    assert "(structured ->> 'category')" in FILTER_INDEXES["ix_omi_memories_user_id_category"]
+    # The partial index is only used when the predicate matches it exactly
+    assert render(action_items) == "(omi_memories.structured -> 'actionItems') != '[]'::jsonb"
+    assert "WHERE (structured -> 'actionItems') <> '[]'::jsonb" in FILTER_INDEXES["ix_omi_memories_user_id_action_items"]
+
+def test_without_action_items_includes_missing_lists():
+    (condition,) = memory_filters(has_action_items=False)
+    assert " IS NULL OR " in render(condition)
+
+def test_event_filter_uses_containment():
+    (condition,) = memory_filters(event="Dentist")
+    assert render(condition) == "omi_memories.structured @> $1::JSONB"
+
+def test_scan_settings_iterate_for_every_vector_search(monkeypatch):
+    monkeypatch.setattr(queries, "VECTOR_ITERATIVE_SCAN", "strict_order")
+    assert scan_settings(ef_search=80) == {
+        "hnsw.ef_search": "80",
+        "hnsw.iterative_scan": "strict_order",
+        "ivfflat.iterative_scan": "relaxed_order",
+    }
+    assert scan_settings(iterative=False) == {}
+    monkeypatch.setattr(queries, "VECTOR_ITERATIVE_SCAN", "off")
+    assert scan_settings(probes=10) == {"ivfflat.probes": "10"}
+
+def test_split_payload_moves_large_fields_out():
+    memory, payload = queries.split_payload({"structured": {}, "transcript_segments": [], "photos": [], "status": "completed"})
+    assert memory == {"structured": {}, "status": "completed"}
+    assert payload == {"transcript_segments": [], "plugins_results": None, "photos": [], "external_data": None}
+
+def test_summary_queries_never_touch_payloads():
+    assert "omi_memory_payloads" not in render(select(*queries.SUMMARY_COLUMNS))
+    detail = render(queries.join_payloads(select(*queries.DETAIL_COLUMNS)))
+    assert "FROM omi_memories LEFT OUTER JOIN omi_memory_payloads ON omi_memory_payloads.memory_id = omi_memories.id" in detail
+
+def test_related_memories_use_stored_embedding_and_skip_source():
+    sources = select(MemoryDB.id, MemoryDB.created_at, MemoryDB.embedding).where(MemoryDB.user_id == "u")
+    sql = render(queries.related_memories("u", sources, 5, max_distance=0.05))
+    assert "LATERAL" in sql
+    assert "omi_memories.embedding <=> sources.embedding" in sql
+    assert "nearest.id != sources.id" in sql
+    assert " JOIN LATERAL" in sql and "LEFT OUTER JOIN LATERAL" not in sql
+    assert "LEFT OUTER JOIN LATERAL" in render(queries.related_memories("u", sources, 5, keep_sources=True))
+
+def test_vector_pages_break_distance_ties_by_id():
+    statement = render(queries.vector_search("u", [0.0] * 1536, 5, after=(0.25, "00000000-0000-0000-0000-000000000000")))
+    assert "(best.distance, omi_memories.id) > ($" in statement
+    assert "ORDER BY best.distance, omi_memories.id \n LIMIT" in statement
+
+def test_upsert_keeps_only_ready_embeddings_of_unchanged_content():
+    statement = render(queries.upsert_memories())
+    unchanged = (
+        "omi_memories.content_hash = excluded.content_hash AND excluded.embedding IS NULL"
+        " AND coalesce(omi_memories.embedding_status, $"
+    )
+    assert f"embedding = CASE WHEN ({unchanged}" in statement
+    assert f"embedding_status = CASE WHEN ({unchanged}" in statement
+    assert "THEN omi_memories.embedding ELSE excluded.embedding END" in statement
+
+def test_search_vector_is_written_with_the_row():
+    statement = queries.upsert_memories().compile(
+        dialect=postgresql.asyncpg.dialect(), column_keys=["id", "user_id", "structured", "search_structured", "search_transcript"]
+    )
+    assert "setweight(to_tsvector('english', coalesce(CAST($" in str(statement)
+    assert "search_vector = excluded.search_vector" in str(statement)
+    params = statement.construct_params(dict(
+        {"id": None, "user_id": "u", "structured": {"title": "t"}},
+        **queries.search_params({"structured": {"title": "t"}, "transcript_segments": [{"text": "hi"}]})
+    ))
+    assert params["search_transcript"] == [{"text": "hi"}]
+
+def test_claim_due_embeddings_matches_retry_index():
+    statement = render(queries.claim_due_embeddings(10, 8, 300))
+    assert "WHERE embedding_status IN ('pending', 'failed') AND" in statement
+    assert "ORDER BY omi_memories.embedding_retry_at ASC NULLS FIRST" in statement
+    assert "FOR UPDATE SKIP LOCKED" in statement
+    assert "RETURNING omi_memories.id, omi_memories.user_id, omi_memories.structured, omi_memories.content_hash" in statement
+
+def test_rescored_cache_candidates_use_search_distances():
+    statement = render(queries.rescore_memories("u", [0.0] * 1536, ["a", "b"]))
+    assert "omi_memory_chunks.embedding <=> $" in statement
+    assert "omi_memories.embedding <=> $" in statement
+    assert statement.endswith("ORDER BY best.distance, omi_memories.id")
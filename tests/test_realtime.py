@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from chunking import chunk_transcript
+from realtime import TranscriptSessionStore, parse_segments
+
+def segment(text, start):
+    return {"text": text, "start": float(start), "end": float(start + 1)}
+
+class Recorder:
+    def __init__(self):
+        self.embedded = []
+        self.finalized = []
+
+    async def embed_texts(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text))] for text in texts]
+
+    async def finalize(self, user_id, session_id, segments, windows):
+        self.finalized.append((user_id, session_id, list(segments), windows))
+        return "memory-id"
+
+@pytest.mark.asyncio
+async def test_closed_windows_are_embedded_while_streaming():
+    recorder = Recorder()
+    store = TranscriptSessionStore(recorder.embed_texts, recorder.finalize)
+    for i in range(200):
+        await store.add_segments("u", "s", [segment("word " * 20, i)])
+    await asyncio.sleep(0)
+
+    # Earlier windows were embedded before the session ended
+    assert recorder.embedded
+    assert store.stats()["sessions"] == 1
+
+    assert await store.end("u", "s") == "memory-id"
+    user_id, session_id, segments, windows = recorder.finalized[0]
+    assert (user_id, session_id, len(segments)) == ("u", "s", 200)
+    # Only the still-open last window lacks an embedding
+    assert all(embedding is not None for _, embedding in windows[:-1])
+    assert windows[-1][1] is None
+    assert store.stats()["sessions"] == 0
+
+@pytest.mark.asyncio
+async def test_streamed_windows_match_whole_transcript_chunking():
+    recorder = Recorder()
+    store = TranscriptSessionStore(recorder.embed_texts, recorder.finalize)
+    segments = [segment("word " * (5 + i % 40), i) for i in range(300)]
+    for i in range(0, len(segments), 3):
+        await store.add_segments("u", "s", segments[i:i + 3])
+    await asyncio.sleep(0)
+
+    # Every closed window is embedded once, as the whole transcript chunks it
+    chunks = chunk_transcript(segments)
+    assert recorder.embedded == [chunk["text"] for chunk in chunks[:-1]]
+    await store.end("u", "s")
+    windows = recorder.finalized[0][3]
+    assert [chunk for chunk, _ in windows] == chunks
+    assert [embedding for _, embedding in windows[:-1]] == [[float(len(chunk["text"]))] for chunk in chunks[:-1]]
+
+@pytest.mark.asyncio
+async def test_full_buffer_rolls_over_into_a_memory():
+    recorder = Recorder()
+    store = TranscriptSessionStore(recorder.embed_texts, recorder.finalize, max_segments=3)
+    for i in range(4):
+        await store.add_segments("u", "s", [segment("hello", i)])
+
+    assert len(recorder.finalized) == 1
+    assert len(recorder.finalized[0][2]) == 3
+    assert store.stats()["buffered_segments"] == 1
+
+@pytest.mark.asyncio
+async def test_least_recent_session_is_evicted():
+    recorder = Recorder()
+    store = TranscriptSessionStore(recorder.embed_texts, recorder.finalize, max_sessions=1)
+    await store.add_segments("u", "a", [segment("hello", 0)])
+    await store.add_segments("u", "b", [segment("hello", 0)])
+
+    assert [f[1] for f in recorder.finalized] == ["a"]
+    assert store.stats()["evicted"] == 1
+
+@pytest.mark.asyncio
+async def test_empty_session_is_not_finalized():
+    recorder = Recorder()
+    store = TranscriptSessionStore(recorder.embed_texts, recorder.finalize)
+    await store.add_segments("u", "s", [{"text": ""}])
+    assert await store.end("u", "s") is None
+    assert recorder.finalized == []
+
+def test_parse_segments_accepts_both_shapes():
+    assert parse_segments([{"text": "a"}]) == (None, [{"text": "a"}])
+    assert parse_segments({"session_id": "s", "segments": []}) == ("s", [])
+    with pytest.raises(ValueError):
+        parse_segments({"foo": 1})
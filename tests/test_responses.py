@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+from uuid import UUID
+import orjson
+from cache import CachedResponse
+from responses import wants_ndjson, ndjson_line, etag_matches, conditional_response
+
+def test_wants_ndjson_reads_accept_header():
+    assert wants_ndjson("application/x-ndjson")
+    assert wants_ndjson("application/json;q=0.5, application/x-ndjson; q=1")
+    assert not wants_ndjson("application/json")
+    assert not wants_ndjson(None)
+
+def test_ndjson_line_encodes_row_values():
+    memory_id = UUID("12345678-1234-5678-1234-567812345678")
+    created_at = datetime(2024, 11, 4, 12, 0, tzinfo=timezone.utc)
+    line = ndjson_line({"id": memory_id, "created_at": created_at, "structured": {"title": "Lunch"}})
+    assert line.endswith(b"\n") and line.count(b"\n") == 1
+    assert orjson.loads(line) == {
+        "id": str(memory_id),
+        "created_at": "2024-11-04T12:00:00+00:00",
+        "structured": {"title": "Lunch"},
+    }
+
+def test_etag_matches_if_none_match_lists():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"abc"', '"xyz", W/"abc"')
+    assert etag_matches('"abc"', "*")
+    assert not etag_matches('"abc"', '"xyz"')
+    assert not etag_matches('"abc"', None)
+
+def test_conditional_response_returns_304_for_current_etag():
+    cached = CachedResponse(b"[]", '"abc"', {"X-Next-Cursor": "c1"})
+    fresh = conditional_response(cached, None)
+    assert fresh.status_code == 200 and fresh.body == b"[]"
+    assert fresh.headers["etag"] == '"abc"' and fresh.headers["x-next-cursor"] == "c1"
+
+    not_modified = conditional_response(cached, '"abc"')
+    assert not_modified.status_code == 304 and not_modified.body == b""
+    assert not_modified.headers["etag"] == '"abc"'
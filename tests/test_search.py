@@ -167,4 +167,4 @@ def test_search_relevance():
                 term in first_result["structured"].get("title", "").lower() 
                 for term in ["finance", "money", "payment", "banking"]
             )
-        ), "Financial content should be ranked first for finance query"
\ No newline at end of file
+        ), "Financial content should be ranked first for finance query"
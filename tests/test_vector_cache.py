@@ -0,0 +1,134 @@
+import asyncio
+import numpy as np
+import pytest
+from vector_cache import UserVectors, VectorCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float64)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+def brute_force(memories, chunks, query, limit):
+    query = np.asarray(query) / np.linalg.norm(query)
+    best = {}
+    for memory_id, embedding in memories:
+        best[memory_id] = min(best.get(memory_id, 2.0), 1 - np.dot(unit(*embedding), query))
+    for memory_id, _, _, embedding in chunks:
+        best[memory_id] = min(best.get(memory_id, 2.0), 1 - np.dot(unit(*embedding), query))
+    return sorted(best, key=best.get)[:limit]
+
+def test_search_ranks_memories_by_best_row():
+    vectors = UserVectors.from_rows(
+        [("a", [1.0, 0.0, 0.0]), ("b", [0.0, 1.0, 0.0])],
+        [("b", 10.0, 20.0, [0.9, 0.1, 0.0]), ("c", 0.0, 5.0, [0.0, 0.0, 1.0])],
+    )
+    hits = vectors.search([1.0, 0.0, 0.0], 2)
+    assert [hit.memory_id for hit in hits] == ["a", "b"]
+    assert hits[0].distance == pytest.approx(0.0)
+    assert hits[0].match_start is None
+    assert (hits[1].match_start, hits[1].match_end) == (10.0, 20.0)
+
+def test_search_matches_brute_force():
+    rng = np.random.default_rng(0)
+    memories = [(i, rng.normal(size=16).tolist()) for i in range(50)]
+    chunks = [(i % 50, float(i), float(i + 1), rng.normal(size=16).tolist()) for i in range(200)]
+    vectors = UserVectors.from_rows(memories, chunks)
+    for _ in range(5):
+        query = rng.normal(size=16)
+        hits = vectors.search(query, 7, oversample=1)
+        assert [hit.memory_id for hit in hits] == brute_force(memories, chunks, query, 7)
+
+def test_add_replaces_and_remove_drops():
+    vectors = UserVectors()
+    vectors.add("a", [1.0, 0.0])
+    vectors.add("b", [0.0, 1.0])
+    vectors.add("a", [0.0, 1.0], [(0.0, 1.0, [-1.0, 0.0])])
+    assert vectors.rows == 3
+    assert [hit.memory_id for hit in vectors.search([1.0, 0.0], 2)] == ["b", "a"]
+    vectors.remove("b")
+    assert [hit.memory_id for hit in vectors.search([1.0, 0.0], 2)] == ["a"]
+    assert len(vectors) == 1
+
+def test_compaction_keeps_results():
+    vectors = UserVectors()
+    for i in range(3000):
+        vectors.add(i, [1.0, 0.0] if i == 2999 else [0.0, 1.0])
+    for i in range(2000):
+        vectors.remove(i)
+    assert vectors.dead < 1024
+    assert vectors.rows == 1000
+    assert [hit.memory_id for hit in vectors.search([1.0, 0.0], 1)] == [2999]
+
+@pytest.mark.asyncio
+async def test_cache_loads_hot_users_and_updates_on_write():
+    loads = []
+
+    async def load(user_id, limit):
+        loads.append(user_id)
+        return [("a", [1.0, 0.0])], []
+
+    cache = VectorCache(load, max_bytes=1024 * 1024, hot_after=2)
+    assert cache.search("u", [1.0, 0.0], 5) is None
+    assert cache.search("u", [1.0, 0.0], 5) is None
+    await asyncio.gather(*cache._tasks)
+    assert loads == ["u"]
+
+    assert [hit.memory_id for hit in cache.search("u", [0.0, 1.0], 5)] == ["a"]
+    cache.upsert("u", "b", [0.0, 1.0])
+    assert [hit.memory_id for hit in cache.search("u", [0.0, 1.0], 5)] == ["b", "a"]
+    cache.discard("u", "b")
+    assert [hit.memory_id for hit in cache.search("u", [0.0, 1.0], 5)] == ["a"]
+    assert cache.stats()["hits"] == 3
+
+@pytest.mark.asyncio
+async def test_cache_skips_snapshot_written_during_load():
+    release = asyncio.Event()
+
+    async def load(user_id, limit):
+        await release.wait()
+        return [("a", [1.0, 0.0])], []
+
+    cache = VectorCache(load, max_bytes=1024 * 1024, hot_after=1)
+    cache.search("u", [1.0, 0.0], 5)
+    cache.upsert("u", "b", [0.0, 1.0])
+    release.set()
+    await asyncio.gather(*cache._tasks)
+    assert cache.stats()["users"] == 0
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recent_user_and_expires():
+    async def load(user_id, limit):
+        return [(i, [1.0, float(i)]) for i in range(100)], []
+
+    clock = FakeClock()
+    cache = VectorCache(load, max_bytes=1, hot_after=1, ttl=10, clock=clock)
+    cache.search("u", [1.0, 0.0], 5)
+    await asyncio.gather(*cache._tasks)
+    # Larger than the whole budget
+    assert cache.stats()["too_large"] == 1
+
+    cache.max_bytes = 30000
+    clock.now = 11
+    cache.search("u", [1.0, 0.0], 5)
+    cache.search("v", [1.0, 0.0], 5)
+    await asyncio.gather(*cache._tasks)
+    assert cache.stats()["users"] == 1
+    assert cache.evictions == 1
+    assert cache.search("v", [1.0, 0.0], 5) is not None
+
+    clock.now = 30
+    assert cache.search("v", [1.0, 0.0], 5) is None
+
+def test_disabled_cache_never_loads():
+    async def load(user_id, limit):
+        raise AssertionError("disabled cache loaded")
+
+    cache = VectorCache(load, max_bytes=0, hot_after=1)
+    assert cache.search("u", [1.0], 5) is None
+    assert cache.stats()["misses"] == 0
@@ -0,0 +1,355 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# (memory_id, embedding) and (memory_id, start, end, embedding) rows of one user
+MemoryRows = List[Tuple[Any, Sequence[float]]]
+ChunkRows = List[Tuple[Any, float, float, Sequence[float]]]
+
+class VectorHit(NamedTuple):
+    memory_id: Any
+    distance: float
+    match_start: Optional[float]
+    match_end: Optional[float]
+
+class UserVectors:
+    """One user's memory and chunk embeddings as a contiguous float32 matrix.
+
+    Rows are stored L2 normalized, so cosine distance is one matrix-vector
+    product. Removed rows are zeroed and skipped until the matrix is compacted.
+    """
+
+    def __init__(self, dimensions: Optional[int] = None):
+        self.dimensions = dimensions
+        self.size = 0
+        self.dead = 0
+        self.matrix = np.zeros((0, dimensions or 0), dtype=np.float32)
+        self.owners = np.zeros(0, dtype=np.int64)
+        # (match_start, match_end) per row; NaN for a memory's own embedding
+        self.spans = np.zeros((0, 2), dtype=np.float64)
+        self.ids: List[Any] = []
+        self._index: Dict[Any, int] = {}
+        self._rows: Dict[int, List[int]] = {}
+
+    @classmethod
+    def from_rows(cls, memories: MemoryRows, chunks: ChunkRows) -> "UserVectors":
+        vectors = cls()
+        chunks_by_memory: Dict[Any, list] = {}
+        for memory_id, start, end, embedding in chunks:
+            chunks_by_memory.setdefault(memory_id, []).append((start, end, embedding))
+        embeddings = dict(memories)
+        for memory_id in dict.fromkeys([*embeddings, *chunks_by_memory]):
+            vectors.add(memory_id, embeddings.get(memory_id), chunks_by_memory.get(memory_id, ()))
+        return vectors
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def rows(self) -> int:
+        return self.size - self.dead
+
+    @property
+    def nbytes(self) -> int:
+        # Arrays plus a rough allowance for the id bookkeeping
+        return self.matrix.nbytes + self.owners.nbytes + self.spans.nbytes + 200 * len(self.ids)
+
+    def add(
+        self,
+        memory_id: Any,
+        embedding: Optional[Sequence[float]],
+        chunks: Iterable[Tuple[float, float, Sequence[float]]] = (),
+    ):
+        """Insert or replace the vectors of one memory."""
+        self.remove(memory_id)
+        entries = [] if embedding is None else [(math.nan, math.nan, embedding)]
+        entries.extend(chunks)
+        if not entries:
+            return
+        block = np.asarray([vector for _, _, vector in entries], dtype=np.float32)
+        norms = np.linalg.norm(block, axis=1)
+        # A zero vector has no cosine distance to anything
+        keep = norms > 0
+        if not keep.any():
+            return
+        block = block[keep] / norms[keep, None]
+        spans = np.asarray([(start, end) for start, end, _ in entries], dtype=np.float64)[keep]
+
+        if self.dimensions is None:
+            self.dimensions = block.shape[1]
+            self.matrix = np.zeros((0, self.dimensions), dtype=np.float32)
+        index = self._index.get(memory_id)
+        if index is None:
+            index = len(self.ids)
+            self.ids.append(memory_id)
+            self._index[memory_id] = index
+
+        start, end = self.size, self.size + len(block)
+        self._reserve(end)
+        self.matrix[start:end] = block
+        self.owners[start:end] = index
+        self.spans[start:end] = spans
+        self.size = end
+        self._rows[index] = list(range(start, end))
+
+    def remove(self, memory_id: Any):
+        index = self._index.get(memory_id)
+        rows = self._rows.pop(index, None) if index is not None else None
+        if not rows:
+            return
+        self.matrix[rows] = 0.0
+        self.owners[rows] = -1
+        self.dead += len(rows)
+        if self.dead > 1024 and self.dead * 2 > self.size:
+            self._compact()
+
+    def search(self, query_embedding: Sequence[float], limit: int, oversample: int = 4) -> List[VectorHit]:
+        """The ``limit`` memories closest to the query, by their best row."""
+        if limit <= 0 or not self._rows:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float64)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+        distances = 1.0 - self.matrix[:self.size] @ query.astype(np.float32)
+        owners = self.owners[:self.size]
+
+        # Take the closest rows until they cover ``limit`` distinct memories;
+        # a memory's first row in distance order is its best match
+        take = limit * oversample
+        while True:
+            take = min(take, self.size)
+            if take < self.size:
+                nearest = np.argpartition(distances, take - 1)[:take]
+            else:
+                nearest = np.arange(self.size)
+            nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+            best: Dict[int, int] = {}
+            for row in nearest.tolist():
+                owner = int(owners[row])
+                if owner >= 0 and owner not in best:
+                    best[owner] = row
+                    if len(best) == limit:
+                        break
+            if len(best) == limit or take == self.size:
+                break
+            take *= 4
+
+        hits = []
+        for owner, row in best.items():
+            # Rescore the winners in double precision, as Postgres does
+            distance = float(1.0 - self.matrix[row].astype(np.float64) @ query)
+            start, end = self.spans[row]
+            hits.append(VectorHit(
+                self.ids[owner],
+                distance,
+                None if math.isnan(start) else float(start),
+                None if math.isnan(end) else float(end),
+            ))
+        hits.sort(key=lambda hit: hit.distance)
+        return hits
+
+    def _reserve(self, rows: int):
+        capacity = len(self.owners)
+        if rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2, 64)
+        matrix = np.zeros((capacity, self.dimensions), dtype=np.float32)
+        matrix[:self.size] = self.matrix[:self.size]
+        owners = np.full(capacity, -1, dtype=np.int64)
+        owners[:self.size] = self.owners[:self.size]
+        spans = np.zeros((capacity, 2), dtype=np.float64)
+        spans[:self.size] = self.spans[:self.size]
+        self.matrix, self.owners, self.spans = matrix, owners, spans
+
+    def _compact(self):
+        live = np.flatnonzero(self.owners[:self.size] >= 0)
+        self.matrix = np.ascontiguousarray(self.matrix[live])
+        self.owners = self.owners[live]
+        self.spans = self.spans[live]
+        self.size = len(live)
+        self.dead = 0
+        self._rows = {}
+        for row, owner in enumerate(self.owners.tolist()):
+            self._rows.setdefault(owner, []).append(row)
+
+class VectorCache:
+    """Hot users' embeddings held in process so their searches skip the vector scan.
+
+    A user becomes hot after ``hot_after`` searches within ``ttl`` seconds;
+    their rows are then loaded in the background through
+    ``load(user_id, limit)``, which returns memory and chunk rows. Writes made
+    by this process update cached users in place. Entries expire after
+    ``ttl`` so writes from other workers show up, and the least recently
+    searched users are evicted once ``max_bytes`` is exceeded. A budget of 0
+    disables the cache.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str, int], Awaitable[Tuple[MemoryRows, ChunkRows]]],
+        max_bytes: int = 0,
+        max_rows: int = 20000,
+        hot_after: int = 3,
+        ttl: float = 300.0,
+        max_tracked: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.load = load
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.hot_after = hot_after
+        self.ttl = ttl
+        self.max_tracked = max_tracked
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, UserVectors]]" = OrderedDict()
+        self._searches: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        # user_id -> writes seen while their rows were loading
+        self._loading: Dict[str, int] = {}
+        self._too_large: Dict[str, float] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_failures = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def search(self, user_id: str, query_embedding: Sequence[float], limit: int) -> Optional[List[VectorHit]]:
+        """Nearest memories from the cache, or None when the user is not cached."""
+        if not self.enabled:
+            return None
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] <= self.clock():
+            self._remove(user_id)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            self._note_search(user_id)
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1].search(query_embedding, limit)
+
+    def upsert(
+        self,
+        user_id: str,
+        memory_id: Any,
+        embedding: Optional[Sequence[float]],
+        chunks: Iterable[Tuple[float, float, Sequence[float]]] = (),
+    ):
+        """Apply a stored embedding to a cached user."""
+        self._update(user_id, lambda vectors: vectors.add(memory_id, embedding, chunks))
+
+    def discard(self, user_id: str, memory_id: Any):
+        """Drop a memory whose embedding is no longer current."""
+        self._update(user_id, lambda vectors: vectors.remove(memory_id))
+
+    def invalidate(self, user_id: str):
+        if user_id in self._loading:
+            self._loading[user_id] += 1
+        if user_id in self._entries:
+            self._remove(user_id)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "users": len(self._entries),
+            "rows": sum(vectors.rows for _, vectors in self._entries.values()),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "loading": len(self._loading),
+            "loads": self.loads,
+            "load_failures": self.load_failures,
+            "too_large": len(self._too_large),
+            "evictions": self.evictions,
+        }
+
+    def _update(self, user_id: str, change: Callable[[UserVectors], None]):
+        if user_id in self._loading:
+            # The snapshot being loaded may predate this write
+            self._loading[user_id] += 1
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        vectors = entry[1]
+        before = vectors.nbytes
+        change(vectors)
+        self.bytes += vectors.nbytes - before
+        if vectors.rows > self.max_rows:
+            self._remove(user_id)
+        self._evict()
+
+    def _note_search(self, user_id: str):
+        now = self.clock()
+        if user_id in self._loading or self._too_large.get(user_id, 0.0) > now:
+            return
+        self._too_large.pop(user_id, None)
+        started, count = self._searches.pop(user_id, (now, 0))
+        if started + self.ttl <= now:
+            started, count = now, 0
+        count += 1
+        if count < self.hot_after:
+            self._searches[user_id] = (started, count)
+            while len(self._searches) > self.max_tracked:
+                self._searches.popitem(last=False)
+            return
+        self._loading[user_id] = 0
+        task = asyncio.get_running_loop().create_task(self._load(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load(self, user_id: str):
+        try:
+            memories, chunks = await self.load(user_id, self.max_rows + 1)
+        except Exception as e:
+            self.load_failures += 1
+            self._loading.pop(user_id, None)
+            logger.warning(f"Loading vectors of user {user_id} failed: {e}")
+            return
+        if self._loading.pop(user_id, 0):
+            # Written to meanwhile; the next searches load a fresh snapshot
+            return
+        if len(memories) + len(chunks) > self.max_rows:
+            self._too_large[user_id] = self.clock() + self.ttl
+            return
+        vectors = UserVectors.from_rows(memories, chunks)
+        if vectors.nbytes > self.max_bytes:
+            self._too_large[user_id] = self.clock() + self.ttl
+            return
+        self.loads += 1
+        self._entries[user_id] = (self.clock() + self.ttl, vectors)
+        self.bytes += vectors.nbytes
+        self._evict()
+        logger.info(f"Cached {vectors.rows} vectors of user {user_id} ({vectors.nbytes} bytes)")
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, user_id: str):
+        _, vectors = self._entries.pop(user_id)
+        self.bytes -= vectors.nbytes